@@ -0,0 +1,406 @@
+import json
+import logging
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from disk_cache import file_digest
+from read_csv import JOB_COLUMNS, MAJOR_COLUMNS, RAW_COLUMNS, csv_reader
+
+logger = logging.getLogger(__name__)
+
+# Bump when the store layout changes; older files are rejected on load
+AGGREGATES_VERSION = 2
+# Preference rankings kept as counts: target name -> its three answer columns
+PREFERENCES = {
+    "major": MAJOR_COLUMNS[:3],
+    "dislike_major": MAJOR_COLUMNS[3:],
+    "occupation": JOB_COLUMNS[:3],
+    "dislike_occupation": JOB_COLUMNS[3:],
+}
+# Column the preference rankings are broken down by
+PREFERENCE_GROUPBY = "gender"
+# Boolean columns class match rates are kept for
+CLASS_GROUPBYS = ["stem_participation", "gba_understanding"]
+# Answers and columns of the stress questions, as reported
+STRESS_SOURCES = [
+    "family_expectations", "comparison", "tight_schedule", "test_scores",
+    "relationships", "prospect", "expectation", "long_term_solitude",
+    "covid_19", "unstable_class", "transfer_exam"
+]
+STRESS_LEVELS = ["none", "very_low", "low", "moderate", "high", "very_high"]
+ENDURE_LEVELS = ["totally_cannot", "mostly_cannot", "mostly_can", "totally_can"]
+STRESS_METHODS = [
+    "exercise", "family_communication", "friends_communication", "social_workers",
+    "restructuring_ttb", "video_games", "sleep", "music", "no_idea"
+]
+# Columns without an answer distribution
+UNCOUNTED_COLUMNS = {"id", "school_id"} | set(RAW_COLUMNS) | set(MAJOR_COLUMNS) | set(JOB_COLUMNS)
+# Columns identifying a respondent: the questionnaire number is only unique within a school
+RESPONDENT_KEY = ["school_id", "id"]
+
+
+def _add_counts(counts: dict, other: dict) -> None:
+    # New keys are appended, so a merged table keeps the order answers were first seen in
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+class SchoolAggregates:
+    """
+    The answer counts of a set of respondents (one school, or all of them) that reports are built from:
+    the answer distribution of every column, the preferred and disliked majors/occupations by gender,
+    and the major/occupation classes by STEM participation and GBA understanding.
+    Counts of disjoint sets of respondents merge by addition, so new responses are added without
+    re-reading earlier ones. Offers the aggregate interface of csv_reader that DocumentGenerator uses.
+    """
+
+    def __init__(self, mapping_version: str, sample_size: int = 0, value_counts: Dict[str, dict] = None,
+                 preferences: Dict[str, dict] = None, class_counts: Dict[str, dict] = None):
+        self.mapping_version = mapping_version
+        self.sample_size = sample_size
+        # {column: {answer: count}}
+        self.value_counts = value_counts if value_counts is not None else {}
+        # {target: {"labels": {label: {gender: count}}, "respondents": {gender: count}}}, None for a missing gender
+        self.preferences = preferences if preferences is not None else {}
+        # {groupby: {"major"|"occupation": {group value: {"respondents": count, "classes": {class: count}}}}}
+        self.class_counts = class_counts if class_counts is not None else {}
+        self._percent_tables = {}
+
+    @classmethod
+    def from_reader(cls, reader: csv_reader) -> "SchoolAggregates":
+        """Count the answers of every respondent of the reader."""
+        return aggregate_by(reader, None).get(0, cls(reader.mappings.version))
+
+    def add(self, other: "SchoolAggregates") -> None:
+        """Add the counts of other (disjoint) respondents."""
+        if other.mapping_version != self.mapping_version:
+            raise ValueError(f"Cannot merge aggregates of mapping version {other.mapping_version} into {self.mapping_version}")
+
+        self._percent_tables = {}
+        self.sample_size += other.sample_size
+        for col, counts in other.value_counts.items():
+            _add_counts(self.value_counts.setdefault(col, {}), counts)
+        for target, preference in other.preferences.items():
+            merged = self.preferences.setdefault(target, {"labels": {}, "respondents": {}})
+            for label, groups in preference["labels"].items():
+                _add_counts(merged["labels"].setdefault(label, {}), groups)
+            _add_counts(merged["respondents"], preference["respondents"])
+        for groupby, kinds in other.class_counts.items():
+            for kind, groups in kinds.items():
+                merged_groups = self.class_counts.setdefault(groupby, {}).setdefault(kind, {})
+                for group, counts in groups.items():
+                    merged = merged_groups.setdefault(group, {"respondents": 0, "classes": {}})
+                    merged["respondents"] += counts["respondents"]
+                    _add_counts(merged["classes"], counts["classes"])
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.value_counts)
+
+    def count(self, col: str, value) -> int:
+        """Number of respondents answering value to col."""
+        return self.value_counts[col].get(value, 0)
+
+    def get_distribution(self, combined_df, target: str, group_by_col: str = None) -> pd.DataFrame:
+        """Share of every answer of target among all respondents, same as csv_reader.get_distribution(None, target)."""
+        if combined_df is not None or group_by_col is not None:
+            raise ValueError("Aggregates only hold single-column distributions")
+        counts = self.value_counts[target]
+        dis_df = pd.Series(list(counts.values()), index=pd.Index(list(counts.keys()), dtype=object, name=target),
+                           dtype=np.int64, name="count").sort_values(ascending=False).reset_index()
+        dis_df['percentage'] = (dis_df['count'] / self.sample_size) * 100
+        return dis_df.drop(columns='count')
+
+    def get_percent(self, target_col: str, target_values: list, drop_zero=True) -> dict:
+        '''
+        return a dict {target_value0: protion0}, same as csv_reader.get_percent
+        '''
+        table = self.percent_table(target_col, drop_zero)
+        return {target_value: table.get(target_value, 0.0) for target_value in target_values}
+
+    def percent_table(self, target_col: str, drop_zero=True) -> dict:
+        """
+        Share (in %) of every answer of target_col among the valid answers, same as csv_reader.percent_table.
+        Computed once per column, with the formula of csv_reader on the counts rather than through a frame.
+        """
+        if (target_col, drop_zero) not in self._percent_tables:
+            counts = sorted(self.value_counts[target_col].items(), key=lambda item: item[1], reverse=True)
+            counts = [(answer, count) for answer, count in counts if not (drop_zero and answer == 0) and answer != "nan"]
+            percentage = np.array([count for _, count in counts], dtype=np.float64) / self.sample_size * 100
+            percentage = np.round(percentage / percentage.sum() * 100, 1)
+            self._percent_tables[(target_col, drop_zero)] = dict(zip([answer for answer, _ in counts], percentage.tolist()))
+        return self._percent_tables[(target_col, drop_zero)]
+
+    def check_class_match(self, target_class: str, groupby: str, major=True) -> tuple:
+        """Same as csv_reader.check_class_match, for the groupby columns of CLASS_GROUPBYS."""
+        groups = self.class_counts[groupby]["major" if major else "occupation"]
+
+        def rate(group) -> float:
+            counts = groups.get(group)
+            if not counts or not counts["respondents"]:
+                return 0.0
+            return float(np.round(counts["classes"].get(target_class, 0) / counts["respondents"] * 100, 1))
+
+        return rate(True), rate(False)
+
+    def topk_groupby(self, target_cols: List[str], target: str, group_by_col: str, k: int) -> Dict[str, List[str]]:
+        """Same as csv_reader.topk_groupby, for the targets of PREFERENCES broken down by PREFERENCE_GROUPBY."""
+        if target not in self.preferences or group_by_col != PREFERENCE_GROUPBY:
+            raise KeyError(f"No aggregated {target} preferences by {group_by_col}")
+        labels = self.preferences[target]["labels"]
+        respondents = self.preferences[target]["respondents"]
+
+        # The crosstab and ranking csv_reader computes from the melted answers, rebuilt from the counts
+        groups = sorted({group for counts in labels.values() for group in counts if group is not None})
+        with_group = sorted(label for label, counts in labels.items() if any(group is not None for group in counts))
+        crosstab = pd.DataFrame([[labels[label].get(group, 0) for group in groups] for label in with_group],
+                                index=pd.Index(with_group, dtype=object, name=target),
+                                columns=pd.Index(groups, dtype=object, name=group_by_col), dtype=np.int64)
+        groups_count = pd.Series({group: count for group, count in respondents.items() if group is not None}, dtype=np.int64)
+        dis_df = (crosstab.div(groups_count, axis=1) * 100).round(2)
+
+        totals = pd.Series([sum(counts.values()) for counts in labels.values()],
+                           index=pd.Index(list(labels), dtype=object), dtype=np.int64).sort_values(ascending=False)
+        ret = {"all": totals.index[:k].tolist()}
+        for group in dis_df.columns:
+            ret[group] = dis_df[group].sort_values(ascending=False).index[:k].tolist()
+        return ret
+
+    def to_json(self) -> dict:
+        # JSON keys must be strings, so tables are stored as [key, count] pairs
+        return {
+            "mapping_version": self.mapping_version,
+            "sample_size": self.sample_size,
+            "value_counts": {col: list(counts.items()) for col, counts in self.value_counts.items()},
+            "preferences": {
+                target: {
+                    "labels": [[label, list(groups.items())] for label, groups in preference["labels"].items()],
+                    "respondents": list(preference["respondents"].items()),
+                }
+                for target, preference in self.preferences.items()
+            },
+            "class_counts": {
+                groupby: {
+                    kind: [[group, counts["respondents"], list(counts["classes"].items())] for group, counts in groups.items()]
+                    for kind, groups in kinds.items()
+                }
+                for groupby, kinds in self.class_counts.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, payload: dict) -> "SchoolAggregates":
+        return cls(
+            payload["mapping_version"],
+            payload["sample_size"],
+            {col: dict(counts) for col, counts in payload["value_counts"].items()},
+            {
+                target: {
+                    "labels": {label: dict(groups) for label, groups in preference["labels"]},
+                    "respondents": dict(preference["respondents"]),
+                }
+                for target, preference in payload["preferences"].items()
+            },
+            {
+                groupby: {
+                    kind: {group: {"respondents": respondents, "classes": dict(classes)} for group, respondents, classes in groups}
+                    for kind, groups in kinds.items()
+                }
+                for groupby, kinds in payload["class_counts"].items()
+            },
+        )
+
+
+def _group_sizes(keys: pd.Series, *columns: pd.Series, dropna: bool = True) -> Dict[tuple, int]:
+    """Rows of every (key, *column values) combination in order of first appearance, with NaN values as None."""
+    frame = pd.DataFrame({i: column.reset_index(drop=True) for i, column in enumerate((keys, *columns))})
+    sizes = frame.groupby(list(frame.columns), sort=False, observed=True, dropna=dropna).size()
+    if sizes.index.nlevels == 1:
+        return {(key,): count for key, count in zip(sizes.index.tolist(), sizes.tolist())}
+    return {tuple(None if pd.isna(value) else value for value in index): count
+            for index, count in zip(sizes.index.tolist(), sizes.tolist())}
+
+
+def aggregate_by(reader: csv_reader, by: str) -> Dict[object, SchoolAggregates]:
+    """
+    The aggregates of the reader's respondents for every value of the `by` column, e.g. "school_id"
+    (all respondents under the key 0 when `by` is None).
+    Every table is counted in one grouped pass over all rows, so a batch costs the same whether it
+    holds one school or hundreds.
+    """
+    df = reader.df
+    keys = df[by] if by is not None else pd.Series(0, index=df.index)
+    groups: Dict[object, SchoolAggregates] = {}
+    for (key,), count in _group_sizes(keys).items():
+        groups[key] = SchoolAggregates(reader.mappings.version, count)
+
+    for col in df.columns:
+        if col in UNCOUNTED_COLUMNS:
+            continue
+        # In order of first appearance, like csv_reader's value_counts before they are sorted
+        for (key, answer), count in _group_sizes(keys, df[col]).items():
+            groups[key].value_counts.setdefault(col, {})[answer] = count
+
+    gender = df[PREFERENCE_GROUPBY]
+    for target, target_cols in PREFERENCES.items():
+        # The answers melted like combine_target does: the first column of every respondent, then the second...
+        labels = pd.concat([df[col].astype(object) for col in target_cols], ignore_index=True)
+        answered = labels.notna()
+        melted_keys, melted_gender = (pd.concat([column] * len(target_cols), ignore_index=True)[answered]
+                                      for column in (keys, gender.astype(object)))
+        for (key, label, group), count in _group_sizes(melted_keys, labels[answered], melted_gender, dropna=False).items():
+            if key in groups:
+                preference = groups[key].preferences.setdefault(target, {"labels": {}, "respondents": {}})
+                preference["labels"].setdefault(label, {})[group] = count
+        has_answer = df[target_cols].notna().any(axis=1)
+        for (key, group), count in _group_sizes(keys[has_answer], gender[has_answer], dropna=False).items():
+            if key in groups:
+                groups[key].preferences[target]["respondents"][group] = count
+
+    for groupby in CLASS_GROUPBYS:
+        for major in (True, False):
+            membership = reader.class_membership(major)
+            grouped = membership.groupby([keys, df[groupby]], sort=False)
+            sizes, sums = grouped.size(), grouped.sum()
+            for (key, value), respondents, classes in zip(sizes.index.tolist(), sizes.tolist(), sums.itertuples(index=False)):
+                groups[key].class_counts.setdefault(groupby, {}).setdefault("major" if major else "occupation", {})[value] = {
+                    "respondents": respondents,
+                    "classes": {target_class: int(count) for target_class, count in zip(membership.columns, classes) if count},
+                }
+
+    return groups
+
+
+class AggregateStore:
+    """
+    Per-school and all-school aggregates of every response batch added so far, saved as one JSON file.
+    Adding a batch only counts the batch's rows. Batches already added (same file content) are skipped,
+    and so are respondents (school_id, id) already counted, so cumulative or overlapping exports can be
+    added; rows without a school_id or id cannot be matched and are always counted.
+    """
+
+    def __init__(self, mapping_version: str, total: SchoolAggregates = None, schools: Dict[int, SchoolAggregates] = None,
+                 batches: List[str] = None, respondents: np.ndarray = None):
+        self.mapping_version = mapping_version
+        self.total = total if total is not None else SchoolAggregates(mapping_version)
+        self.schools = schools if schools is not None else {}
+        # Content digests of the batches added
+        self.batches = batches if batches is not None else []
+        # (school_id, id) of the respondents counted
+        self.respondents = respondents if respondents is not None else np.empty((0, 2), dtype=np.int64)
+
+    def _new_respondents(self, reader: csv_reader):
+        """Mask of the reader's rows not counted yet, and the (school_id, id) keys of those rows."""
+        if any(col not in reader.df.columns for col in RESPONDENT_KEY):
+            logger.warning("Batch has no respondent ids; it is counted in full and must not overlap earlier batches")
+            return np.ones(reader.sample_size, dtype=bool), np.empty((0, 2), dtype=np.int64)
+
+        keys = reader.df[RESPONDENT_KEY].apply(pd.to_numeric, errors="coerce")
+        identified = keys.notna().all(axis=1).to_numpy()
+        keys = keys[identified].to_numpy(dtype=np.int64)
+        batch_index = pd.MultiIndex.from_arrays([keys[:, 0], keys[:, 1]])
+        counted = batch_index.isin(pd.MultiIndex.from_arrays([self.respondents[:, 0], self.respondents[:, 1]]))
+
+        new = np.ones(reader.sample_size, dtype=bool)
+        new[np.flatnonzero(identified)[counted]] = False
+        if counted.any():
+            logger.warning(f"Skipped {int(counted.sum())} respondents already counted in earlier batches")
+        if not identified.all():
+            logger.warning(f"{int((~identified).sum())} respondents without a school_id or id cannot be deduplicated")
+        return new, keys[~counted]
+
+    def add(self, reader: csv_reader, digest: str = None) -> bool:
+        """Add the responses of a reader not counted yet; returns False if the batch with this digest was already added."""
+        if digest is not None and digest in self.batches:
+            return False
+        if reader.mappings.version != self.mapping_version:
+            raise ValueError(f"Batch decoded with mapping version {reader.mappings.version}, "
+                             f"the store holds version {self.mapping_version}; rebuild the store to change mappings")
+
+        new, keys = self._new_respondents(reader)
+        if not new.all():
+            reader = reader.select_rows(new)
+        self.total.add(SchoolAggregates.from_reader(reader))
+        for school_id, aggregates in aggregate_by(reader, "school_id").items():
+            self.schools.setdefault(int(school_id), SchoolAggregates(self.mapping_version)).add(aggregates)
+        self.respondents = np.concatenate([self.respondents, keys])
+        if digest is not None:
+            self.batches.append(digest)
+        return True
+
+    def add_workbook(self, path: str, **reader_kwargs) -> bool:
+        """Add the converted responses of a workbook, unless this workbook was already added."""
+        digest = file_digest(path)
+        if digest in self.batches:
+            return False
+        return self.add(csv_reader(path, **reader_kwargs), digest)
+
+    def school(self, school_id: int) -> SchoolAggregates:
+        if school_id not in self.schools:
+            raise KeyError(f"No aggregated responses of school {school_id}")
+        return self.schools[school_id]
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        payload = {
+            "version": AGGREGATES_VERSION,
+            "mapping_version": self.mapping_version,
+            "batches": self.batches,
+            "respondents": self.respondents.tolist(),
+            "total": self.total.to_json(),
+            "schools": [[school_id, aggregates.to_json()] for school_id, aggregates in self.schools.items()],
+        }
+        # Written next to the store and moved over it, so an interrupted save keeps the previous counts
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "AggregateStore":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+
+        if payload.get("version") != AGGREGATES_VERSION:
+            raise ValueError(f"Unsupported aggregate store version {payload.get('version')} in {path}")
+
+        schools = {school_id: SchoolAggregates.from_json(aggregates) for school_id, aggregates in payload["schools"]}
+        respondents = np.array(payload["respondents"], dtype=np.int64).reshape(-1, 2)
+        return cls(payload["mapping_version"], SchoolAggregates.from_json(payload["total"]), schools, payload["batches"], respondents)
+
+
+def main():
+    """Add converted response workbooks to an aggregate store, counting only the new batches."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("store_path", help="aggregate store to update, e.g. aggregates/2024.json")
+    parser.add_argument("data_paths", nargs="+", help="converted response workbooks, e.g. data/week_12.xlsx")
+    parser.add_argument("--rebuild", action="store_true", help="start a new store instead of updating the existing one")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.store_path) and not args.rebuild:
+        store = AggregateStore.load(args.store_path)
+    else:
+        from mapping import snapshot
+        store = AggregateStore(snapshot().version)
+
+    for path in args.data_paths:
+        before = store.total.sample_size
+        if store.add_workbook(path):
+            print(f"Added {store.total.sample_size - before} responses of {path}")
+        else:
+            print(f"Skipped {path}: already added")
+    store.save(args.store_path)
+    print(f"{store.total.sample_size} responses of {len(store.schools)} schools in {args.store_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from doc import Config, DocumentGenerator
-import pandas as pd
+from document_generator import Config
+from batch_gen import generate_all
 
 id_2_school = {
     10: "Tsuen Wan Government Secondary School",
@@ -65,26 +65,12 @@ id_2_school = {
 }
 
 path = "data/school_all.xlsx"
-df = pd.read_excel(path, header=2)
-interviewed_school_ids = set(df['school_id'].unique())
-
-start = 12
-
-for key, value in id_2_school.items():
-    if key not in interviewed_school_ids:
-        continue
-    if key != start:
-        continue
-
 
+if __name__ == "__main__":
     config = Config(
-        school_id=12, 
-        school_name="All School", 
-        general_data_path=path, 
-        output_path=f"output/report_test.docx",
+        general_data_path=path,
         model_name=None,
         use_gemini=True,
         use_llm=False
     )
-    generator = DocumentGenerator(config)
-    generator.generate_report()
\ No newline at end of file
+    generate_all(config, id_2_school, output_dir="output", max_workers=4)
@@ -0,0 +1,122 @@
+import json
+import os
+from typing import Dict, List
+
+from disk_cache import file_digest
+
+# Bump when the snapshot layout changes; older files are rejected on load
+SNAPSHOT_VERSION = 2
+
+
+class BaselineSnapshot:
+    """
+    All-school aggregates ("Average" side of every comparison) computed once per survey year.
+    Offers the same get_percent interface as csv_reader, so DocumentGenerator can use it as its general reader.
+    The tables hold decoded labels, so a snapshot is tied to the mapping version and columns it was built with.
+    """
+
+    def __init__(self, percent_tables: Dict[str, Dict[bool, dict]], sample_size: int, year: int = None, source_digest: str = None,
+                 mapping_version: str = None, columns: List[str] = None):
+        self.percent_tables = percent_tables
+        self.sample_size = sample_size
+        self.year = year
+        self.source_digest = source_digest
+        self.mapping_version = mapping_version
+        self.columns = list(columns) if columns is not None else list(percent_tables)
+
+    @classmethod
+    def from_reader(cls, reader, columns: List[str], year: int = None, source_path: str = None) -> "BaselineSnapshot":
+        """Compute the percent tables of every column with and without zero answers."""
+        percent_tables = {}
+        for col in columns:
+            if col not in reader.df.columns:
+                continue
+            percent_tables[col] = {
+                drop_zero: reader.percent_table(col, drop_zero) for drop_zero in (True, False)
+            }
+
+        source_digest = file_digest(source_path) if source_path and os.path.exists(source_path) else None
+        return cls(percent_tables, reader.sample_size, year, source_digest, reader.mappings.version, columns)
+
+    def get_percent(self, target_col: str, target_values: list, drop_zero=True) -> dict:
+        '''
+        return a dict {target_value0: protion0}, same as csv_reader.get_percent
+        '''
+        if target_col not in self.percent_tables:
+            raise KeyError(target_col)
+        table = self.percent_tables[target_col][drop_zero]
+        return {target_value: table.get(target_value, 0.0) for target_value in target_values}
+
+    def is_current(self, source_path: str, mapping_version: str, year: int, columns: List[str]) -> bool:
+        """
+        True when the snapshot was built from this source workbook, with these mappings, year and columns.
+        A snapshot whose source is unknown or missing cannot be checked and is not current.
+        """
+        if (self.mapping_version, self.year, self.columns) != (mapping_version, year, list(columns)):
+            return False
+        if self.source_digest is None or not source_path or not os.path.exists(source_path):
+            return False
+        return file_digest(source_path) == self.source_digest
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        payload = {
+            "version": SNAPSHOT_VERSION,
+            "year": self.year,
+            "sample_size": self.sample_size,
+            "source_digest": self.source_digest,
+            "mapping_version": self.mapping_version,
+            "columns": self.columns,
+            # JSON keys must be strings, so tables are stored as [answer, percent] pairs
+            "percent_tables": {
+                col: {
+                    "drop_zero": list(tables[True].items()),
+                    "keep_zero": list(tables[False].items()),
+                }
+                for col, tables in self.percent_tables.items()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> "BaselineSnapshot":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+
+        if payload.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported baseline snapshot version {payload.get('version')} in {path}")
+
+        percent_tables = {
+            col: {
+                True: {answer: percent for answer, percent in tables["drop_zero"]},
+                False: {answer: percent for answer, percent in tables["keep_zero"]},
+            }
+            for col, tables in payload["percent_tables"].items()
+        }
+        return cls(percent_tables, payload["sample_size"], payload.get("year"), payload.get("source_digest"),
+                   payload["mapping_version"], payload["columns"])
+
+
+def main():
+    """Build the baseline snapshot of an all-school workbook."""
+    import argparse
+    from document_generator import BASELINE_COLUMNS
+    from read_csv import csv_reader
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("data_path", help="all-school workbook, e.g. data/school_all.xlsx")
+    parser.add_argument("output_path", help="where to write the snapshot, e.g. baseline/2024.json")
+    parser.add_argument("--year", type=int, default=None)
+    args = parser.parse_args()
+
+    snapshot = BaselineSnapshot.from_reader(csv_reader(args.data_path), BASELINE_COLUMNS, args.year, args.data_path)
+    snapshot.save(args.output_path)
+    print(f"Saved baseline of {snapshot.sample_size} responses to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
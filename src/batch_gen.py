@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Dict
+import logging
+import os
+import re
+import sys
+
+from baseline import BaselineSnapshot
+from document_generator import BASELINE_COLUMNS, Config, DocumentGenerator
+from mapping import MappingSnapshot
+from read_csv import csv_reader
+import plotter
+
+logger = logging.getLogger(__name__)
+
+# All-school baseline, installed once per worker by _init_worker
+_general_reader = None
+# Characters not allowed in file names on Windows or POSIX, and control characters
+UNSAFE_FILE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def report_file_name(school_id: int, school_name: str) -> str:
+    """File name of a school's report; the school name is kept only as far as it is safe in a path."""
+    name = UNSAFE_FILE_CHARS.sub("_", str(school_name)).strip(" .")
+    return f"report_{school_id}_{name}.docx" if name else f"report_{school_id}.docx"
+
+
+def _init_worker(general_reader: BaselineSnapshot, chart_backend: str = "plotly") -> None:
+    global _general_reader
+    _general_reader = general_reader
+    # Keep one Chromium warm for every report rendered by this worker process
+    if chart_backend == "plotly":
+        plotter.start_render_session()
+
+
+def _generate_one(config: Config, school_reader: csv_reader) -> str:
+    """Generate a single school's report inside a worker."""
+    if config.image_dir is not None:
+        os.makedirs(config.image_dir, exist_ok=True)
+    output_dir = os.path.dirname(config.output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # The school's reader carries the mapping snapshot it was decoded with
+    generator = DocumentGenerator(config, school_reader=school_reader, general_reader=_general_reader,
+                                  mappings=school_reader.mappings)
+    generator.generate_report()
+    return config.output_path
+
+
+def generate_all(
+        base_config: Config,
+        school_names: Dict[int, str],
+        output_dir: str = "output",
+        max_workers: int = None,
+        use_processes: bool = True,
+        max_tasks_per_child: int = None,
+        mappings: MappingSnapshot = None) -> Dict[int, str]:
+    """
+    Generate a report for every school in `base_config.general_data_path`.
+
+    The all-school dataset is parsed and normalized once, then split by school_id.
+    Each task only carries its own school's rows; the all-school side of every
+    comparison is reduced to a BaselineSnapshot (saved to `base_config.baseline_path`
+    when set) and sent to every worker once through the pool initializer. `max_tasks_per_child` recycles
+    worker processes after that many reports to keep their memory bounded
+    (process pools only, Python 3.11+). `mappings` are the questionnaire mappings of every report,
+    the current session's by default.
+
+    Returns a dict {school_id: output_path} for the reports that were generated.
+    """
+    general_reader = csv_reader(base_config.general_data_path, use_cache=base_config.use_data_cache,
+                                backend=base_config.ingest_backend, mappings=mappings)
+    school_readers = general_reader.split_by_school()
+    logger.info(f"Loaded {general_reader.sample_size} responses from {len(school_readers)} schools")
+
+    baseline = BaselineSnapshot.from_reader(general_reader, BASELINE_COLUMNS, base_config.year, base_config.general_data_path)
+    if base_config.baseline_path is not None:
+        baseline.save(base_config.baseline_path)
+    del general_reader
+
+    if use_processes:
+        pool_kwargs = {}
+        if max_tasks_per_child is not None:
+            if sys.version_info < (3, 11):
+                raise ValueError("max_tasks_per_child requires Python 3.11 or higher")
+            pool_kwargs["max_tasks_per_child"] = max_tasks_per_child
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                       initargs=(baseline, base_config.chart_backend), **pool_kwargs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                      initargs=(baseline, base_config.chart_backend))
+
+    results = {}
+    with executor:
+        futures = {}
+        for school_id, school_reader in school_readers.items():
+            if school_id not in school_names:
+                logger.warning(f"Skipping school {school_id}: no school name given")
+                continue
+
+            school_name = school_names[school_id]
+            # Charts are embedded from memory; when an image directory is kept, every school
+            # gets its own so parallel reports do not overwrite each other's charts
+            image_dir = None if base_config.image_dir is None else os.path.join(base_config.image_dir, str(school_id))
+            config = replace(
+                base_config,
+                school_id=school_id,
+                school_name=school_name,
+                output_path=os.path.join(output_dir, report_file_name(school_id, school_name)),
+                image_dir=image_dir,
+            )
+            futures[executor.submit(_generate_one, config, school_reader)] = school_id
+
+        for future in as_completed(futures):
+            school_id = futures[future]
+            try:
+                results[school_id] = future.result()
+            except Exception as e:
+                logger.error(f"Report generation failed for school {school_id}: {e}")
+
+    logger.info(f"Generated {len(results)} of {len(futures)} reports")
+    return results
@@ -0,0 +1,225 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from data_converter import DataConverter
+from document_generator import Config, DocumentGenerator
+from ingest import read_workbook
+from read_csv import csv_reader
+import plotter
+import synthetic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS_PATH = "benchmarks/results.jsonl"
+# A metric regressed when it is this much slower than in the previous run...
+REGRESSION_THRESHOLD = 0.2
+# ...and slower by at least this many seconds, so timer noise on tiny stages is not reported
+REGRESSION_MIN_SECONDS = 0.05
+# Settings a run is only compared with earlier runs of
+RUN_PARAMETERS = ("size", "chart_backend", "llm_latency", "repeat", "machine")
+
+
+class OfflineLLM:
+    """Stands in for conclusion_gen.llm: a canned answer after an optional simulated latency."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _answer(self, prompt):
+        return f"[offline conclusion for a {len(prompt)} character prompt]"
+
+    def generate(self, prompt, output=False):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def agenerate(self, prompt, output=False, timeout=None):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+
+def _best(repeat: int, fn: Callable) -> tuple:
+    """Best wall time of `repeat` runs of fn, and the result of the last run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def _report_metrics(data: pd.DataFrame, school_id: int, chart_backend: str, llm_latency: float,
+                    output_dir: str) -> Dict[str, float]:
+    """Generate one school's report and time it, with every stage taken from the report's trace."""
+    os.makedirs(output_dir, exist_ok=True)
+    config = Config(
+        template_path="doc/template.docx",
+        output_path=os.path.join(output_dir, f"benchmark_report_{school_id}.docx"),
+        general_data_path=None,
+        school_id=school_id,
+        school_name=f"School {school_id}",
+        use_gemini=False,
+        llm_cache_path=None,
+        chart_backend=chart_backend,
+        # One section at a time, so every section's time is its own and not shared with concurrent ones
+        section_workers=1,
+    )
+    start = time.perf_counter()
+    generator = DocumentGenerator(config, data=data)
+    generator.llm = OfflineLLM(llm_latency)
+    generator.generate_report()
+    metrics = {"report.total": time.perf_counter() - start}
+
+    for span in generator.tracer.spans:
+        if span.category == "section":
+            metrics[f"report.section.{span.name}"] = span.duration
+        elif span.category == "chart":
+            metrics["report.charts"] = metrics.get("report.charts", 0.0) + span.duration
+        elif span.name == "render_document":
+            metrics["report.render_document"] = span.duration
+        elif span.name == "load data":
+            metrics["report.load_data"] = span.duration
+    return metrics
+
+
+def run(size: int, repeat: int = 3, chart_backend: str = "matplotlib", llm_latency: float = 0.0,
+        data_dir: str = ".cache/synthetic", seed: int = 0) -> Dict[str, float]:
+    """Time every stage of the pipeline on a synthetic dataset of `size` respondents; returns {metric: best seconds}."""
+    raw_path, converted_path = synthetic.write_dataset(size, data_dir, seed)
+    metrics = {}
+
+    metrics["ingest.read_raw_workbook"], _ = _best(repeat, lambda: read_workbook(raw_path))
+    metrics["convert.load"], converter = _best(repeat, lambda: DataConverter(raw_path))
+    # convert_all codes the frame in place, so every run starts from a fresh copy
+    raw_df = converter.df
+    timings = []
+    for _ in range(repeat):
+        converter.df = raw_df.copy()
+        start = time.perf_counter()
+        converter.convert_all()
+        timings.append(time.perf_counter() - start)
+    metrics["convert.convert_all"] = min(timings)
+    converter.convert_columns_name()
+    converted = converter.df
+
+    metrics["csv_reader.workbook"], _ = _best(repeat, lambda: csv_reader(converted_path, use_cache=False))
+    metrics["csv_reader.dataframe"], _ = _best(repeat, lambda: csv_reader(converted))
+
+    # Every chart is really exported, not served from the chart cache
+    chart_cache, plotter.chart_cache = plotter.chart_cache, None
+    try:
+        school_id = int(converted["school_id"].iloc[0])
+        runs = [_report_metrics(converted, school_id, chart_backend, llm_latency, os.path.join(data_dir, "reports"))
+                for _ in range(repeat)]
+    finally:
+        plotter.chart_cache = chart_cache
+    for name in runs[0]:
+        metrics[name] = min(run_metrics.get(name, float("inf")) for run_metrics in runs)
+    return metrics
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path: str = DEFAULT_RESULTS_PATH) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_result(result: dict, path: str = DEFAULT_RESULTS_PATH) -> None:
+    """Append one benchmark run to the results file (JSON lines)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def previous_result(results: List[dict], result: dict) -> dict:
+    """The latest earlier run with the same settings (RUN_PARAMETERS) on the same machine, or None."""
+    for previous in reversed(results):
+        if all(previous.get(key) == result.get(key) for key in RUN_PARAMETERS):
+            return previous
+    return None
+
+
+def regressions(result: dict, previous: dict) -> List[str]:
+    """Metrics of `result` notably slower than in `previous`."""
+    if previous is None:
+        return []
+    slower = []
+    for name, seconds in result["metrics"].items():
+        before = previous["metrics"].get(name)
+        if before is not None and seconds - before > REGRESSION_MIN_SECONDS and seconds > before * (1 + REGRESSION_THRESHOLD):
+            slower.append(name)
+    return slower
+
+
+def print_result(result: dict, previous: dict) -> None:
+    print(f"\n{result['size']} respondents ({result['chart_backend']} charts, commit {result['commit']})")
+    print(f"{'metric':<48} {'best (s)':>9} {'previous':>9} {'change':>8}")
+    slower = set(regressions(result, previous))
+    for name, seconds in result["metrics"].items():
+        before = previous["metrics"].get(name) if previous is not None else None
+        change = f"{(seconds - before) / before:+.0%}" if before else ""
+        before_text = f"{before:.3f}" if before is not None else "-"
+        flag = "  REGRESSION" if name in slower else ""
+        print(f"{name:<48} {seconds:>9.3f} {before_text:>9} {change:>8}{flag}")
+
+
+def main():
+    """Benchmark conversion, ingestion and report generation on synthetic survey data."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000], help="numbers of respondents")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the best is reported")
+    parser.add_argument("--chart-backend", default="matplotlib", choices=sorted(plotter.BACKENDS))
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="JSON lines file the runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="compare with earlier runs without recording this one")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 when a metric regressed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = load_results(args.results)
+    regressed = False
+    for size in args.sizes:
+        result = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "machine": f"{platform.node()} {platform.machine()} python {platform.python_version()}",
+            "size": size,
+            "chart_backend": args.chart_backend,
+            "llm_latency": args.llm_latency,
+            "repeat": args.repeat,
+            "metrics": run(size, args.repeat, args.chart_backend, args.llm_latency),
+        }
+        previous = previous_result(results, result)
+        print_result(result, previous)
+        regressed = regressed or bool(regressions(result, previous))
+        if not args.no_save:
+            save_result(result, args.results)
+            results.append(result)
+
+    if regressed and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,171 @@
+import asyncio
 import os
 import time
-from openai import OpenAI
+import weakref
+from typing import Callable
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 from google import genai
 import streamlit as st
+from llm_cache import LLMCache
+import tracing
+
+PLACEHOLDER = "[LLM OUTPUT PLACEHOLDER]"
+INSTRUCTION_SUFFIX = "ONLY finish the above task WITHOUT any explanation, additional text or markdown."
 
 class llm:
-    def __init__(self, gemini=False, model_name=None, stop_all=False, max_retries=2, backoff=15):
+    def __init__(self, gemini=False, model_name=None, stop_all=False, max_retries=2, backoff=15, timeout=120,
+                 cache: LLMCache = None, bypass_cache=False, on_failure: Callable[[str], None] = None):
         load_dotenv()
 
         if gemini:
             self.client = genai.Client()
         else:
-            self.client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=os.getenv("OPENROUTER_KEY") if os.getenv("OPENROUTER_KEY") else "None",
-            )
+            api_key = os.getenv("OPENROUTER_KEY") if os.getenv("OPENROUTER_KEY") else "None"
+            self.client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
+            self.api_key = api_key
+        # Async clients by event loop: their connection pools are bound to the loop they were first used on,
+        # and every report runs its LLM calls on a new loop
+        self._async_clients = weakref.WeakKeyDictionary()
 
         self.gemini = gemini
         self.model_name = model_name
         self.stop_all = stop_all
         self.max_retries = max_retries      # total attempts (first + retries)
         self.backoff = backoff              # seconds to wait before each retry
+        self.timeout = timeout              # seconds allowed for a single async call
+        self.cache = cache
+        self.bypass_cache = bypass_cache    # ignore cached responses, but still store fresh ones
+        self.on_failure = on_failure        # receives failure messages instead of st.error, e.g. off the script thread
+
+    def _model(self):
+        if self.model_name is not None:
+            return self.model_name
+        return "gemini-2.5-flash" if self.gemini else "mistralai/mistral-small-3.2-24b-instruct:free"
+
+    def _messages(self, prompt):
+        return [{
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt + INSTRUCTION_SUFFIX
+                }
+            ]
+        }]
+
+    def _cache_key(self, prompt):
+        return LLMCache.make_key("gemini" if self.gemini else "openrouter", self._model(), prompt)
+
+    def _cached(self, prompt):
+        if self.cache is None or self.bypass_cache:
+            return None
+        return self.cache.get(self._cache_key(prompt))
+
+    def _store(self, prompt, response):
+        if self.cache is not None and response:
+            self.cache.put(self._cache_key(prompt), response)
+        return response
+
+    def _trace_attempt(self, prompt, attempt):
+        return tracing.span("llm attempt", "llm", model=self._model(), attempt=attempt + 1, prompt_chars=len(prompt))
+
+    def _trace_cache_hit(self, prompt, response):
+        with tracing.span("llm cache hit", "llm", model=self._model(), prompt_chars=len(prompt), response_chars=len(response)):
+            return response
+
+    def _report_failure(self, e):
+        message = f"{'Gemini' if self.gemini else 'Openrouter'} call failed: {e}"
+        if self.on_failure is not None:
+            self.on_failure(message)
+        else:
+            st.error(message)
+        return PLACEHOLDER
 
     def generate(self, prompt, output=False):
         # Return placeholder immediately if we're short‑circuiting
         if self.stop_all and output is False:
-            return "[LLM OUTPUT PLACEHOLDER]"
+            return PLACEHOLDER
+
+        cached = self._cached(prompt)
+        if cached is not None:
+            return self._trace_cache_hit(prompt, cached)
 
         attempt = 0
         while attempt < self.max_retries:
             try:
-                if self.gemini:
-                    resp = self.client.models.generate_content(
-                        model="gemini-2.5-flash" if self.model_name is None else self.model_name,
-                        contents=prompt + "ONLY finish the above task WITHOUT any explanation, additional text or markdown."
-                    )
-                    return resp.text
-                else:
-                    resp = self.client.chat.completions.create(
-                        model="mistralai/mistral-small-3.2-24b-instruct:free" if self.model_name is None else self.model_name,
-                        messages=[{
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": prompt + "ONLY finish the above task WITHOUT any explanation, additional text or markdown."
-                                }
-                            ]
-                        }],
-                    )
-                    return resp.choices[0].message.content
+                with self._trace_attempt(prompt, attempt) as trace:
+                    if self.gemini:
+                        resp = self.client.models.generate_content(
+                            model=self._model(),
+                            contents=prompt + INSTRUCTION_SUFFIX
+                        )
+                        response = resp.text
+                    else:
+                        resp = self.client.chat.completions.create(
+                            model=self._model(),
+                            messages=self._messages(prompt),
+                        )
+                        response = resp.choices[0].message.content
+                    trace["response_chars"] = len(response or "")
+                return self._store(prompt, response)
 
             except Exception as e:
                 attempt += 1
                 if attempt >= self.max_retries:
                     # Give up after last retry
-                    st.error(f"{'Gemini' if self.gemini else 'Openrouter'} call failed: {e}")
-                    return "[LLM OUTPUT PLACEHOLDER]"
-                time.sleep(self.backoff * attempt)  # simple exponential back‑off
+                    return self._report_failure(e)
+                with tracing.span("llm backoff", "llm", seconds=self.backoff * attempt):
+                    time.sleep(self.backoff * attempt)  # simple exponential back‑off
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            if self.gemini:
+                client = genai.Client().aio
+            else:
+                client = AsyncOpenAI(base_url="https://openrouter.ai/api/v1", api_key=self.api_key)
+            self._async_clients[loop] = client
+        return client
+
+    async def _acall(self, prompt):
+        if self.gemini:
+            resp = await self._async_client().models.generate_content(
+                model=self._model(),
+                contents=prompt + INSTRUCTION_SUFFIX
+            )
+            return resp.text
+        else:
+            resp = await self._async_client().chat.completions.create(
+                model=self._model(),
+                messages=self._messages(prompt),
+            )
+            return resp.choices[0].message.content
+
+    async def agenerate(self, prompt, output=False, timeout=None):
+        """Async version of generate; each attempt is cancelled after `timeout` seconds (default self.timeout)."""
+        if self.stop_all and output is False:
+            return PLACEHOLDER
+
+        cached = self._cached(prompt)
+        if cached is not None:
+            return self._trace_cache_hit(prompt, cached)
+
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while attempt < self.max_retries:
+            try:
+                with self._trace_attempt(prompt, attempt) as trace:
+                    response = await asyncio.wait_for(self._acall(prompt), timeout)
+                    trace["response_chars"] = len(response or "")
+                return self._store(prompt, response)
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_retries:
+                    return self._report_failure(e)
+                with tracing.span("llm backoff", "llm", seconds=self.backoff * attempt):
+                    await asyncio.sleep(self.backoff * attempt)
 
 
 if __name__ == "__main__":
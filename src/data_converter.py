@@ -1,144 +1,185 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import yaml
-import streamlit as st
+from ingest import read_workbook
+from mapping import MappingSnapshot, current_snapshot
+
+# Answers every coded column accepts on top of its codebook: "Not Applicable" / "Skipped"
+SPECIAL_VALUES = (999, "999")
+
+# (source columns, codebook) in the order validation results are reported.
+# "major" and "job" name the Chinese major/occupation names of major_job_zh.yaml (or the questionnaire editor's).
+SCHEMA = [
+    (['Banding'], {'Band 1': 1, 'Band 2': 2, 'Band 3': 3}),
+    (['性別'], {'男': 1, '女': 2}),
+    (["高中選修學科"], {'理科': 1, '商科': 2, '理商科': 3, '文科': 4, '文理科': 5, '文商科': 6, '文理商科': 7}),
+    (["中文成績", "英文成績", "數學成績"], {"< 25 分": 1, "25-49 分": 2, "50-75 分": 3, "> 75 分": 4}),
+    (['父母教育程度'], {'小學': 1, '初中': 2, "高中": 3, "預科": 4, '大專 (非學士學位)': 5, '大學': 6, "學士後課程或以上": 7}),
+    (["試後計劃"], {"進修": 1, "工作": 2, "進修及工作": 3, "其他": 4}),
+    (['香港', '內地', '亞洲', '歐美澳'], {1: 1, 2: 2, 3: 3, 4: 4}),
+    (["工作地方"], {'香港': 1, '內地': 2, '國外 - 亞洲': 3, '國外 - 歐美澳': 4}),
+    (["大學", "副學士", "文憑", "高級文憑", "工作", "工作假期", "其他"], {0: 0, 1: 1}),
+    (["學科知識", "院校因素", "大學學費", "助學金", "主要行業", "朋輩老師", "家庭因素", "預期收入", "DSE成績", "高中選修科目"],
+     {"十分重要": 1, "重要": 2, "不太重要": 3, "不重要": 4}),
+    (["參加STEM"], {'有': 1, '沒有': 2}),
+    (["領導能力", "團隊合作", "創新思維", "科學知識", "解難能力"],
+     {"顯著提升": 1, "部分提升": 2, "較少提升": 3, "沒有提升": 4, 0: 0}),
+    (["個人能力_B", "個人興趣性格_B", "成就感_B", "家庭因素_B", "人際關係_B", "工作性質_B",
+      "工作模式_B", "工作量_B", "工作環境_B", "薪水及褔利_B", "晉升機會_B", "發展前景_B",
+      "社會貢獻_B", "社會地位_B"],
+     {"十分重要": 1, "重要": 2, "不太重要": 3, "不重要": 4}),
+    (["大灣區了解"], {"完全不了解": 1, "不太了解": 2, "了解": 3, "非常了解": 4}),
+    (["壓力程度"], {"完全沒有": 1, "較少": 2, "少": 3, "大": 4, "較大": 5, "非常大": 6}),
+    (["壓力來源"], {"個人因素": 1, "外在因素": 2}),
+    (["承受壓力"], {"完全不能": 1, "大部分不能": 2, "大部分能夠": 3, "完全能夠": 4}),
+    (["家人期望", "朋輩比較", "密集的時間表", "考試成績", "人際關係", "個人前途", "個人期望", "長期獨處", "疫情", "上課不穩定", "調動考試"],
+     {0: 0, 1: 1}),
+    (["做運動", "家人溝通", "朋友溝通", "尋求社工", "重整時間表", "打遊戲機", "睡覺", "聼音樂", "沒有概念"], {0: 0, 1: 1}),
+    (["希望修讀", "希望修讀_A", "希望修讀_B", "不希望修讀", "不希望修讀_A", "不希望修讀_B"], "major"),
+    (["希望從事", "希望從事_A", "希望從事_B", "不希望從事", "不希望從事_A", "不希望從事_B"], "job"),
+]
+
+# Snapshot map holding the Chinese names of the SCHEMA codebooks named "major" and "job"
+ZH_NAMES = {"major": "major_zh", "job": "job_zh"}
+# Compiled schemas keyed by the version of the mapping snapshot they were built from
+_compiled_schemas = {}
+_compiled_schemas_lock = threading.Lock()
+
+
+class Codebook:
+    """
+    The codes of a group of columns, compiled into an index lookup.
+    Equivalent to `isin` on the accepted answers followed by `replace(mapping)`, in one vectorized pass.
+    """
+
+    def __init__(self, columns: list[str], mapping: dict):
+        self.columns = columns
+        self.mapping = mapping
+        self.acceptable_values = set(mapping.keys()) | set(SPECIAL_VALUES)
+        # Special values are accepted and kept as they are
+        codes = {value: value for value in SPECIAL_VALUES}
+        codes.update(mapping)
+        self._answers = pd.Index(list(codes.keys()), dtype=object)
+        self._codes = np.array(list(codes.values()), dtype=object)
+
+    def code(self, values: pd.Series) -> tuple[pd.Series, np.ndarray]:
+        """Returns the coded column (invalid answers as NaN) and the mask of invalid answers."""
+        positions = self._answers.get_indexer(values.astype(object))
+        invalid = positions < 0
+        coded = np.where(invalid, np.nan, self._codes[positions])
+        return pd.Series(coded, index=values.index, name=values.name).infer_objects(), invalid
+
+
+def compile_schema(mappings: MappingSnapshot = None) -> list[Codebook]:
+    """Codebooks of SCHEMA, compiled once per mapping snapshot (the current session's by default)."""
+    mappings = mappings or current_snapshot()
+    with _compiled_schemas_lock:
+        codebooks = _compiled_schemas.get(mappings.version)
+    if codebooks is None:
+        codebooks = [
+            Codebook(columns, {v: k for k, v in mappings[ZH_NAMES[mapping]].items()} if isinstance(mapping, str) else mapping)
+            for columns, mapping in SCHEMA
+        ]
+        with _compiled_schemas_lock:
+            codebooks = _compiled_schemas.setdefault(mappings.version, codebooks)
+    return codebooks
+
+
+def normalize_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Strip surrounding whitespace from every text answer and turn blank answers into NaN."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].to_numpy(dtype=object, copy=True)
+        # Normalize each distinct text answer once; other cells (numbers, missing) keep their value
+        codes, answers = pd.factorize(values)
+        is_text_answer = np.array([isinstance(answer, str) for answer in answers] + [False])   # code -1 is missing
+        if is_text_answer.any():
+            normalized = np.array([answer.strip() or np.nan if isinstance(answer, str) else answer
+                                   for answer in answers] + [np.nan], dtype=object)
+            is_text = is_text_answer[codes]
+            values[is_text] = normalized[codes[is_text]]
+        df[col] = pd.Series(values, index=df.index, name=col).infer_objects()
+    return df
+
 
 class DataConverter:
-    def __init__(self, file_path):
-        self.df = pd.read_excel(file_path)
-        self.df = self.df.map(lambda x: x.strip() if isinstance(x, str) else x)
-        self.df = self.df.map(lambda x: np.nan if isinstance(x, str) and x.strip() == "" else x)
-        # self.mapping = {'學校編號': 'school_id', '問卷編號': 'id', 'Banding': 'banding', '性別': 'gender', '高中選修學科': 'elective', '中文成績': 'chinese_reuslt', '英文成績': 'english_result', '數學成績': 'math_result', '父母教育程度': 'parent_education', '大學': 'uni', '副學士': 'asso', '文憑': 'diploma', '高級文憑': 'high_dip', '工作': 'work', '工作假期': 'working_hoilday', '其他': 'other', '試後計劃': 'future_plan', '香港': 'HK', '內地': 'China', '亞洲': 'Asia', '歐美澳': 'US/EU/AUS', '工作地方': 'working_location', '學科知識': 'personal_interests_A', '院校因素': 'institute_A', '大學學費': 'tuition_A', '助學金': 'scholarship_A', '主要行業': 'career_prospect_A', '朋輩老師': 'peers_and_teacher_A', '家庭因素': 'family_A', '預期收入': 'salary_A', 'DSE成績': 'DSE_result_A', '高中選修科目': 'high_school_electives_A', '希望修讀': 'target_major1', '希望修讀_A': 'target_major2', '希望修讀_B': 'target_major3', '主修相關科目': 'elective_major_relation', '不希望修讀': 'dislike_major1', '不希望修讀_A': 'dislike_major2', '不希望修讀_B': 'dislike_major3', '參加STEM': 'stem_participation', '領導能力': 'leadership', '團隊合作': 'teamwork', '創新思維': 'creativity', '科學知識': 'sci_knowledge', '解難能力': 'problem_solving', '個人能力_B': 'personal_ability_B', '個人興趣性格_B': 'personal_interest_B', '成就感_B': 'sense_of_achievement_B', '家庭因素_B': 'family_B', '人際關係_B': 'interpresonal_relationship_B', '工作性質_B': 'job_nature_B', '工作模式_B': 'remote_work_B', '工作量_B': 'worload_B', '工作環境_B': 'working_environment_B', '薪水及褔利_B': 'salary_and_benefit_B', '晉升機會_B': 'promotion_opportunites_B', '發展前景_B': 'career_prospect_B', '社會貢獻_B': 'social_contribution_B', '社會地位_B': 'social_status_B', '從事相關工作': 'major_career_relation', '希望從事': 'target_occupation1', '希望從事_A': 'target_occupation2', '希望從事_B': 'target_occupation3', '不希望從事': 'dislike_occupation1', '不希望從事_A': 'dislike_occupation2', '不希望從事_B': 'dislike_occupation3', '大灣區了解': 'gba_understanding', '壓力程度': 'stress_lv', '壓力來源': 'stress_scource', '家人期望': 'family_expectations', '朋輩比較': 'comparison', '密集的時間表': 'tight_schedule', '考試成績': 'test_scores', '人際關係': 'relationships', '個人前途': 'prospect', '個人期望': 'expectation', '長期獨處': 'long_term_solitude', '疫情': 'covid_19', '上課不穩定': 'unstable_class', '調動考試': 'transfer_exam', '承受壓力': 'endure_lv', '做運動': 'exercise', '家人溝通': 'family_communication', '朋友溝通': 'friends_communication', '尋求社工': 'social_workers', '重整時間表': 'restructuring_ttb', '打遊戲機': 'video_games', '睡覺': 'sleep', '聼音樂': 'music', '沒有概念': 'no_idea'}
-        self.mapping = {
-            '學校編號': 'school_id', '問卷編號': 'id', 'Banding': 'banding', '性別': 'gender',
-            '高中選修學科': 'elective', '中文成績': 'chinese_reuslt', '英文成績': 'english_result', 
-            '數學成績': 'math_result', '父母教育程度': 'parent_education', '大學': 'uni', '副學士': 'asso', 
-            '文憑': 'diploma', '高級文憑': 'high_dip', '工作': 'work', '工作假期': 'working_hoilday', '其他': 'other', 
-            '試後計劃': 'future_plan', '香港': 'HK', '內地': 'China', '亞洲': 'Asia', '歐美澳': 'US/EU/AUS', '工作地方': 'working_location', 
-            '學科知識': 'personal_interests_A', '院校因素': 'institute_A', '大學學費': 'tuition_A', '助學金': 'scholarship_A', 
-            '主要行業': 'career_prospect_A', '朋輩老師': 'peers_and_teacher_A', '家庭因素': 'family_A', '預期收入': 'salary_A', 
-            'DSE成績': 'DSE_result_A', '高中選修科目': 'high_school_electives_A', 
-            '希望修讀': 'target_major1', '希望修讀_A': 'target_major2', '希望修讀_B': 'target_major3', 
-            '不希望修讀': 'dislike_major1', '不希望修讀_A': 'dislike_major2', '不希望修讀_B': 'dislike_major3', 
-            '參加STEM': 'stem_participation', '領導能力': 'leadership', '團隊合作': 'teamwork', '創新思維': 'creativity', 
-            '科學知識': 'sci_knowledge', '解難能力': 'problem_solving', '個人能力_B': 'personal_ability_B', '個人興趣性格_B': 'personal_interest_B', 
-            '成就感_B': 'sense_of_achievement_B', '家庭因素_B': 'family_B', '人際關係_B': 'interpresonal_relationship_B', '工作性質_B': 'job_nature_B', 
-            '工作模式_B': 'remote_work_B', '工作量_B': 'worload_B', '工作環境_B': 'working_environment_B', '薪水及褔利_B': 'salary_and_benefit_B', 
-            '晉升機會_B': 'promotion_opportunites_B', '發展前景_B': 'career_prospect_-  B', '社會貢獻_B': 'social_contribution_B', '社會地位_B': 'social_status_B', 
-            '希望從事': 'target_occupation1', '希望從事_A': 'target_occupation2', '希望從事_B': 'target_occupation3', 
-            '不希望從事': 'dislike_occupation1', '不希望從事_A': 'dislike_occupation2', '不希望從事_B': 'dislike_occupation3', 
-            '大灣區了解': 'gba_understanding', '壓力程度': 'stress_lv', '壓力來源': 'stress_scource', '家人期望': 'family_expectations', 
-            '朋輩比較': 'comparison', '密集的時間表': 'tight_schedule', '考試成績': 'test_scores', '人際關係': 'relationships', 
-            '個人前途': 'prospect', '個人期望': 'expectation', '長期獨處': 'long_term_solitude', '疫情': 'covid_19', 
-            '上課不穩定': 'unstable_class', '調動考試': 'transfer_exam', '承受壓力': 'endure_lv', '做運動': 'exercise', 
-            '家人溝通': 'family_communication', '朋友溝通': 'friends_communication', '尋求社工': 'social_workers', 
-            '重整時間表': 'restructuring_ttb', '打遊戲機': 'video_games', '睡覺': 'sleep', 
-            '聼音樂': 'music', '沒有概念': 'no_idea',
-            # '從事相關工作': 'major_career_relation',
-        }
-
-    def read_major_yaml(self, item: str, yaml_path: str) -> dict:
-        with open(yaml_path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
-        major_dict = data.get(item)
-        return major_dict
+    # Source column -> converted column name
+    mapping = {
+        '學校編號': 'school_id', '問卷編號': 'id', 'Banding': 'banding', '性別': 'gender',
+        '高中選修學科': 'elective', '中文成績': 'chinese_reuslt', '英文成績': 'english_result', 
+        '數學成績': 'math_result', '父母教育程度': 'parent_education', '大學': 'uni', '副學士': 'asso', 
+        '文憑': 'diploma', '高級文憑': 'high_dip', '工作': 'work', '工作假期': 'working_hoilday', '其他': 'other', 
+        '試後計劃': 'future_plan', '香港': 'HK', '內地': 'China', '亞洲': 'Asia', '歐美澳': 'US/EU/AUS', '工作地方': 'working_location', 
+        '學科知識': 'personal_interests_A', '院校因素': 'institute_A', '大學學費': 'tuition_A', '助學金': 'scholarship_A', 
+        '主要行業': 'career_prospect_A', '朋輩老師': 'peers_and_teacher_A', '家庭因素': 'family_A', '預期收入': 'salary_A', 
+        'DSE成績': 'DSE_result_A', '高中選修科目': 'high_school_electives_A', 
+        '希望修讀': 'target_major1', '希望修讀_A': 'target_major2', '希望修讀_B': 'target_major3', 
+        '不希望修讀': 'dislike_major1', '不希望修讀_A': 'dislike_major2', '不希望修讀_B': 'dislike_major3', 
+        '參加STEM': 'stem_participation', '領導能力': 'leadership', '團隊合作': 'teamwork', '創新思維': 'creativity', 
+        '科學知識': 'sci_knowledge', '解難能力': 'problem_solving', '個人能力_B': 'personal_ability_B', '個人興趣性格_B': 'personal_interest_B', 
+        '成就感_B': 'sense_of_achievement_B', '家庭因素_B': 'family_B', '人際關係_B': 'interpresonal_relationship_B', '工作性質_B': 'job_nature_B', 
+        '工作模式_B': 'remote_work_B', '工作量_B': 'worload_B', '工作環境_B': 'working_environment_B', '薪水及褔利_B': 'salary_and_benefit_B', 
+        '晉升機會_B': 'promotion_opportunites_B', '發展前景_B': 'career_prospect_-  B', '社會貢獻_B': 'social_contribution_B', '社會地位_B': 'social_status_B', 
+        '希望從事': 'target_occupation1', '希望從事_A': 'target_occupation2', '希望從事_B': 'target_occupation3', 
+        '不希望從事': 'dislike_occupation1', '不希望從事_A': 'dislike_occupation2', '不希望從事_B': 'dislike_occupation3', 
+        '大灣區了解': 'gba_understanding', '壓力程度': 'stress_lv', '壓力來源': 'stress_scource', '家人期望': 'family_expectations', 
+        '朋輩比較': 'comparison', '密集的時間表': 'tight_schedule', '考試成績': 'test_scores', '人際關係': 'relationships', 
+        '個人前途': 'prospect', '個人期望': 'expectation', '長期獨處': 'long_term_solitude', '疫情': 'covid_19', 
+        '上課不穩定': 'unstable_class', '調動考試': 'transfer_exam', '承受壓力': 'endure_lv', '做運動': 'exercise', 
+        '家人溝通': 'family_communication', '朋友溝通': 'friends_communication', '尋求社工': 'social_workers', 
+        '重整時間表': 'restructuring_ttb', '打遊戲機': 'video_games', '睡覺': 'sleep', 
+        '聼音樂': 'music', '沒有概念': 'no_idea',
+        # '從事相關工作': 'major_career_relation',
+    }
+
+    def __init__(self, file_path, backend="auto", mappings: MappingSnapshot = None):
+        self.df = normalize_strings(read_workbook(file_path, backend))
+        self.mappings = mappings or current_snapshot()
+
+    def read_major_yaml(self, item: str) -> dict:
+        return dict(self.mappings[ZH_NAMES[item]])
 
     def reverse_mapping(self, mapping: dict[str|int, str]) -> dict[str|int, str]:
         return {v: k for k, v in mapping.items()}
 
-    def _convert_data(self, column_name: list[str]|str, mapping: dict[str|int, int]) -> dict[str, list[tuple[int, str]]]:
-        if isinstance(column_name, str):
-            column_name = [column_name]
+    def _convert_codebook(self, codebook: Codebook) -> dict[str, list[tuple[int, str]]]:
+        result = {}
+        for col in codebook.columns:
+            coded, invalid = codebook.code(self.df[col])
+            if invalid.any():
+                result[col] = list(zip(self.df.index[invalid].tolist(), self.df[col][invalid]))
+            self.df[col] = coded
 
-        acceptable_values = set(mapping.keys()) | set([999, "999"])
+        if result:
+            result["acceptable_values"] = codebook.acceptable_values
 
-        result = {}
+        return result
 
+    def _convert_data(self, column_name: list[str]|str, mapping: dict[str|int, int]) -> dict[str, list[tuple[int, str]]]:
+        if isinstance(column_name, str):
+            column_name = [column_name]
         for col in column_name:
             if col not in self.df.columns:
                 raise ValueError(f"Missing columns: {col}")
-
-            # check if the invalid values exist in the column
-            invalid_mask = ~self.df[col].isin(acceptable_values)
-            invalid_values = self.df[col][invalid_mask]
-            if not invalid_values.empty:
-                invalid_row_ids = self.df.index[invalid_mask].tolist()
-                result[col] = [(row_id, value) for row_id, value in zip(invalid_row_ids, invalid_values)]
-              
-            # replace invalid values with NaN
-            self.df.loc[invalid_mask, col] = np.nan
-
-            # convert valid values with the mapping
-            self.df[col] = self.df[col].replace(mapping)
-
-        
-        if result:
-            result["acceptable_values"] = acceptable_values
-
-        return result
-    
+        return self._convert_codebook(Codebook(column_name, mapping))
     
     def convert_all(self):
         """
         Convert all relevant columns in the DataFrame to standardized formats.
+        Returns one validation result per codebook of SCHEMA, {column: [(row, invalid answer)], "acceptable_values": ...}.
         """
-        validation_result = []
-        
-        validation_result.append(self._convert_data('Banding', {'Band 1': 1, 'Band 2': 2, 'Band 3': 3}))
-        validation_result.append(self._convert_data('性別', {'男': 1, '女': 2}))
-        validation_result.append(self._convert_data("高中選修學科", {'理科': 1, '商科': 2, '理商科': 3, '文科': 4, '文理科': 5, '文商科': 6, '文理商科': 7}))
-        validation_result.append(self._convert_data(["中文成績", "英文成績", "數學成績"], {"< 25 分": 1, "25-49 分": 2, "50-75 分": 3, "> 75 分": 4}))
-        validation_result.append(self._convert_data('父母教育程度', {'小學': 1, '初中': 2, "高中": 3, "預科": 4, '大專 (非學士學位)': 5, '大學': 6, "學士後課程或以上": 7}))
-        validation_result.append(self._convert_data("試後計劃", {"進修": 1, "工作": 2, "進修及工作": 3, "其他": 4}))
-        validation_result.append(self._convert_data(['香港', '內地', '亞洲', '歐美澳'], {1: 1, 2: 2, 3: 3, 4: 4}))
-        validation_result.append(self._convert_data("工作地方", {'香港': 1, '內地': 2, '國外 - 亞洲': 3, '國外 - 歐美澳': 4}))
-        validation_result.append(self._convert_data(
-            ["大學", "副學士", "文憑", "高級文憑", "工作", "工作假期", "其他"],
-            {0: 0, 1: 1}
-        ))
-        validation_result.append(self._convert_data(
-            ["學科知識", "院校因素", "大學學費", "助學金", "主要行業", "朋輩老師", "家庭因素", "預期收入", "DSE成績", "高中選修科目"], 
-            {"十分重要": 1, "重要": 2, "不太重要": 3, "不重要": 4}
-        ))
-        validation_result.append(self._convert_data("參加STEM", {'有': 1, '沒有': 2}))
-        validation_result.append(self._convert_data(
-            ["領導能力", "團隊合作", "創新思維", "科學知識", "解難能力"], 
-            {"顯著提升": 1, "部分提升": 2, "較少提升": 3, "沒有提升": 4, 0:0}
-        ))
-        validation_result.append(self._convert_data(
-            ["個人能力_B", "個人興趣性格_B", "成就感_B", "家庭因素_B", "人際關係_B", "工作性質_B",
-            "工作模式_B", "工作量_B", "工作環境_B", "薪水及褔利_B", "晉升機會_B", "發展前景_B",
-            "社會貢獻_B", "社會地位_B"],
-            {"十分重要": 1, "重要": 2, "不太重要": 3, "不重要": 4}
-        ))
-        validation_result.append(self._convert_data("大灣區了解", {"完全不了解": 1, "不太了解": 2, "了解": 3, "非常了解": 4}))
-        validation_result.append(self._convert_data("壓力程度", {"完全沒有": 1, "較少": 2, "少": 3, "大": 4, "較大": 5, "非常大": 6}))
-        validation_result.append(self._convert_data("壓力來源", {"個人因素": 1, "外在因素": 2}))
-        validation_result.append(self._convert_data("承受壓力", {"完全不能": 1, "大部分不能": 2, "大部分能夠": 3, "完全能夠": 4}))
-        validation_result.append(self._convert_data(
-            ["家人期望", "朋輩比較", "密集的時間表", "考試成績", "人際關係", "個人前途", "個人期望", "長期獨處", "疫情", "上課不穩定", "調動考試"],
-            {0: 0, 1: 1}
-        ))
-        validation_result.append(self._convert_data(
-            ["做運動", "家人溝通", "朋友溝通", "尋求社工", "重整時間表", "打遊戲機", "睡覺", "聼音樂", "沒有概念"],
-            {0: 0, 1: 1}
-        ))
-        validation_result.append(self._convert_data(
-            ["希望修讀", "希望修讀_A", "希望修讀_B",
-            "不希望修讀", "不希望修讀_A", "不希望修讀_B",], 
-            self.reverse_mapping(
-                st.session_state.get("major_zh", self.read_major_yaml("major", "src/major_job_zh.yaml"))
-            )
-        ))
-        validation_result.append(self._convert_data(
-            ["希望從事", "希望從事_A", "希望從事_B",
-            "不希望從事", "不希望從事_A", "不希望從事_B"], 
-            self.reverse_mapping(
-                st.session_state.get("job_zh", self.read_major_yaml("job", "src/major_job_zh.yaml"))
-            )
-        ))
-
-        return validation_result    
+        codebooks = compile_schema(self.mappings)
+        for codebook in codebooks:
+            for col in codebook.columns:
+                if col not in self.df.columns:
+                    raise ValueError(f"Missing columns: {col}")
+
+        return [self._convert_codebook(codebook) for codebook in codebooks]
 
     def convert_columns_name(self):
         self.df.rename(columns=self.mapping, inplace=True)
@@ -148,6 +189,50 @@ class DataConverter:
         return [col for col in self.mapping if col not in self.df.columns]
         
 
+# Converted uploads keyed by content hash and mapping version, bounded by the memory of the converted frames
+CONVERSION_CACHE_BYTES = 512 * 1024 * 1024
+_conversions: "OrderedDict[str, tuple]" = OrderedDict()
+_conversions_bytes = 0
+_conversions_lock = threading.Lock()
+
+
+def convert_upload(data: bytes, backend: str = "auto",
+                   mappings: MappingSnapshot = None) -> tuple[pd.DataFrame | None, list[str], list[dict]]:
+    """
+    Validate and convert an uploaded workbook, returning (converted frame, missing columns, validation results).
+    The frame is None when required columns are missing.
+    Results are cached per upload content and mapping version, so reruns of the app reuse them;
+    the returned frame is shared and must not be modified in place.
+    """
+    global _conversions_bytes
+    mappings = mappings or current_snapshot()
+    key = f"{hashlib.sha256(data).hexdigest()}-{mappings.version}"
+    with _conversions_lock:
+        if key in _conversions:
+            _conversions.move_to_end(key)
+            return _conversions[key][0]
+
+    converter = DataConverter(io.BytesIO(data), backend, mappings)
+    missing_columns = converter.check_all_columns_exist()
+    if missing_columns:
+        result = (None, missing_columns, [])
+    else:
+        validation_results = converter.convert_all()
+        converter.convert_columns_name()
+        result = (converter.df, [], validation_results)
+
+    size = int(converter.df.memory_usage(deep=True).sum()) if result[0] is not None else 0
+    with _conversions_lock:
+        if key not in _conversions:
+            _conversions[key] = (result, size)
+            _conversions_bytes += size
+        # Keep at least the newest entry, even if it alone exceeds the budget
+        while _conversions_bytes > CONVERSION_CACHE_BYTES and len(_conversions) > 1:
+            _, (_, evicted_size) = _conversions.popitem(last=False)
+            _conversions_bytes -= evicted_size
+    return result
+
+
 if __name__ == "__main__":
     converter = DataConverter("sample_data/sample_data.xlsx")
     converter.convert_all()
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import stat
+import tempfile
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """Returns the sha256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded directory of cached files addressed by a string key.
+    Entries are written atomically; when the directory grows beyond max_bytes the
+    least recently used entries (by modification time, refreshed on every hit) are evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Returns the path of the cached entry, or None on a miss."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return path
+
+    def store(self, key: str, writer: Callable[[str], None]) -> Optional[str]:
+        """
+        Store an entry by calling writer(temp_path), then move it into place.
+        Returns the entry path, or None if the writer failed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            writer(temp_path)
+            os.replace(temp_path, self._path(key))
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+        try:
+            self.evict()
+        except OSError as e:
+            logger.warning(f"Could not evict cache entries of {self.directory}: {e}")
+        return self._path(key)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted by another process since get_path
+            return None
+
+    def put_bytes(self, key: str, data: bytes) -> Optional[str]:
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        return self.store(key, write)
+
+    def invalidate(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        """Remove every entry of this cache; entries other processes are still writing are left alone."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp") or not name.endswith(self.suffix):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        Processes sharing the directory may evict at the same time; entries already gone are skipped.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp") or not name.endswith(self.suffix):
+                continue
+            try:
+                entry = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(entry.st_mode):
+                entries.append((entry.st_mtime, entry.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
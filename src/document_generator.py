@@ -1,12 +1,22 @@
-from docxtpl import DocxTemplate, InlineImage
+from docxtpl import InlineImage
 from docx.shared import Mm
 from read_csv import csv_reader
+from mapping import MappingSnapshot, current_snapshot
+from report_template import load_template
+from baseline import BaselineSnapshot
+from aggregates import ENDURE_LEVELS, STRESS_LEVELS, STRESS_METHODS, STRESS_SOURCES, AggregateStore
 from conclusion_gen import llm
+from llm_cache import LLMCache
 import plotter
 import prompt_template
-from typing import Dict, List, Any, Tuple
+from section_executor import SectionExecutor
+import tracing
+from typing import Callable, Dict, List, Any, Tuple
 from dataclasses import dataclass
+from contextlib import nullcontext
+import io
 import logging
+import os
 import streamlit as st
 
 # Configure logging
@@ -15,6 +25,40 @@ logger = logging.getLogger(__name__)
 for name in ["choreographer", "kaleido", "httpx", "google_genai"]:
     logging.getLogger(name).setLevel(logging.CRITICAL)
 
+MAJOR_TARGETS = {
+    "target": ['target_major1', 'target_major2', 'target_major3'],
+    "dislike": ['dislike_major1', 'dislike_major2', 'dislike_major3'],
+}
+OCCUPATION_TARGETS = {
+    "target": ['target_occupation1', 'target_occupation2', 'target_occupation3'],
+    "dislike": ['dislike_occupation1', 'dislike_occupation2', 'dislike_occupation3'],
+}
+DEFAULT_MAJOR_FACTORS = [
+    "personal_interests", "institute", "tuition",
+    "scholarship", "career_prospect", "peers_and_teacher",
+    "family", "salary", "DSE_result",
+    "high_school_electives"
+]
+DEFAULT_OCCUPATION_FACTORS = [
+    "personal_ability", "personal_interest", "sense_of_achievement", "family",
+    "interpresonal_relationship", "job_nature", "remote_work", "worload",
+    "working_environment", "salary_and_benefit", "promotion_opportunites",
+    "career_prospect", "social_contribution", "social_status"
+]
+STEM_SKILLS = {
+    "leadership": ("leadership_strong", "leadership_par"),
+    "teamwork": ("teamwork_strong", "teamwork_par"),
+    "creativity": ("creative_strong", "creative_par"),
+    "sci_knowledge": ("knowledge_strong", "knowledge_par"),
+    "problem_solving": ("prob_solving_strong", "prob_solving_par")
+}
+# Progress reported once the survey data is loaded and when the document render starts;
+# the report sections fill the range in between
+LOAD_PROGRESS = 0.1
+RENDER_PROGRESS = 0.9
+# Columns compared against the all-school "Average", stored in baseline snapshots
+BASELINE_COLUMNS = ["stress_scource", "stress_lv", "endure_lv"] + STRESS_SOURCES + STRESS_METHODS
+
 @dataclass
 class Config:
     """Configuration settings for the document generator."""
@@ -22,29 +66,119 @@ class Config:
     output_path: str = "doc/filled_report.docx"
     school_data_path: str = None
     general_data_path: str = "data/school_all.xlsx"
-    image_dir: str = "img"
+    image_dir: str = None   # optional scratch directory the chart PNGs are also written to; charts stay in memory otherwise
     year: int = 2024
     school_name: str = "High School"
     school_id: int = 12
     use_llm: bool = True
     use_gemini: bool = True
     model_name: str = None
+    use_data_cache: bool = True
+    ingest_backend: str = "auto"   # workbook reader: "auto", "calamine", "openpyxl_stream" or "openpyxl"
+    baseline_path: str = None
+    aggregates_path: str = None   # when set, both readers are the school's and all-school counts of this aggregate store
+    llm_timeout: float = 120
+    llm_cache_path: str = ".cache/llm.sqlite"   # None disables the LLM response cache
+    llm_cache_ttl: float = 30 * 24 * 3600
+    bypass_llm_cache: bool = False
+    section_workers: int = 4
+    chart_backend: str = "plotly"   # "plotly" (Kaleido/Chromium) or "matplotlib" (Agg, no browser)
+    trace_dir: str = None   # when set, a per-stage timing trace of every report is written there
+    trace_format: str = "chrome"   # "chrome" (chrome://tracing, ui.perfetto.dev) or "json"
 
 class DocumentGenerator:
     """Main class for generating school survey reports."""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, school_reader: csv_reader = None, general_reader: csv_reader = None, data=None,
+                 progress: Callable[[str, float], None] = None, mappings: MappingSnapshot = None):
+        """
+        `data` is the converted all-school dataset (DataFrame or pyarrow Table) to use instead of
+        reading `config.general_data_path`; it is decoded once for both readers.
+        `progress(stage, fraction)` is called as loading, every report section and the final render complete.
+        `mappings` are the questionnaire mappings of the report, the current session's by default.
+        """
         self.config = config
-        self.doc = DocxTemplate(config.template_path)
-        self.llm = llm(gemini=config.use_gemini, model_name=config.model_name, stop_all=not config.use_llm)
-        if config.school_data_path is None:
-            self.school_reader = csv_reader(config.general_data_path, config.school_id)
-        else:
-            self.school_reader = csv_reader(config.school_data_path)
-
-        self.general_reader = csv_reader(config.general_data_path)
+        self.mappings = mappings or current_snapshot()
+        self.progress = progress
+        # Timing of every stage of this report: ingestion, sections, charts, LLM calls and the render
+        self.tracer = tracing.Tracer(f"report {config.school_id} {config.school_name}")
+        self._report_progress("Loading survey data", 0.0)
+        # The template is parsed and compiled once per process and shared by every report
+        self.doc = load_template(config.template_path).new_document()
+        # Section and LLM failures of the report; shown by the caller (background jobs keep them on the job)
+        self.errors: List[str] = []
+        llm_cache = LLMCache(config.llm_cache_path, ttl=config.llm_cache_ttl) if config.llm_cache_path else None
+        self.llm = llm(gemini=config.use_gemini, model_name=config.model_name, stop_all=not config.use_llm,
+                       timeout=config.llm_timeout, cache=llm_cache, bypass_cache=config.bypass_llm_cache,
+                       on_failure=self.errors.append)
+        with tracing.activate(self.tracer), tracing.span("load data", "ingest"):
+            self._load_readers(school_reader, general_reader, data)
         self.context = self._initialize_context()
         self.school = config.school_name
+        # Rendered chart PNGs by file name, e.g. {"stress_method.png": b"..."}
+        self.images: Dict[str, bytes] = {}
+        self._report_progress("Survey data loaded", LOAD_PROGRESS)
+
+    def _report_progress(self, stage: str, fraction: float) -> None:
+        if self.progress is not None:
+            self.progress(stage, fraction)
+
+    def _load_readers(self, school_reader: csv_reader, general_reader: csv_reader, data) -> None:
+        config = self.config
+        if data is None and school_reader is None and general_reader is None and config.aggregates_path is not None:
+            # Counts kept up to date as response batches arrive; no workbook is parsed
+            store = AggregateStore.load(config.aggregates_path)
+            if store.mapping_version != self.mappings.version:
+                raise ValueError(f"Aggregate store {config.aggregates_path} holds mapping version {store.mapping_version}, "
+                                 f"the report uses {self.mappings.version}; rebuild the store to change mappings")
+            # Without a school id the report covers every school, as with in-memory data
+            self.school_reader = store.school(config.school_id) if config.school_id else store.total
+            self.general_reader = store.total
+            return
+
+        if data is not None:
+            data_reader = csv_reader(data, mappings=self.mappings)
+            if school_reader is None and config.school_data_path is None:
+                school_reader = data_reader.select_school(config.school_id) if config.school_id else data_reader
+            if general_reader is None:
+                general_reader = data_reader
+
+        # Readers may be passed in by the batch engine so the dataset is only parsed once
+        if school_reader is not None:
+            self.school_reader = school_reader
+        elif config.school_data_path is None:
+            self.school_reader = csv_reader(config.general_data_path, config.school_id, use_cache=config.use_data_cache,
+                                            backend=config.ingest_backend, mappings=self.mappings)
+        else:
+            self.school_reader = csv_reader(config.school_data_path, use_cache=config.use_data_cache, backend=config.ingest_backend,
+                                            mappings=self.mappings)
+
+        if general_reader is not None:
+            self.general_reader = general_reader
+        elif config.baseline_path is not None:
+            self.general_reader = self._load_baseline()
+        else:
+            self.general_reader = csv_reader(config.general_data_path, use_cache=config.use_data_cache, backend=config.ingest_backend,
+                                             mappings=self.mappings)
+
+    def _load_baseline(self) -> BaselineSnapshot:
+        """Load the all-school baseline snapshot, building it first if it is missing or stale."""
+        path = self.config.baseline_path
+        try:
+            snapshot = BaselineSnapshot.load(path) if os.path.exists(path) else None
+        except ValueError as e:
+            logger.warning(f"Rebuilding baseline snapshot: {e}")
+            snapshot = None
+        if snapshot is not None and snapshot.is_current(self.config.general_data_path, self.mappings.version,
+                                                        self.config.year, BASELINE_COLUMNS):
+            return snapshot
+
+        logger.info(f"Building baseline snapshot {path} from {self.config.general_data_path}")
+        general_reader = csv_reader(self.config.general_data_path, use_cache=self.config.use_data_cache,
+                                    backend=self.config.ingest_backend, mappings=self.mappings)
+        snapshot = BaselineSnapshot.from_reader(general_reader, BASELINE_COLUMNS, self.config.year, self.config.general_data_path)
+        snapshot.save(path)
+        return snapshot
 
     def _initialize_context(self) -> Dict[str, Any]:
         """Initialize the document context with basic information."""
@@ -54,412 +188,358 @@ class DocumentGenerator:
             "respondents": self.school_reader.sample_size,
         }
     
-    def generate_report(self) -> None:
-        """Generate the complete report."""
+    def generate_report(self, output=None) -> None:
+        """Generate the complete report and save it to `output`, a path or binary file object (config.output_path by default)."""
+        output = self.config.output_path if output is None else output
         logger.info(f"Starting report generation for school {self.school} {self.config.school_id}...")
-        
-        self._process_majors()
-        self._process_occupations()
-        self._process_stem_analysis()
-        self._process_gba_analysis()
-        self._process_stress_analysis()
+        with tracing.activate(self.tracer):
+            self._generate_report(output)
+        self._export_trace()
+
+        logger.info(f"Report generated successfully: {output if isinstance(output, str) else self.config.school_name}")
+
+    def _generate_report(self, output) -> None:
+        executor = self._build_tasks()
+        if self.progress is not None:
+            executor.on_task_done = self._section_progress(len(executor.tasks))
+        # One warm Chromium serves every chart of the report (or of the whole batch, if already running);
+        # the matplotlib backend needs no browser at all
+        if self.config.chart_backend == "plotly":
+            session = plotter.render_session(n_tabs=self.config.section_workers)
+        else:
+            session = nullcontext()
+        with session:
+            results = executor.run()
+        self.errors.extend(executor.errors)
+        for message in self.errors:
+            st.error(message)
+
+        self._report_progress("Rendering document", RENDER_PROGRESS)
+        self._assemble_context(results)
         self._format_percentages()
-        self._render_document()
-        
-        logger.info(f"Report generated successfully: {self.config.output_path}")
+        self._render_document(output)
+        self._report_progress("Report generated", 1.0)
+
+    def _export_trace(self) -> None:
+        summary = ", ".join(f"{category} {total['seconds']:.2f}s/{total['count']}"
+                            for category, total in self.tracer.summary().items())
+        logger.info(f"Stage timings (summed per category): {summary}")
+        if self.config.trace_dir is None:
+            return
+        name = os.path.splitext(os.path.basename(self.config.output_path))[0]
+        path = os.path.join(self.config.trace_dir, f"{name}.trace.json")
+        self.tracer.save(path, self.config.trace_format)
+        logger.info(f"Trace written to {path}")
+
+    def _section_progress(self, total: int) -> Callable[[str, bool], None]:
+        """Reports every finished section task, spread between data loading and the document render."""
+        finished = []
+
+        def on_task_done(name: str, succeeded: bool) -> None:
+            finished.append(name)
+            kind = "LLM conclusion" if name.endswith("_llm") else "Chart" if name.endswith("_chart") else "Section"
+            fraction = LOAD_PROGRESS + (RENDER_PROGRESS - LOAD_PROGRESS) * len(finished) / total
+            self._report_progress(f"{kind} {name} {'done' if succeeded else 'failed'} ({len(finished)}/{total})", fraction)
+
+        return on_task_done
+
+    def _build_tasks(self) -> SectionExecutor:
+        """
+        Express every report section as a DAG of aggregate -> chart and aggregate -> prompt -> LLM tasks.
+        Aggregate tasks return {"context": ..., "prompt": ...}, chart and LLM tasks return {"context": ...}.
+        """
+        executor = SectionExecutor(max_workers=self.config.section_workers)
+
+        # Majors
+        executor.add("majors", lambda r: self._aggregate_topk("major", MAJOR_TARGETS, prompt_template.major_prompt),
+                     error_message="Error processing major preferences")
+        executor.add("majors_llm", self._conclusion_task("majors", "major_conclusion"), deps=["majors"],
+                     error_message="Error processing major preferences")
+        executor.add("major_factors_chart", lambda r: self._factors_chart(
+                        self._selected_factors("major_influence", "_A", DEFAULT_MAJOR_FACTORS),
+                        "Major Selection Factors", "_A", "major_factors.png", "major_factors_graph"),
+                     error_message="Error processing major preferences")
+
+        # Occupations
+        executor.add("occupations", lambda r: self._aggregate_topk("occupation", OCCUPATION_TARGETS, prompt_template.occupations_prompt),
+                     error_message="Error processing occupation preferences")
+        executor.add("occupations_llm", self._conclusion_task("occupations", "occupations_conclusion"), deps=["occupations"],
+                     error_message="Error processing occupation preferences")
+        executor.add("occupation_factors_chart", lambda r: self._factors_chart(
+                        self._selected_factors("occupation_influence", "_B", DEFAULT_OCCUPATION_FACTORS),
+                        "Occpuation Selection Factors", "_B", "occpuation_factors.png", "occupation_factors_graph"),
+                     error_message="Error processing occupation preferences")
+
+        # STEM
+        executor.add("stem", lambda r: self._aggregate_stem(), error_message="Error processing STEM analysis")
+        executor.add("stem_llm", self._conclusion_task("stem", "stem_conclusion"), deps=["stem"],
+                     error_message="Error processing STEM analysis")
+        executor.add("stem_major_chart", lambda r: self._stem_chart(r["stem"]["context"], "major", "_A", "stem_major.png", "stem_graph_1"),
+                     deps=["stem"], error_message="Error processing STEM analysis")
+        executor.add("stem_job_chart", lambda r: self._stem_chart(r["stem"]["context"], "occupation", "_B", "stem_job.png", "stem_graph_2"),
+                     deps=["stem"], error_message="Error processing STEM analysis")
+
+        # GBA
+        executor.add("gba", lambda r: self._aggregate_gba(), error_message="Error processing GBA analysis")
+        executor.add("gba_llm", self._conclusion_task("gba", "gba_conclusion"), deps=["gba"],
+                     error_message="Error processing GBA analysis")
+
+        # Stress
+        executor.add("stress_source", lambda r: self._aggregate_stress_source(), error_message="Error processing stress source")
+        executor.add("stress_sources", lambda r: self._aggregate_stress_sources(), error_message="Error processing stress sources")
+        executor.add("stress_sources_chart", lambda r: self._comparison_chart(
+                        r["stress_sources"]["context"], STRESS_SOURCES, f"Stress Sources: {self.config.school_name} vs Average",
+                        "Stress Sources", "stress_sources.png", "stress_sources_graph"),
+                     deps=["stress_sources"], error_message="Error processing stress sources")
+        executor.add("stress_levels", lambda r: self._aggregate_levels("stress_lv", STRESS_LEVELS), error_message="Error processing stress level")
+        executor.add("stress_level_chart", lambda r: self._comparison_chart(
+                        r["stress_levels"]["context"], STRESS_LEVELS, f"Stress Level: {self.config.school_name} vs Average",
+                        "Stress Level", "stress_level_distribution.png", "stress_lv_graph"),
+                     deps=["stress_levels"], error_message="Error processing stress level")
+        executor.add("endurance", lambda r: self._aggregate_levels("endure_lv", ENDURE_LEVELS), error_message="Error processing stress endurance")
+        executor.add("endurance_chart", lambda r: self._comparison_chart(
+                        r["endurance"]["context"], ENDURE_LEVELS, f"Stress Tolerance: {self.config.school_name} vs Average",
+                        "Level", "endure_level_distribution.png", "endure_graph"),
+                     deps=["endurance"], error_message="Error processing stress endurance")
+        executor.add("stress_methods", lambda r: self._aggregate_stress_methods(), error_message="Error processing stress method")
+        executor.add("stress_methods_chart", lambda r: self._stress_methods_chart(r["stress_methods"]["context"]),
+                     deps=["stress_methods"], error_message="Error processing stress method")
+
+        executor.add("stress_sources_prompt", lambda r: {"prompt": prompt_template.stress_sources_prompt(r["stress_sources"]["context"])},
+                     deps=["stress_sources"], error_message="Error processing stress sources")
+        executor.add("stress_sources_llm", self._conclusion_task("stress_sources_prompt", "stress_sources_conclusion"),
+                     deps=["stress_sources_prompt"], error_message="Error processing stress sources")
+        executor.add("stress_level_prompt", lambda r: {"prompt": prompt_template.stress_level_prompt(
+                        {**r["stress_levels"]["context"], **r["endurance"]["context"]})},
+                     deps=["stress_levels", "endurance"], error_message="Error processing stress level")
+        executor.add("stress_level_llm", self._conclusion_task("stress_level_prompt", "stress_level_conclusion"),
+                     deps=["stress_level_prompt"], error_message="Error processing stress level")
+
+        return executor
+
+    def _assemble_context(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """Merge task outputs into the context in task declaration order, independent of completion order."""
+        for result in results.values():
+            self.context.update(result.get("context", {}))
+
+    def _conclusion_task(self, prompt_task: str, context_key: str):
+        """LLM task turning the prompt produced by `prompt_task` into the `context_key` conclusion."""
+        async def run(results):
+            conclusion = await self.llm.agenerate(results[prompt_task]["prompt"])
+            return {"context": {context_key: conclusion}}
+        return run
             
-    
+    def _image_path(self, file_name: str) -> str:
+        """Path of a chart image inside the configured image directory, or None when charts stay in memory."""
+        if self.config.image_dir is None:
+            return None
+        return os.path.join(self.config.image_dir, file_name)
+
+    def _chart_image(self, file_name: str, png: bytes, width: Mm) -> InlineImage:
+        """Keep the rendered chart and embed it straight from memory."""
+        self.images[file_name] = png
+        return InlineImage(self.doc, io.BytesIO(png), width=width)
+
     def _get_topk_groupby(self, target: str, target_cols: List[str], 
                          group_by_col: str, k: int) -> Dict[str, List[str]]:
         """Get top-k items grouped by a specific column."""
-        combined_df = self.school_reader.combine_target(target_cols, target)
-        dis_df = self.school_reader.get_distribution(combined_df, target, group_by_col)
+        return self.school_reader.topk_groupby(target_cols, target, group_by_col, k)
 
-        groupby_results = self.school_reader.sort_distribution(dis_df)
-        all_result = self.school_reader.get_distribution(combined_df, target)
-        
-        def get_topk(df, k=5):
-            return df[target].head(k).tolist()
-        
-        ret = {"all": get_topk(all_result, k)}
-        for group, df in groupby_results.items():
-            ret[group] = get_topk(df, k)
-        
-        return ret
+    def _selected_factors(self, factors_key: str, suffix: str, default: List[str]) -> List[str]:
+        """Factors chosen in the questionnaire editor, without their column suffix."""
+        factors = self.mappings.factors(factors_key)
+        if factors is None:
+            return default
+        return [s[:-2] if s is not None and s.endswith(suffix) else s for s in factors if s is not None]
 
-    def _plot_factors_graph(self, factors: list[str], title: str, suffix: str, output_path: str) -> None:
+    def _factors_chart(self, factors: list[str], title: str, suffix: str, file_name: str, graph_key: str) -> Dict[str, Any]:
         # Calculate percentage for each factor
         factor_percent = []
         for factor in factors:
-            if f"{factor}{suffix}" not in self.school_reader.df.columns:
+            if f"{factor}{suffix}" not in self.school_reader.columns:
                 factor_percent.append(0)
                 continue
             percents = self.school_reader.get_percent(f"{factor}{suffix}", [1.0, 2.0], drop_zero=False)
             factor_percent.append(percents[1.0] + percents[2.0])
 
         # Plot bar chart for major factors
-        plotter.bar_chart(
+        png = plotter.bar_chart(
             x_values=factors,
             y_values=factor_percent,
             title=title,
             xtitle="Factors",
             ytitle="Percentage",
-            output_path=output_path
+            output_path=self._image_path(file_name),
+            backend=self.config.chart_backend
         )
+        return {"context": {graph_key: self._chart_image(file_name, png, Mm(150))}}
 
-    def _process_majors(self) -> None:
-        """Process major preference data."""
-        try:
-            target_cols = ['target_major1', 'target_major2', 'target_major3']
-            top_majors = self._get_topk_groupby("major", target_cols, "gender", 10)
+    def _aggregate_topk(self, target: str, targets: Dict[str, List[str]], prompt_fn) -> Dict[str, Any]:
+        """Top-k preferred and disliked majors/occupations, overall and by gender."""
+        top = self._get_topk_groupby(target, targets["target"], "gender", 10)
+        top_dislike = self._get_topk_groupby(f"dislike_{target}", targets["dislike"], "gender", 10)
 
-            dislike_cols = ['dislike_major1', 'dislike_major2', 'dislike_major3']
-            top_dislike_majors = self._get_topk_groupby("dislike_major", dislike_cols, "gender", 10)
-            
-            self._populate_context_with_topk(top_majors, "major", "male_major", "female_major", 5)
-            self._populate_context_with_topk(top_dislike_majors, "unpopular_major", "male_unpopular_major", "female_unpopular_major", 5)
-            self._populate_context_with_topk(top_majors, "top_major", "top_male_major", "top_female_major")
-            self._populate_context_with_topk(top_dislike_majors, "top_unpopular_major", "top_unpopular_male_major", "top_unpopular_female_major")
-
-            # Generate conclusion
-            self.context["major_conclusion"] = self.llm.generate(
-                prompt_template.major_prompt(top_majors, top_dislike_majors)
-            )
-            # Plot major factor graph
-            if "major_influence" in st.session_state:
-                major_factors = st.session_state["major_influence"]
-                major_factors = [s[:-2] if s is not None and s.endswith("_A") else s for s in major_factors if s is not None]
-            else:
-                major_factors = [
-                "personal_interests", "institute", "tuition",
-                "scholarship", "career_prospect", "peers_and_teacher",
-                "family", "salary", "DSE_result",
-                "high_school_electives"
-            ]
-
-            output_path = "img/major_factors.png"
-            self._plot_factors_graph(major_factors, "Major Selection Factors", "_A", output_path)
-            self.context["major_factors_graph"] = InlineImage(self.doc, output_path, width=Mm(150))
-
-        except Exception as e:
-            logger.error(f"Error processing major preferences: {e}")
-            st.error(f"Error processing major preferences: {e}")
-    
-    def _process_occupations(self) -> None:
-        """Process occupation preference data."""
-        try:
-            target_cols = ['target_occupation1', 'target_occupation2', 'target_occupation3']
-            top_occupations = self._get_topk_groupby("occupation", target_cols, "gender", 10)
-            dislike_cols = ['dislike_occupation1', 'dislike_occupation2', 'dislike_occupation3']
-            top_dislike_occupations = self._get_topk_groupby("dislike_occupation", dislike_cols, "gender", 10)            
-            
-            self._populate_context_with_topk(top_occupations, "occupation", "male_occupation", "female_occupation", 5)
-            self._populate_context_with_topk(top_dislike_occupations, "unpopular_occupation", "male_unpopular_occupation", "female_unpopular_occupation", 5)
-            self._populate_context_with_topk(top_occupations, "top_occupation", "top_male_occupation", "top_female_occupation")
-            self._populate_context_with_topk(top_dislike_occupations, "top_unpopular_occupation", "top_unpopular_male_occupation", "top_unpopular_female_occupation")
-
-            # Generate conclusion
-            self.context["occupations_conclusion"] = self.llm.generate(
-                prompt_template.occupations_prompt(top_occupations, top_dislike_occupations)
-            )
-            if "occupation_influence" in st.session_state:
-                occupation_factors = st.session_state["occupation_influence"]
-                occupation_factors = [s[:-2] if s is not None and s.endswith("_B") else s for s in occupation_factors if s is not None]
-            else:
-                occupation_factors = [
-                    "personal_ability", "personal_interest", "sense_of_achievement", "family",
-                    "interpresonal_relationship", "job_nature", "remote_work", "worload",
-                    "working_environment", "salary_and_benefit", "promotion_opportunites",
-                    "career_prospect", "social_contribution", "social_status"
-                ]
-            output_path = "img/occpuation_factors.png"
-            self._plot_factors_graph(occupation_factors, "Occpuation Selection Factors", "_B", output_path)
-            self.context["occupation_factors_graph"] = InlineImage(self.doc, output_path, width=Mm(150))
-            
-        except Exception as e:
-            logger.error(f"Error processing occupation preferences: {e}")
-            st.error(f"Error processing occupation preferences: {e}")
-        
-    def _process_stem_analysis(self) -> None:
-        """Process STEM-related analysis."""
-        try:
-            # STEM skills analysis
-            skill_categories = ["leadership", "teamwork", "creativity", "sci_knowledge", "problem_solving"]
-            skill_mapping = {
-                "leadership": ("leadership_strong", "leadership_par"),
-                "teamwork": ("teamwork_strong", "teamwork_par"),
-                "creativity": ("creative_strong", "creative_par"),
-                "sci_knowledge": ("knowledge_strong", "knowledge_par"),
-                "problem_solving": ("prob_solving_strong", "prob_solving_par")
-            }
-            
-            for skill in skill_categories:
-                percentages = self.school_reader.get_percent(skill, [1.0, 2.0])
-                strong_key, par_key = skill_mapping[skill]
-                self.context[strong_key] = percentages[1]
-                self.context[par_key] = percentages[2]
-            
-            self.context["have_stem"]  = self.school_reader.df['stem_participation'].sum()
-            self.context["no_stem"]  = (~self.school_reader.df['stem_participation']).sum()
+        context = {}
+        self._populate_context_with_topk(context, top, target, f"male_{target}", f"female_{target}", 5)
+        self._populate_context_with_topk(context, top_dislike, f"unpopular_{target}", f"male_unpopular_{target}", f"female_unpopular_{target}", 5)
+        self._populate_context_with_topk(context, top, f"top_{target}", f"top_male_{target}", f"top_female_{target}")
+        self._populate_context_with_topk(context, top_dislike, f"top_unpopular_{target}", f"top_unpopular_male_{target}", f"top_unpopular_female_{target}")
 
-            # STEM major preferences
-            self._analyze_stem_preferences("major", True, "_A", "img/stem_major.png", "stem_graph_1")
-            
-            # STEM job preferences
-            self._analyze_stem_preferences("occupation", False, "_B", "img/stem_job.png", "stem_graph_2")
-            
-            # Generate STEM conclusion
-            self.context['stem_conclusion'] = self.llm.generate(
-                prompt_template.stem_conclusion_prompt(self.context)
-            )
-
-        except Exception as e:
-            logger.error(f"Error processing STEM analysis: {e}")
-            st.error(f"Error processing STEM analysis: {e}")
-    
-    def _process_gba_analysis(self) -> None:
-        """Process GBA (Global Business Administration) analysis."""
-        try:
-            # GBA major analysis
-            gba_bus_major = self.school_reader.check_class_match("Business", "gba_understanding", major=True)
-            gba_sci_major = self.school_reader.check_class_match("Science", "gba_understanding", major=True)
-
-            self.context['gba_bus_A'], self.context['no_gba_bus_A'] = gba_bus_major
-            self.context['gba_sci_A'], self.context['no_gba_sci_A'] = gba_sci_major
-            self.context['bus_diff_A'] = self.context['gba_bus_A'] - self.context['no_gba_bus_A']
-            self.context['gba_sci_diff_A'] = self.context['gba_sci_A'] - self.context['no_gba_sci_A']
-            
-            # GBA job analysis
-            gba_jobs = {
-                "Business": self.school_reader.check_class_match("Business", "gba_understanding", major=False),
-                "Engineering": self.school_reader.check_class_match("Engineering", "gba_understanding", major=False),
-                "Science": self.school_reader.check_class_match("Science", "gba_understanding", major=False)
-            }
-            
-            self.context['gba_bus_B'], self.context['no_gba_bus_B'] = gba_jobs["Business"]
-            self.context['gba_eng'], self.context['no_gba_eng'] = gba_jobs["Engineering"]
-            self.context['gba_sci_B'], self.context['no_gba_sci_B'] = gba_jobs["Science"]
-            
-            # Calculate differences
-            self.context['bus_diff_B'] = self.context['gba_bus_B'] - self.context['no_gba_bus_B']
-            self.context['gba_eng_diff'] = self.context['gba_eng'] - self.context['no_gba_eng']
-            self.context['gba_sci_diff_B'] = self.context['gba_sci_B'] - self.context['no_gba_sci_B']
-            
-            # Generate GBA conclusion
-            self.context['gba_conclusion'] = self.llm.generate(
-                prompt_template.gba_conclusion_prompt(self.context)
-            )
-        except Exception as e:
-            logger.error(f"Error processing GBA analysis: {e}")
-            st.error(f"Error processing GBA analysis: {e}")
+        return {"context": context, "prompt": prompt_fn(top, top_dislike)}
 
-    
-    def _process_stress_analysis(self) -> None:
-        """Process stress-related analysis."""
+    def _aggregate_stem(self) -> Dict[str, Any]:
+        """STEM skills and the STEM/non-STEM major and occupation class preferences."""
+        context = {}
+        for skill, (strong_key, par_key) in STEM_SKILLS.items():
+            percentages = self.school_reader.get_percent(skill, [1.0, 2.0])
+            context[strong_key] = percentages[1]
+            context[par_key] = percentages[2]
+
+        context["have_stem"] = self.school_reader.count('stem_participation', True)
+        context["no_stem"] = self.school_reader.count('stem_participation', False)
+
+        self._compare_stem_preferences(context, True, "_A")
+        self._compare_stem_preferences(context, False, "_B")
+
+        return {"context": context, "prompt": prompt_template.stem_conclusion_prompt(context)}
+
+    def _compare_stem_preferences(self, context: Dict[str, Any], is_major: bool, suffix: str) -> None:
+        """Engineering/Science preferences of students with and without STEM participation."""
+        context[f'stem_sci{suffix}'], context[f'no_stem_sci{suffix}'] = self.school_reader.check_class_match("Science", "stem_participation", major=is_major)
+        context[f'stem_eng{suffix}'], context[f'no_stem_eng{suffix}'] = self.school_reader.check_class_match("Engineering", "stem_participation", major=is_major)
+
+        # Calculate differences and totals
+        context[f'eng_diff{suffix}'] = context[f'stem_eng{suffix}'] - context[f'no_stem_eng{suffix}']
+        context[f'sci_diff{suffix}'] = context[f'stem_sci{suffix}'] - context[f'no_stem_sci{suffix}']
+        context[f'stem_total{suffix}'] = context[f'stem_eng{suffix}'] + context[f'stem_sci{suffix}']
+        context[f'no_stem_total{suffix}'] = context[f'no_stem_eng{suffix}'] + context[f'no_stem_sci{suffix}']
+        context[f'total_diff{suffix}'] = context[f'eng_diff{suffix}'] + context[f'sci_diff{suffix}']
+
+    def _stem_chart(self, stem: Dict[str, Any], category: str, suffix: str, file_name: str, graph_key: str) -> Dict[str, Any]:
+        x_values = ["Engineering", "Science", "Total"]
+        stem_values = {
+            "Engineering": stem[f'stem_eng{suffix}'],
+            "Science": stem[f'stem_sci{suffix}'],
+            "Total": stem[f'stem_total{suffix}']
+        }
+        no_stem_values = {
+            "Engineering": stem[f'no_stem_eng{suffix}'],
+            "Science": stem[f'no_stem_sci{suffix}'],
+            "Total": stem[f'no_stem_total{suffix}']
+        }
+        
+        title = f"{category.title()} Preference"
+        png = plotter.double_bar_chart(x_values, stem_values, no_stem_values, title, None, 
+                                       "Have STEM", "No STEM", self._image_path(file_name), backend=self.config.chart_backend)
         
-        # Stress source analysis
+        return {"context": {graph_key: self._chart_image(file_name, png, Mm(80))}}
+
+    def _aggregate_gba(self) -> Dict[str, Any]:
+        """Major and occupation class preferences of students who do and do not understand the GBA."""
+        context = {}
+        # GBA major analysis
+        context['gba_bus_A'], context['no_gba_bus_A'] = self.school_reader.check_class_match("Business", "gba_understanding", major=True)
+        context['gba_sci_A'], context['no_gba_sci_A'] = self.school_reader.check_class_match("Science", "gba_understanding", major=True)
+        context['bus_diff_A'] = context['gba_bus_A'] - context['no_gba_bus_A']
+        context['gba_sci_diff_A'] = context['gba_sci_A'] - context['no_gba_sci_A']
+
+        # GBA job analysis
+        context['gba_bus_B'], context['no_gba_bus_B'] = self.school_reader.check_class_match("Business", "gba_understanding", major=False)
+        context['gba_eng'], context['no_gba_eng'] = self.school_reader.check_class_match("Engineering", "gba_understanding", major=False)
+        context['gba_sci_B'], context['no_gba_sci_B'] = self.school_reader.check_class_match("Science", "gba_understanding", major=False)
+
+        # Calculate differences
+        context['bus_diff_B'] = context['gba_bus_B'] - context['no_gba_bus_B']
+        context['gba_eng_diff'] = context['gba_eng'] - context['no_gba_eng']
+        context['gba_sci_diff_B'] = context['gba_sci_B'] - context['no_gba_sci_B']
+
+        return {"context": context, "prompt": prompt_template.gba_conclusion_prompt(context)}
+
+    def _aggregate_stress_source(self) -> Dict[str, Any]:
+        """Personal vs external stress source, school vs average."""
         stress_factor = self.school_reader.get_percent("stress_scource", ["personal", "external"])
         general_stress_factor = self.general_reader.get_percent("stress_scource", ["personal", "external"])
-        
-        self.context['personal_A'], self.context['external_A'] = stress_factor["personal"], stress_factor["external"]
-        self.context['personal_B'], self.context['external_B'] = general_stress_factor["personal"], general_stress_factor["external"]
-        
-        # Detailed stress sources
-        self._analyze_stress_sources()
-        
-        # Stress level distribution
-        self._analyze_stress_levels()
-        
-        # Stress endurance levels
-        self._analyze_endurance_levels()
-        
-        # Stress management methods
-        self._analyze_stress_methods()
-        
-        # Generate stress conclusion
-        self.context['stress_sources_conclusion'] = self.llm.generate(
-            prompt_template.stress_sources_prompt(self.context)
-        )
-        self.context['stress_level_conclusion'] = self.llm.generate(
-            prompt_template.stress_level_prompt(self.context)
+        return {"context": {
+            'personal_A': stress_factor["personal"], 'external_A': stress_factor["external"],
+            'personal_B': general_stress_factor["personal"], 'external_B': general_stress_factor["external"],
+        }}
+
+    def _compare_with_average(self, columns: List[str]) -> Dict[str, Any]:
+        """Share of "1" answers for each column, school (_A) vs average (_B)."""
+        context = {}
+        for col in columns:
+            context[f"{col}_A"] = self.school_reader.get_percent(col, [1.0], drop_zero=False)[1.0]
+            context[f"{col}_B"] = self.general_reader.get_percent(col, [1.0], drop_zero=False)[1.0]
+        return context
+
+    def _aggregate_stress_sources(self) -> Dict[str, Any]:
+        return {"context": self._compare_with_average(STRESS_SOURCES)}
+
+    def _aggregate_stress_methods(self) -> Dict[str, Any]:
+        return {"context": self._compare_with_average(STRESS_METHODS)}
+
+    def _aggregate_levels(self, col: str, levels: List[str]) -> Dict[str, Any]:
+        """Distribution of an ordinal answer (stress or endurance level), school (_A) vs average (_B)."""
+        distribution = self.school_reader.get_percent(col, levels, drop_zero=False)
+        general_distribution = self.general_reader.get_percent(col, levels, drop_zero=False)
+
+        context = {}
+        for level in levels:
+            context[f"{level}_A"] = distribution[level]
+            context[f"{level}_B"] = general_distribution[level]
+        return {"context": context}
+
+    def _comparison_chart(self, values: Dict[str, Any], x_values: List[str], title: str, xtitle: str,
+                          file_name: str, graph_key: str) -> Dict[str, Any]:
+        """Double bar chart of a section's school (_A) and average (_B) values."""
+        school_values = {x: values[f"{x}_A"] for x in x_values}
+        avg_values = {x: values[f"{x}_B"] for x in x_values}
+
+        png = plotter.double_bar_chart(
+            x_values, school_values, avg_values, title, xtitle,
+            "Individual School", 'Average', self._image_path(file_name), backend=self.config.chart_backend
         )
-    
-    def _populate_context_with_topk(self, data: Dict[str, List[str]], 
+        return {"context": {graph_key: self._chart_image(file_name, png, Mm(150))}}
+
+    def _stress_methods_chart(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        school_values = {method: values[f"{method}_A"] for method in STRESS_METHODS}
+
+        png = plotter.pie_chart(STRESS_METHODS, school_values, f"Stress Relieve Method: {self.school}",
+                                self._image_path("stress_method.png"), backend=self.config.chart_backend)
+        return {"context": {"stress_graph": self._chart_image("stress_method.png", png, Mm(150))}}
+
+    def _populate_context_with_topk(self, context: Dict[str, Any], data: Dict[str, List[str]], 
                                    all_key: str, male_key: str, female_key: str, k: int=99999) -> None:
         """Populate context with top-k data for all, male, and female categories."""
         for i, item in enumerate(data["all"]):
             if i >= k:
                 break
-            self.context[f'{all_key}_{i}'] = item
+            context[f'{all_key}_{i}'] = item
 
         if "m" in data:
             for i, item in enumerate(data["m"]):
                 if i >= k:
                     break
-                self.context[f'{male_key}_{i}'] = item
+                context[f'{male_key}_{i}'] = item
 
         if "f" in data:
             for i, item in enumerate(data["f"]):
                 if i >= k:
                     break
-                self.context[f'{female_key}_{i}'] = item
+                context[f'{female_key}_{i}'] = item
 
-    def _analyze_stem_preferences(self, category: str, is_major: bool, suffix: str, 
-                                 image_path: str, graph_key: str) -> None:
-        """Analyze STEM preferences for majors or occupations."""
-        stem_sci = self.school_reader.check_class_match("Science", "stem_participation", major=is_major)
-        stem_eng = self.school_reader.check_class_match("Engineering", "stem_participation", major=is_major)
-        
-        # Store results in context
-        self.context[f'stem_eng{suffix}'], self.context[f'no_stem_eng{suffix}'] = stem_eng
-        self.context[f'stem_sci{suffix}'], self.context[f'no_stem_sci{suffix}'] = stem_sci
-        
-        # Calculate differences and totals
-        self.context[f'eng_diff{suffix}'] = self.context[f'stem_eng{suffix}'] - self.context[f'no_stem_eng{suffix}']
-        self.context[f'sci_diff{suffix}'] = self.context[f'stem_sci{suffix}'] - self.context[f'no_stem_sci{suffix}']
-        self.context[f'stem_total{suffix}'] = self.context[f'stem_eng{suffix}'] + self.context[f'stem_sci{suffix}']
-        self.context[f'no_stem_total{suffix}'] = self.context[f'no_stem_eng{suffix}'] + self.context[f'no_stem_sci{suffix}']
-        self.context[f'total_diff{suffix}'] = self.context[f'eng_diff{suffix}'] + self.context[f'sci_diff{suffix}']
-        
-        # Generate chart
-        x_values = ["Engineering", "Science", "Total"]
-        stem_values = {
-            "Engineering": self.context[f'stem_eng{suffix}'],
-            "Science": self.context[f'stem_sci{suffix}'],
-            "Total": self.context[f'stem_total{suffix}']
-        }
-        no_stem_values = {
-            "Engineering": self.context[f'no_stem_eng{suffix}'],
-            "Science": self.context[f'no_stem_sci{suffix}'],
-            "Total": self.context[f'no_stem_total{suffix}']
-        }
-        
-        title = f"{category.title()} Preference"
-        plotter.double_bar_chart(x_values, stem_values, no_stem_values, title, None, 
-                                "Have STEM", "No STEM", image_path)
-        
-        self.context[graph_key] = InlineImage(self.doc, image_path, width=Mm(80))
-    
-    def _analyze_stress_sources(self) -> None:
-        """Analyze detailed stress sources."""
-        try:
-            stress_sources = [
-                "family_expectations", "comparison", "tight_schedule", "test_scores",
-                "relationships", "prospect", "expectation", "long_term_solitude",
-                "covid_19", "unstable_class", "transfer_exam"
-            ]
-            
-            stress_sources_values = {}
-            avg_stress_sources_values = {}
-            
-            for source in stress_sources:
-                school_value = self.school_reader.get_percent(source, [1.0], drop_zero=False)[1.0]
-                general_value = self.general_reader.get_percent(source, [1.0], drop_zero=False)[1.0]
-                
-                self.context[f"{source}_A"] = school_value
-                self.context[f"{source}_B"] = general_value
-                stress_sources_values[source] = school_value
-                avg_stress_sources_values[source] = general_value
-            
-            # Generate stress sources chart
-            plotter.double_bar_chart(
-                stress_sources, stress_sources_values, avg_stress_sources_values,
-                f"Stress Sources: {self.config.school_name} vs Average", "Stress Sources",
-                "Individual School", 'Average', "img/stress_sources.png"
-            )
-            
-            self.context["stress_sources_graph"] = InlineImage(
-                self.doc, "img/stress_sources.png", width=Mm(150)
-            )
-        except Exception as e:
-            logger.error(f"Error processing stress sources: {e}")
-            st.error(f"Error processing stress sources: {e}")
-    
-    def _analyze_stress_levels(self) -> None:
-        """Analyze stress level distribution."""
-        try:
-            stress_levels = ["none", "very_low", "low", "moderate", "high", "very_high"]
-            
-            stress_lv_distribution = self.school_reader.get_percent("stress_lv", stress_levels, drop_zero=False)
-            general_stress_lv_distribution = self.general_reader.get_percent("stress_lv", stress_levels, drop_zero=False)
-            
-            for level in stress_levels:
-                self.context[f"{level}_A"] = stress_lv_distribution[level]
-                self.context[f"{level}_B"] = general_stress_lv_distribution[level]
-            
-            # Generate stress level chart
-            plotter.double_bar_chart(
-                stress_levels, stress_lv_distribution, general_stress_lv_distribution,
-                f"Stress Level: {self.config.school_name} vs Average", "Stress Level",
-                "Individual School", 'Average', "img/stress_level_distribution.png"
-            )
-            
-            self.context["stress_lv_graph"] = InlineImage(
-                self.doc, "img/stress_level_distribution.png", width=Mm(150)
-            )
-        except Exception as e:
-            logger.error(f"Error processing stress level: {e}")
-            st.error(f"Error processing stress level: {e}")
-        
-    def _analyze_endurance_levels(self) -> None:
-        """Analyze stress endurance levels."""
-        try:
-            endure_levels = ["totally_cannot", "mostly_cannot", "mostly_can", "totally_can"]
-            
-            endure_lv_distribution = self.school_reader.get_percent("endure_lv", endure_levels, drop_zero=False)
-            general_endure_lv_distribution = self.general_reader.get_percent("endure_lv", endure_levels, drop_zero=False)
-
-            for level in endure_levels:
-                self.context[f"{level}_A"] = endure_lv_distribution[level]
-                self.context[f"{level}_B"] = general_endure_lv_distribution[level]
-            
-            # Generate endurance level chart
-            plotter.double_bar_chart(
-                endure_levels, endure_lv_distribution, general_endure_lv_distribution,
-                f"Stress Tolerance: {self.config.school_name} vs Average", "Level",
-                "Individual School", 'Average', "img/endure_level_distribution.png"
-            )
-            
-            self.context["endure_graph"] = InlineImage(
-                self.doc, "img/endure_level_distribution.png", width=Mm(150)
-            )
-        except Exception as e:
-            logger.error(f"Error processing stress endurance: {e}")
-            st.error(f"Error processing stress endurance: {e}")
-
-    def _analyze_stress_methods(self) -> None:
-        """Analyze stress management methods."""
-        try:
-            stress_methods = [
-                "exercise", "family_communication", "friends_communication", "social_workers",
-                "restructuring_ttb", "video_games", "sleep", "music", "no_idea"
-            ]
-            school_values = {}
-            for method in stress_methods:
-                school_value = self.school_reader.get_percent(method, [1.0], drop_zero=False)[1.0]
-                general_value = self.general_reader.get_percent(method, [1.0], drop_zero=False)[1.0]
-                school_values[method] = school_value
-                self.context[f"{method}_A"] = school_value
-                self.context[f"{method}_B"] = general_value
-
-            plotter.pie_chart(stress_methods, school_values, f"Stress Relieve Method: {self.school}", "img/stress_method.png")
-            self.context["stress_graph"] = InlineImage(
-                self.doc, "img/stress_method.png", width=Mm(150)
-            )
-        except Exception as e:
-            logger.error(f"Error processing stress method: {e}")
-            st.error(f"Error processing stress method: {e}")
-            
     def _format_percentages(self) -> None:
         """Format all float values as percentages."""
         for key, value in self.context.items():
             if isinstance(value, float):
                 self.context[key] = f"{round(value, 1)}%"
     
-    def _render_document(self) -> None:
+    def _render_document(self, output) -> None:
         """Render and save the final document."""
-        self.doc.render(self.context)
-        self.doc.save(self.config.output_path)
+        with tracing.span("render_document", "render", images=len(self.images)) as trace:
+            self.doc.render(self.context)
+            self.doc.save(output)
+            trace["bytes"] = os.path.getsize(output) if isinstance(output, str) else output.tell()
 
 def main():
     """Main function to run the document generator."""
@@ -0,0 +1,126 @@
+import importlib.util
+import logging
+import os
+import time
+from typing import Callable, Dict, List
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def _read_openpyxl(path) -> pd.DataFrame:
+    return pd.read_excel(path, engine="openpyxl")
+
+
+def _read_openpyxl_stream(path) -> pd.DataFrame:
+    """
+    Stream the first sheet as plain values (no cell objects) and let pandas' parser infer the
+    column types, so the result matches pd.read_excel.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        rows = [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+    # Same trimming and padding as pandas' openpyxl reader
+    for row in rows:
+        while row and row[-1] is None:
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        return pd.DataFrame()
+    width = max(len(row) for row in rows)
+    # Empty cells become "" as in pandas' reader, so the parser reads them as NaN rather than None
+    rows = [["" if value is None else value for value in row] + [""] * (width - len(row)) for row in rows]
+
+    return TextParser(rows, header=0).read()
+
+
+def _read_calamine(path) -> pd.DataFrame:
+    return pd.read_excel(path, engine="calamine")
+
+
+# Backend name -> reader, fastest first; "auto" picks the first available one
+BACKENDS: Dict[str, Callable] = {
+    "calamine": _read_calamine,
+    "openpyxl_stream": _read_openpyxl_stream,
+    "openpyxl": _read_openpyxl,
+}
+
+# Module each backend needs
+REQUIREMENTS = {
+    "calamine": "python_calamine",
+    "openpyxl_stream": "openpyxl",
+    "openpyxl": "openpyxl",
+}
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKENDS if importlib.util.find_spec(REQUIREMENTS[name]) is not None]
+
+
+def resolve_backend(backend: str = "auto") -> str:
+    if backend == "auto":
+        available = available_backends()
+        if not available:
+            raise ImportError("No Excel reader installed (pip install openpyxl or python-calamine)")
+        return available[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ingestion backend {backend!r}, expected 'auto' or one of {list(BACKENDS)}")
+    return backend
+
+
+def read_workbook(path, backend: str = "auto") -> pd.DataFrame:
+    """
+    Read the first sheet of a survey workbook (path or file-like object) into a DataFrame,
+    the same frame pd.read_excel(path) returns.
+    """
+    backend = resolve_backend(backend)
+    start = time.perf_counter()
+    with tracing.span("read_workbook", "ingest", backend=backend) as trace:
+        if isinstance(path, str):
+            trace["bytes"] = os.path.getsize(path)
+        df = BACKENDS[backend](path)
+        trace["rows"], trace["columns"] = df.shape
+    logger.info(f"Read {df.shape[0]} rows with {backend} in {time.perf_counter() - start:.2f}s")
+    return df
+
+
+def main():
+    """Benchmark the ingestion backends on survey workbooks."""
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("paths", nargs="*", help="workbooks to read (default: sample_data/*.xlsx)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend and file; the best is reported")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob("sample_data/*.xlsx"))
+    backends = available_backends()
+    print(f"{'file':<32} {'backend':<16} {'best (s)':>9} {'speedup':>8}  same frame")
+    for path in paths:
+        reference, reference_time = None, None
+        # openpyxl (pd.read_excel's default) first, as the reference for speed and content
+        for backend in sorted(backends, key=lambda name: name != "openpyxl"):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                df = BACKENDS[backend](path)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            if reference is None:
+                reference, reference_time = df, best
+            print(f"{path:<32} {backend:<16} {best:>9.3f} {reference_time / best:>7.1f}x  {df.equals(reference)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,166 @@
 # job_mapping.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Mapping
+
 import numpy as np
 import yaml
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONNAIRE_PATH = os.path.join(SRC_DIR, "questionnaire.yaml")
+ZH_NAMES_PATH = os.path.join(SRC_DIR, "major_job_zh.yaml")
+
+# Snapshot key -> (file, section) it defaults to; the keys are the questionnaire editor's session state keys
+MAP_SOURCES = {
+    "major": ("questionnaire", "11.major"),
+    "major_class": ("questionnaire", "major_class"),
+    "occupation": ("questionnaire", "19.occupation"),
+    "occupation_class": ("questionnaire", "occupation_class"),
+    "major_zh": ("zh", "major"),
+    "job_zh": ("zh", "job"),
+}
+# Factor columns picked in the questionnaire editor; None when not overridden (the report's defaults apply)
+FACTOR_KEYS = ("major_influence", "occupation_influence")
+# Kinds decode lookups are compiled for
+LOOKUP_KINDS = ("major", "major_class", "occupation", "occupation_class")
+# Snapshots of distinct editor overrides kept compiled
+MAX_SNAPSHOTS = 16
+
+
+def _canonical(value):
+    """
+    JSON-ready form of an override or map that does not depend on insertion order. Editor maps may mix
+    int and str codes, which cannot be sorted together, so dicts become [key, value] pairs ordered by repr.
+    """
+    if isinstance(value, Mapping):
+        return [[_canonical(key), _canonical(item)] for key, item in sorted(value.items(), key=lambda pair: repr(pair[0]))]
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def _build_lookup(mapping: dict) -> np.ndarray:
+    """Object array where lookup[code] is the label of code, NaN for unknown codes."""
+    codes = {int(code): name for code, name in mapping.items()
+             if isinstance(code, (int, float)) and not isinstance(code, bool) and float(code).is_integer() and code >= 0}
+    lookup = np.full(max(codes, default=-1) + 1, np.nan, dtype=object)
+    for code, name in codes.items():
+        lookup[code] = name
+    lookup.flags.writeable = False
+    return lookup
+
+
+class MappingSnapshot:
+    """
+    Immutable set of the questionnaire mappings in use: code -> label maps of majors, occupations
+    and their classes, their Chinese names, and the editor's factor columns.
+    Built once from the YAML files plus any questionnaire editor overrides and compiled into
+    lookup arrays, it can be shared by threads and sent to worker processes; `version` identifies
+    its content for caches.
+    """
+
+    def __init__(self, maps: Dict[str, Mapping], factors: Dict[str, list] = None):
+        self._maps = {key: MappingProxyType(dict(maps[key])) for key in MAP_SOURCES}
+        factors = factors or {}
+        self._factors = {key: tuple(factors[key]) if factors.get(key) is not None else None for key in FACTOR_KEYS}
+        payload = json.dumps(_canonical({"maps": self._maps, "factors": self._factors}), default=str)
+        self.version = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        self._lookups = {kind: _build_lookup(self._maps[kind]) for kind in LOOKUP_KINDS}
+
+    def __reduce__(self):
+        # Mapping proxies cannot be pickled; rebuild from plain dicts in the receiving process
+        return (MappingSnapshot, ({key: dict(value) for key, value in self._maps.items()},
+                                  {key: list(value) if value is not None else None for key, value in self._factors.items()}))
+
+    def __getitem__(self, key: str) -> Mapping:
+        """Read-only code -> label map: "major", "major_class", "occupation", "occupation_class", "major_zh" or "job_zh"."""
+        return self._maps[key]
+
+    def factors(self, key: str) -> tuple:
+        """Factor columns chosen in the editor for "major_influence" or "occupation_influence", None if not overridden."""
+        return self._factors[key]
+
+    def lookup(self, kind: str) -> np.ndarray:
+        """Read-only lookup array of "major", "major_class", "occupation" or "occupation_class"."""
+        return self._lookups[kind]
+
+    def decode(self, codes, kind: str) -> np.ndarray:
+        """Vectorized equivalent of applying get_major_name/get_job_name/... to every code."""
+        lookup = self._lookups[kind]
+        codes = np.asarray(codes, dtype=float)
+        labels = np.full(codes.shape, np.nan, dtype=object)
+        with np.errstate(invalid="ignore"):
+            valid = np.isfinite(codes) & (codes >= 0) & (codes < len(lookup)) & (codes == np.floor(codes))
+        labels[valid] = lookup[codes[valid].astype(np.intp)]
+        return labels
+
+
+_files = None
+_snapshots: "OrderedDict[str, MappingSnapshot]" = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def _read_files() -> dict:
+    global _files
+    if _files is None:
+        files = {}
+        for name, path in (("questionnaire", QUESTIONNAIRE_PATH), ("zh", ZH_NAMES_PATH)):
+            with open(path, "r", encoding="utf-8") as f:
+                files[name] = yaml.safe_load(f)
+        _files = files
+    return _files
+
+
+def snapshot(overrides: dict = None) -> MappingSnapshot:
+    """
+    The snapshot of the YAML files with `overrides` ({session state key: value} of the questionnaire
+    editor) applied. Snapshots are compiled once per distinct overrides.
+    """
+    overrides = {key: value for key, value in (overrides or {}).items() if key in MAP_SOURCES or key in FACTOR_KEYS}
+    cache_key = json.dumps(_canonical(overrides), default=str)
+    with _snapshots_lock:
+        if cache_key in _snapshots:
+            _snapshots.move_to_end(cache_key)
+            return _snapshots[cache_key]
+
+    files = _read_files()
+    maps = {key: overrides.get(key, files[source].get(section, {})) for key, (source, section) in MAP_SOURCES.items()}
+    built = MappingSnapshot(maps, {key: overrides.get(key) for key in FACTOR_KEYS})
+    with _snapshots_lock:
+        _snapshots[cache_key] = built
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return built
+
+
+def current_snapshot() -> MappingSnapshot:
+    """
+    The mappings of the calling Streamlit session (questionnaire editor overrides included), or of the
+    YAML files alone outside a Streamlit script. Take it on the script thread and pass it to workers.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return snapshot()
+    return snapshot({key: st.session_state[key] for key in (*MAP_SOURCES, *FACTOR_KEYS) if key in st.session_state})
 
-with open("src/questionnaire.yaml", "r") as file:
-    data = yaml.safe_load(file)
 
-def get_job_name(code):
-    job_names = st.session_state.get("occupation", data["19.occupation"])
-    return job_names.get(code, np.nan)
+# Take the snapshot once (current_snapshot()) and pass it, rather than resolving it for every code
 
-def get_job_class(code):
-    job_class_map= st.session_state.get("occupation_class", data["occupation_class"])
-    return job_class_map.get(code, np.nan)
+def get_job_name(code, mappings: MappingSnapshot):
+    return mappings["occupation"].get(code, np.nan)
 
-def get_major_name(code):
-    """Returns the job name for a given code."""
-    major_name_map = st.session_state.get("major", data["11.major"])
-    return major_name_map.get(code, np.nan)
+def get_job_class(code, mappings: MappingSnapshot):
+    return mappings["occupation_class"].get(code, np.nan)
 
-def get_major_class(code):
-    """Returns the job class for a given code."""
-    major_class_map = st.session_state.get("major_class", data["major_class"])
-    return major_class_map.get(code, np.nan)
+def get_major_name(code, mappings: MappingSnapshot):
+    """Returns the major name for a given code."""
+    return mappings["major"].get(code, np.nan)
 
+def get_major_class(code, mappings: MappingSnapshot):
+    """Returns the major class for a given code."""
+    return mappings["major_class"].get(code, np.nan)
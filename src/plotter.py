@@ -1,3 +1,23 @@
+import asyncio
+import colorsys
+import concurrent.futures
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing.util
+import numbers
+import threading
+from contextlib import contextmanager
+
+import kaleido
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from disk_cache import DiskCache
+import tracing
+
 # import plotly.graph_objects as go
 
 
@@ -73,7 +93,194 @@
 #     fig.write_image(output_path)
 
 
-import plotly.graph_objects as go
+logger = logging.getLogger(__name__)
+
+SCALE = 2
+# Bump when chart styling changes so cached images are re-rendered
+CHART_CACHE_VERSION = 3
+# Rendered PNGs keyed by chart spec hash; set to None to disable
+chart_cache = DiskCache(".cache/charts", max_bytes=128 * 1024 * 1024, suffix=".png")
+
+
+class RenderSession:
+    """
+    One warm Kaleido/Chromium instance kept on a background event loop.
+    Figures are rendered as tabs of the same browser, so only the first chart pays the startup cost.
+    Safe to call from several threads; up to `n_tabs` figures render in parallel.
+    """
+
+    def __init__(self, n_tabs: int = 4):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="kaleido-session", daemon=True)
+        self._thread.start()
+        try:
+            self._kaleido = self._submit(self._open(n_tabs))
+        except Exception:
+            self._stop_loop()
+            raise
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @staticmethod
+    async def _open(n_tabs: int):
+        browser = kaleido.Kaleido(n=n_tabs)
+        await browser.open()
+        return browser
+
+    async def _render_all(self, figs: list[go.Figure]) -> list[bytes]:
+        opts = dict(format='png', scale=SCALE, width=pio.defaults.default_width, height=pio.defaults.default_height)
+        return await asyncio.gather(*(self._kaleido.calc_fig(fig.to_dict(), opts=dict(opts)) for fig in figs))
+
+    def render_many(self, figs: list[go.Figure]) -> list[bytes]:
+        """PNG bytes of every figure, rendered in one batched call."""
+        try:
+            return self._submit(self._render_all(figs))
+        except (asyncio.CancelledError, concurrent.futures.CancelledError) as e:
+            raise RuntimeError("The Kaleido render session was closed during the render") from e
+
+    @staticmethod
+    async def _cancel_pending():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        # Renders still pending (or submitted while stopping) are cancelled, so their callers get an error
+        # instead of waiting forever on a loop that no longer runs
+        self._loop.run_until_complete(self._cancel_pending())
+        self._loop.close()
+
+    def close(self):
+        try:
+            self._submit(self._kaleido.close())
+        finally:
+            self._stop_loop()
+
+
+_session = None
+# render_session blocks currently using the session
+_session_users = 0
+# True when the session was started by a render_session block and stops once no block uses it;
+# a session started by start_render_session is kept until stop_render_session
+_session_scoped = False
+_session_lock = threading.Lock()
+_finalizer_registered = False
+
+
+def _start_locked(n_tabs: int) -> bool:
+    global _session, _finalizer_registered
+    if _session is not None:
+        return False
+    try:
+        with tracing.span("start render session", "chart", n_tabs=n_tabs):
+            _session = RenderSession(n_tabs)
+    except Exception as e:
+        logger.warning(f"Could not start Kaleido render session: {e}")
+        return False
+    if not _finalizer_registered:
+        # Runs at interpreter exit, and also when a multiprocessing worker shuts down (unlike atexit)
+        multiprocessing.util.Finalize(None, stop_render_session, exitpriority=10)
+        _finalizer_registered = True
+    return True
+
+
+def start_render_session(n_tabs: int = 4) -> bool:
+    """
+    Start the process-wide render session if it is not running yet, and keep it until stop_render_session
+    (at the latest when the process exits). Returns True if this call started it. Failures (e.g. Chrome
+    missing) are logged and charts fall back to one Kaleido run per image.
+    """
+    global _session_scoped
+    with _session_lock:
+        _session_scoped = False
+        return _start_locked(n_tabs)
+
+
+def stop_render_session() -> None:
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+@contextmanager
+def render_session(n_tabs: int = 4):
+    """
+    Keep one Kaleido instance warm for the duration of the block, reusing an already running session.
+    Reports rendering at the same time share the session; one this block started is stopped when the
+    last block using it exits.
+    """
+    global _session, _session_users, _session_scoped
+    with _session_lock:
+        if _start_locked(n_tabs):
+            _session_scoped = True
+        _session_users += 1
+    try:
+        yield
+    finally:
+        session = None
+        with _session_lock:
+            _session_users -= 1
+            if _session_users == 0 and _session_scoped:
+                session, _session = _session, None
+                _session_scoped = False
+        if session is not None:
+            session.close()
+
+
+def figure_to_png(fig: go.Figure) -> bytes:
+    """PNG bytes of the figure, through the warm session when one is running."""
+    session = _session
+    if session is None:
+        return fig.to_image(format='png', scale=SCALE)
+    return session.render_many([fig])[0]
+
+
+def _normalize(value):
+    # 3, 3.0 and numpy.float64(3) draw the same chart, so they must hash the same
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def chart_key(spec: dict, backend: str = "plotly") -> str:
+    """Content hash of a chart spec (type, labels, values, titles), the backend and the export settings."""
+    payload = json.dumps({"spec": _normalize(spec), "backend": backend, "scale": SCALE,
+                          "version": CHART_CACHE_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_chart(spec: dict, output_path: str = None, backend: str = "plotly") -> bytes:
+    """
+    Render a chart spec to PNG bytes with the given backend, reusing the cached image of an identical spec.
+    The image is also written to `output_path` when one is given.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown chart backend {backend!r}, expected one of {sorted(BACKENDS)}")
+
+    with tracing.span(spec["chart"], "chart", backend=backend, title=spec.get("title")) as trace:
+        key = chart_key(spec, backend)
+        png = chart_cache.get_bytes(key) if chart_cache is not None else None
+        trace["cached"] = png is not None
+        if png is None:
+            png = BACKENDS[backend](spec)
+            if chart_cache is not None:
+                chart_cache.put_bytes(key, png)
+        trace["bytes"] = len(png)
+
+    if output_path is not None:
+        with open(output_path, "wb") as f:
+            f.write(png)
+    return png
 
 
 def format_label(label: list[str]) -> list[str]:
@@ -84,73 +291,97 @@ def format_label(label: list[str]) -> list[str]:
 def double_bar_chart(
         x_values, school_values:dict, avg_values:dict, 
         title, xtitle, x1name, 
-        x2name, output_path):
+        x2name, output_path=None, backend: str = "plotly"):
 
     school_values = [school_values[value] for value in x_values]
     avg_values = [avg_values[value] for value in x_values]
     x_values = format_label(x_values)
 
+    spec = dict(chart="double_bar", x_values=x_values, school_values=school_values, avg_values=avg_values,
+                title=title, xtitle=xtitle, x1name=x1name, x2name=x2name)
+    return render_chart(spec, output_path, backend)
+
+def _build_double_bar(spec: dict) -> go.Figure:
     # Define explicit colors for better visibility
     colors = ['#1f77b4', '#ff7f0e']  # Blue and orange
     
     fig = go.Figure(data=[
-        go.Bar(name=x1name, x=x_values, y=school_values, marker_color=colors[0]),
-        go.Bar(name=x2name, x=x_values, y=avg_values, marker_color=colors[1])
+        go.Bar(name=spec["x1name"], x=spec["x_values"], y=spec["school_values"], marker_color=colors[0]),
+        go.Bar(name=spec["x2name"], x=spec["x_values"], y=spec["avg_values"], marker_color=colors[1])
     ])
 
     fig.update_layout(
         barmode='group',
-        title=title,
-        xaxis_title=xtitle,
+        title=spec["title"],
+        xaxis_title=spec["xtitle"],
         yaxis_title='Percentage',
         template='plotly_white',  # Use white template for better contrast
         plot_bgcolor='white',
         paper_bgcolor='white'
     )
+    return fig
 
-    # Write with explicit settings for better color handling
-    fig.write_image(output_path, format='png', scale=2)
-
-def pie_chart(labels: list[str], values: dict[str, float], title: str, output_path: str):
+def pie_chart(labels: list[str], values: dict[str, float], title: str, output_path: str = None, backend: str = "plotly"):
 
     values = [values[label] for label in labels]
     labels = format_label(labels)
-    
-    # Define a color palette for pie chart
-    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3', '#54A0FF']
+
+    spec = dict(chart="pie", labels=labels, values=values, title=title)
+    return render_chart(spec, output_path, backend)
+
+# Pie slice colours, shared by both backends so a chart looks the same whichever renders it: the report's
+# palette, then the plotly_white colorway Plotly used to fill slices beyond it (e.g. the 9 stress methods)
+PIE_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3', '#54A0FF',
+              '#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52']
+
+
+def pie_colors(n: int) -> list[str]:
+    """Distinct colours of n slices in label order; slices beyond PIE_COLORS get evenly spread new hues."""
+    extra = [colorsys.hsv_to_rgb((i * 0.618033988749895) % 1, 0.55, 0.9) for i in range(max(0, n - len(PIE_COLORS)))]
+    return PIE_COLORS[:n] + ['#%02x%02x%02x' % tuple(round(c * 255) for c in rgb) for rgb in extra]
+
+
+def _build_pie(spec: dict) -> go.Figure:
+    labels = spec["labels"]
     
     fig = go.Figure(data=[
         go.Pie(
             labels=labels,
-            values=values,
+            values=spec["values"],
             textinfo='label+percent',
             textposition='inside',
             automargin=True,
             pull=[0.02]*len(labels),  # Slightly pull out all slices for better separation
-            marker=dict(colors=colors[:len(labels)])  # Apply color palette
+            marker=dict(colors=pie_colors(len(labels)))  # Apply color palette
         )
     ])
     fig.update_layout(
-        title=title,
+        title=spec["title"],
         legend=dict(orientation="v", x=1, y=0.5),
         margin=dict(t=60, b=60, l=60, r=120),  # Add more right margin for labels
         template='plotly_white',
         plot_bgcolor='white',
         paper_bgcolor='white'
     )
-    fig.write_image(output_path, format='png',scale=2)
+    return fig
 
-def bar_chart(x_values: list[str], y_values: list[float], title: str, xtitle: str, ytitle: str, output_path: str):
+def bar_chart(x_values: list[str], y_values: list[float], title: str, xtitle: str, ytitle: str, output_path: str = None,
+              backend: str = "plotly"):
     # Sort by y_values descending
     x_values = format_label(x_values)
     sorted_pairs = sorted(zip(x_values, y_values), key=lambda x: x[1], reverse=False)
     x_values, y_values = zip(*sorted_pairs)
     x_values = format_label(list(x_values))
-    
+
+    spec = dict(chart="bar", x_values=x_values, y_values=list(y_values), title=title, xtitle=xtitle, ytitle=ytitle)
+    return render_chart(spec, output_path, backend)
+
+def _build_bar(spec: dict) -> go.Figure:
+    y_values = spec["y_values"]
     fig = go.Figure(data=[
         go.Bar(
             x=y_values,
-            y=x_values,
+            y=spec["x_values"],
             orientation='h',
             text=[f"{v:.2f}%" for v in y_values],
             textposition='auto',
@@ -158,11 +389,183 @@ def bar_chart(x_values: list[str], y_values: list[float], title: str, xtitle: st
         )
     ])
     fig.update_layout(
-        title=title,
-        xaxis_title=ytitle,
-        yaxis_title=xtitle,
+        title=spec["title"],
+        xaxis_title=spec["ytitle"],
+        yaxis_title=spec["xtitle"],
+        template='plotly_white',
+        plot_bgcolor='white',
+        paper_bgcolor='white'
+    )
+    return fig
+
+def line_chart(x_values: list, series: dict[str, list[float]], title: str, xtitle: str, ytitle: str,
+               output_path: str = None, backend: str = "plotly"):
+    """One line per series over x_values, e.g. a metric of several answers over the survey years."""
+    names = list(series)
+    spec = dict(chart="line", x_values=[str(x) for x in x_values], names=format_label(names),
+                values=[list(series[name]) for name in names], title=title, xtitle=xtitle, ytitle=ytitle)
+    return render_chart(spec, output_path, backend)
+
+def _build_line(spec: dict) -> go.Figure:
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    fig = go.Figure(data=[
+        go.Scatter(name=name, x=spec["x_values"], y=values, mode='lines+markers', line=dict(color=colors[i % len(colors)]))
+        for i, (name, values) in enumerate(zip(spec["names"], spec["values"]))
+    ])
+    fig.update_layout(
+        title=spec["title"],
+        xaxis_title=spec["xtitle"],
+        yaxis_title=spec["ytitle"],
+        xaxis=dict(type='category'),
         template='plotly_white',
         plot_bgcolor='white',
         paper_bgcolor='white'
     )
-    fig.write_image(output_path, format='png', scale=2)
\ No newline at end of file
+    return fig
+
+BUILDERS = {
+    "double_bar": _build_double_bar,
+    "pie": _build_pie,
+    "bar": _build_bar,
+    "line": _build_line,
+}
+
+
+# Matplotlib (Agg) renderers: same specs, colours and layout as the Plotly builders, without a browser.
+# Figures are created through matplotlib.figure.Figure rather than pyplot, so threads share no global state.
+
+# plotly_white look
+GRID_COLOR = '#EBF0F8'
+TEXT_COLOR = '#2a3f5f'
+
+
+def _matplotlib_figure():
+    try:
+        from matplotlib.figure import Figure
+    except ImportError as e:
+        raise ImportError("The matplotlib chart backend requires matplotlib (pip install matplotlib)") from e
+    # Same pixel size as the Kaleido export once saved at dpi=100*SCALE
+    width, height = pio.defaults.default_width or 700, pio.defaults.default_height or 500
+    # constrained layout keeps the outside legend and rotated labels inside the image
+    return Figure(figsize=(width / 100, height / 100), dpi=100, facecolor='white', layout='constrained')
+
+
+def _style_axes(ax, grid_axis: str) -> None:
+    ax.set_facecolor('white')
+    ax.grid(axis=grid_axis, color=GRID_COLOR, linewidth=1)
+    ax.set_axisbelow(True)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.tick_params(colors=TEXT_COLOR, length=0)
+    ax.xaxis.label.set_color(TEXT_COLOR)
+    ax.yaxis.label.set_color(TEXT_COLOR)
+
+
+def _matplotlib_to_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100 * SCALE, facecolor='white')
+    return buffer.getvalue()
+
+
+def _draw_double_bar(spec: dict):
+    colors = ['#1f77b4', '#ff7f0e']
+    x_values = spec["x_values"]
+    positions = range(len(x_values))
+    width = 0.4
+
+    fig = _matplotlib_figure()
+    ax = fig.add_subplot()
+    ax.bar([p - width / 2 for p in positions], spec["school_values"], width, label=spec["x1name"], color=colors[0])
+    ax.bar([p + width / 2 for p in positions], spec["avg_values"], width, label=spec["x2name"], color=colors[1])
+    # Rotate crowded category labels, as Plotly does automatically
+    crowded = sum(len(str(x)) for x in x_values) > 60
+    ax.set_xticks(list(positions), x_values, rotation=45 if crowded else 0, ha='right' if crowded else 'center')
+    if spec["xtitle"]:
+        ax.set_xlabel(spec["xtitle"])
+    ax.set_ylabel('Percentage')
+    _style_axes(ax, 'y')
+    ax.set_title(spec["title"], loc='left', color=TEXT_COLOR)
+    fig.legend(frameon=False, loc='outside right upper')
+    return fig
+
+
+def _draw_pie(spec: dict):
+    # Plotly draws the largest slice first, clockwise from the top; colours stay attached to their labels
+    slices = sorted(zip(spec["labels"], spec["values"], pie_colors(len(spec["labels"]))), key=lambda x: x[1], reverse=True)
+    labels = [label for label, _, _ in slices]
+    values = [value for _, value, _ in slices]
+    total = sum(values) or 1
+
+    fig = _matplotlib_figure()
+    ax = fig.add_subplot()
+    wedges, _ = ax.pie(
+        values,
+        colors=[color for _, _, color in slices],
+        explode=[0.02] * len(labels),
+        startangle=90,
+        counterclock=False,
+    )
+    # label+percent inside every slice, like textinfo='label+percent'; Plotly hides text of slices too small to hold it
+    for wedge, label, value in zip(wedges, labels, values):
+        if value / total < 0.05:
+            continue
+        angle = math.radians((wedge.theta1 + wedge.theta2) / 2)
+        ax.text(0.65 * math.cos(angle), 0.65 * math.sin(angle), f"{label}\n{value / total:.1%}",
+                ha='center', va='center', fontsize=8, color=TEXT_COLOR)
+    ax.set_aspect('equal')
+    ax.set_title(spec["title"], loc='left', color=TEXT_COLOR)
+    fig.legend(wedges, labels, frameon=False, loc='outside right center')
+    return fig
+
+
+def _draw_bar(spec: dict):
+    y_values = spec["y_values"]
+
+    fig = _matplotlib_figure()
+    ax = fig.add_subplot()
+    bars = ax.barh(spec["x_values"], y_values, color='#1f77b4')
+    ax.bar_label(bars, labels=[f"{v:.2f}%" for v in y_values], padding=3, color=TEXT_COLOR)
+    ax.set_xlabel(spec["ytitle"])
+    ax.set_ylabel(spec["xtitle"])
+    ax.set_xlim(0, max(max(y_values, default=0) * 1.15, 1))
+    _style_axes(ax, 'x')
+    ax.set_title(spec["title"], loc='left', color=TEXT_COLOR)
+    return fig
+
+def _draw_line(spec: dict):
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+    positions = list(range(len(spec["x_values"])))
+
+    fig = _matplotlib_figure()
+    ax = fig.add_subplot()
+    for i, (name, values) in enumerate(zip(spec["names"], spec["values"])):
+        ax.plot(positions, values, marker='o', label=name, color=colors[i % len(colors)])
+    ax.set_xticks(positions, spec["x_values"])
+    ax.set_xlabel(spec["xtitle"])
+    ax.set_ylabel(spec["ytitle"])
+    _style_axes(ax, 'both')
+    ax.set_title(spec["title"], loc='left', color=TEXT_COLOR)
+    fig.legend(frameon=False, loc='outside right upper')
+    return fig
+
+MATPLOTLIB_BUILDERS = {
+    "double_bar": _draw_double_bar,
+    "pie": _draw_pie,
+    "bar": _draw_bar,
+    "line": _draw_line,
+}
+
+
+def _render_plotly(spec: dict) -> bytes:
+    return figure_to_png(BUILDERS[spec["chart"]](spec))
+
+
+def _render_matplotlib(spec: dict) -> bytes:
+    return _matplotlib_to_png(MATPLOTLIB_BUILDERS[spec["chart"]](spec))
+
+
+# Config.chart_backend -> spec renderer
+BACKENDS = {
+    "plotly": _render_plotly,
+    "matplotlib": _render_matplotlib,
+}
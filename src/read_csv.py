@@ -1,36 +1,216 @@
+import os
 import pandas as pd
 import numpy as np
-from mapping import get_major_name, get_major_class, get_job_name, get_job_class
+from mapping import MappingSnapshot, current_snapshot
+from disk_cache import DiskCache, file_digest
+from ingest import read_workbook
+import tracing
+
+MAJOR_COLUMNS = ['target_major1', 'target_major2', 'target_major3', 'dislike_major1', 'dislike_major2', 'dislike_major3']
+JOB_COLUMNS = ['target_occupation1','target_occupation2','target_occupation3', 'dislike_occupation1', 'dislike_occupation2', 'dislike_occupation3']
+# Columns whose values are rewritten from survey codes into labels
+DECODED_COLUMNS = ['gender', 'gba_understanding', 'stem_participation', 'stress_scource', 'stress_lv', 'endure_lv'] + MAJOR_COLUMNS + JOB_COLUMNS
+
+# Bump when the way workbooks are decoded changes, so stale cache entries are not reused
+CACHE_FORMAT_VERSION = 3
+# The raw survey codes of a decoded column are kept next to it, as f"{RAW_PREFIX}{column}"
+RAW_PREFIX = "raw:"
+RAW_COLUMNS = [f"{RAW_PREFIX}{col}" for col in DECODED_COLUMNS]
+
+# Integer dtypes tried for survey codes, smallest first, with their nullable counterpart
+INTEGER_DTYPES = [
+    (np.uint8, "UInt8"), (np.int8, "Int8"), (np.uint16, "UInt16"), (np.int16, "Int16"),
+    (np.uint32, "UInt32"), (np.int32, "Int32"), (np.int64, "Int64"),
+]
+
+# Parsed and decoded workbooks, keyed by file content hash and mapping version
+ingest_cache = DiskCache(".cache/ingest", max_bytes=512 * 1024 * 1024, suffix=".parquet")
+
+
+def ingest_cache_key(path: str, mappings: MappingSnapshot) -> str:
+    return f"{file_digest(path)[:32]}-{mappings.version}-v{CACHE_FORMAT_VERSION}"
+
+
+def compact_codes(column: pd.Series) -> pd.Series:
+    '''
+    Store a float column of whole numbers in the smallest integer dtype holding them, a nullable one
+    when answers are missing (all-missing columns become UInt8). Columns with fractions are returned unchanged.
+    '''
+    values = column.to_numpy()
+    valid = ~np.isnan(values)
+    present = values[valid]
+    if not (np.isfinite(present).all() and (present == np.floor(present)).all()):
+        return column
+    low, high = (present.min(), present.max()) if valid.any() else (0, 0)
+    for dtype, nullable in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            if valid.all():
+                return column.astype(dtype)
+            # Built from data and mask directly, much faster than astype(nullable) on large columns
+            codes = pd.arrays.IntegerArray(np.where(valid, values, 0).astype(dtype), ~valid)
+            return pd.Series(codes, index=column.index, name=column.name)
+    return column
+
+
+def _plain(column: pd.Series) -> pd.Series:
+    # Aggregations run on plain objects, so counts, ordering and crosstabs match the uncompressed data
+    return column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype) else column
+
 
 class csv_reader:
-    def __init__(self, path:str, school_id=None) -> pd.DataFrame:
-        df = pd.read_excel(path)
+    def __init__(self, path, school_id=None, use_cache=True, backend="auto", mappings: MappingSnapshot = None) -> pd.DataFrame:
+        '''
+        path: workbook path, or the already converted data as a DataFrame or pyarrow Table
+        (in-memory data is decoded directly and not cached on disk)
+        mappings: the major/occupation mappings to decode with, the current session's by default
+        '''
+        self.mappings = mappings or current_snapshot()
+        with tracing.span("csv_reader", "ingest", school_id=school_id) as trace:
+            if isinstance(path, (str, os.PathLike)):
+                cache_key = ingest_cache_key(path, self.mappings) if use_cache else None
+                df = self._load_cached(cache_key) if use_cache else None
+                trace["source"] = "workbook"
+                trace["cache"] = "off" if not use_cache else "miss" if df is None else "hit"
+                if df is None:
+                    df = self._load_excel(path, self.mappings, backend)
+                    if use_cache:
+                        self._store_cached(cache_key, df)
+            else:
+                trace["source"] = "memory"
+                df = self._decode(path.to_pandas() if hasattr(path, "to_pandas") else path, self.mappings)
+
+            if school_id:
+                df = df.loc[df["school_id"] == school_id]
+
+            self._set_frame(df)
+            trace["rows"] = self.sample_size
+            if tracing.current_tracer() is not None:
+                # A deep memory_usage walks every string cell, so it is only measured when traced
+                trace["bytes"] = int(self.df.memory_usage(index=False, deep=True).sum())
+
+    def _set_frame(self, df: pd.DataFrame) -> None:
+        '''
+        Install the decoded frame (with its raw code columns) and reset everything derived from it
+        '''
+        self.sample_size = len(df)
+        self.df = df
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
 
+    @df.setter
+    def df(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self.invalidate_cache()
+
+    @property
+    def raw_df(self) -> pd.DataFrame:
+        '''
+        The survey codes: df with every decoded column replaced by its raw codes, built on access
+        '''
+        raw_df = self.df.drop(columns=RAW_COLUMNS)
+        for col in DECODED_COLUMNS:
+            raw_df[col] = self.df[f"{RAW_PREFIX}{col}"]
+        return raw_df
+
+    def raw_codes(self, col: str) -> np.ndarray:
+        '''
+        Survey codes of a column as floats, NaN for missing answers
+        '''
+        if col in DECODED_COLUMNS:
+            col = f"{RAW_PREFIX}{col}"
+        return self.df[col].to_numpy(dtype=float, na_value=np.nan)
+
+    def invalidate_cache(self) -> None:
+        '''
+        Forget every aggregate derived from the frame.
+        Called whenever df is reassigned; call it directly after modifying it in place.
+        '''
+        self._class_matrices = {}
+        self._class_rates = {}
+        self._distributions = {}
+        self._percent_tables = {}
+
+    @staticmethod
+    def _load_excel(path: str, mappings: MappingSnapshot, backend: str = "auto") -> pd.DataFrame:
+        '''
+        Parse the workbook and decode survey codes for the whole file
+        '''
+        return csv_reader._decode(read_workbook(path, backend), mappings)
+
+    @staticmethod
+    def _decode(df: pd.DataFrame, mappings: MappingSnapshot) -> pd.DataFrame:
+        '''
+        Coerce the converted data to numbers and decode survey codes into one compact frame:
+        small integer codes, booleans and categorical labels, with the raw codes of every decoded
+        column kept as a RAW_PREFIX column
+        '''
         df = df.apply(lambda x: pd.to_numeric(x, errors='coerce'))
         df = df.replace(999, np.nan)
         df = df.replace("999", np.nan)
-        
-        if school_id:
-            df = df.loc[df["school_id"] == school_id] 
 
-        self.sample_size = len(df)
-        self.raw_df = df.copy()
+        raw_codes = {f"{RAW_PREFIX}{col}": compact_codes(df[col]) for col in DECODED_COLUMNS}
 
-        df['gender'] = df['gender'].replace({1.0: 'm', 2.0: 'f'})
+        df['gender'] = df['gender'].replace({1.0: 'm', 2.0: 'f'}).astype("category")
         df['gba_understanding'] = df['gba_understanding'].replace({1.0: False, 2.0: False, 3.0: True, 4.0: True}).astype(bool)
         # df['gba_understanding'] = df['gba_understanding'].replace({1.0: False, 2.0: True}).astype(bool)
         df['stem_participation'] = df['stem_participation'].replace({1.0: True, 2.0: False}).astype(bool)
-        df['stress_scource'] = df['stress_scource'].replace({1.0: "personal", 2.0: "external"}).astype(str)
-        df['stress_lv'] = df['stress_lv'].replace({1.0: "none", 2.0:"very_low", 3.0:"low", 4.0: "moderate", 5.0: "high", 6.0: "very_high"}).astype(str)
-        df['endure_lv'] = df['endure_lv'].replace({4.0: "totally_can", 3.0:"mostly_can", 2.0: "mostly_cannot", 1.0:"totally_cannot"}).astype(str)
+        df['stress_scource'] = df['stress_scource'].replace({1.0: "personal", 2.0: "external"}).astype(str).astype("category")
+        df['stress_lv'] = df['stress_lv'].replace({1.0: "none", 2.0:"very_low", 3.0:"low", 4.0: "moderate", 5.0: "high", 6.0: "very_high"}).astype(str).astype("category")
+        df['endure_lv'] = df['endure_lv'].replace({4.0: "totally_can", 3.0:"mostly_can", 2.0: "mostly_cannot", 1.0:"totally_cannot"}).astype(str).astype("category")
 
-        for major in ['target_major1', 'target_major2', 'target_major3', 'dislike_major1', 'dislike_major2', 'dislike_major3']:
-            df[major] = df[major].apply(get_major_name)
-        for job in ['target_occupation1','target_occupation2','target_occupation3', 'dislike_occupation1', 'dislike_occupation2', 'dislike_occupation3']:
-            df[job] = df[job].apply(get_job_name)
+        # One vectorized take per column through the snapshot's compiled lookup arrays
+        for major in MAJOR_COLUMNS:
+            df[major] = pd.Categorical(mappings.decode(df[major], "major"))
+        for job in JOB_COLUMNS:
+            df[job] = pd.Categorical(mappings.decode(df[job], "occupation"))
 
-        self.df = df
-  
+        float_cols = df.select_dtypes(include="float").columns
+        df[float_cols] = df[float_cols].apply(compact_codes)
+        return df.assign(**raw_codes)
+
+    @staticmethod
+    def _load_cached(cache_key: str):
+        path = ingest_cache.get_path(cache_key)
+        if path is None:
+            return None
+        # Parquet keeps the categorical and nullable integer dtypes
+        return pd.read_parquet(path)
+
+    @staticmethod
+    def _store_cached(cache_key: str, df: pd.DataFrame) -> None:
+        ingest_cache.store(cache_key, lambda path: df.to_parquet(path))
+
+    @staticmethod
+    def clear_cache() -> None:
+        '''
+        Drop every cached workbook, e.g. after changing how workbooks are decoded
+        '''
+        ingest_cache.clear()
+
+    def select_school(self, school_id) -> "csv_reader":
+        '''
+        Return a reader restricted to one school, reusing the already parsed and decoded frames
+        '''
+        return self.select_rows(self.df["school_id"] == school_id)
+
+    def select_rows(self, mask) -> "csv_reader":
+        '''
+        Return a reader restricted to the rows of a boolean mask, reusing the already parsed and decoded frames
+        '''
+        reader = csv_reader.__new__(csv_reader)
+        reader.mappings = self.mappings
+        reader._set_frame(self.df.loc[mask])
+        return reader
+
+    def split_by_school(self) -> dict:
+        '''
+        Split the loaded dataset into one reader per school_id
+        '''
+        school_ids = self.df["school_id"].dropna().unique()
+        return {int(school_id): self.select_school(school_id) for school_id in sorted(school_ids)}
     
     def combine_target(self, target_cols: list, target: str):
         '''
@@ -43,61 +223,108 @@ class csv_reader:
             value_name=target
         ).dropna(subset=[target])
 
-        return combined_df
+        return combined_df.apply(_plain)
     
     def get_distribution(self, combined_df, target: str, group_by_col: str = None):
         if combined_df is None:
             combined_df = self.df
             
         if group_by_col:
-            dis_df = pd.crosstab(combined_df[target], combined_df[group_by_col])
+            dis_df = pd.crosstab(_plain(combined_df[target]), _plain(combined_df[group_by_col]))
 
             # Count unique IDs for each gender
             unique_ids = combined_df.drop_duplicates(subset=['id'])
-            groups_count = unique_ids[group_by_col].value_counts()
+            groups_count = _plain(unique_ids[group_by_col]).value_counts()
 
             dis_df = (dis_df.div(groups_count, axis=1) * 100).round(2)
 
             return dis_df
 
-        dis_df = combined_df[target].value_counts().reset_index()
+        if combined_df is self.df:
+            # Single-column distributions of the reader's own frame are aggregated once per column
+            if target not in self._distributions:
+                self._distributions[target] = self._value_distribution(combined_df, target)
+            return self._distributions[target].copy()
+
+        return self._value_distribution(combined_df, target)
+
+    def _value_distribution(self, combined_df, target: str) -> pd.DataFrame:
+        dis_df = _plain(combined_df[target]).value_counts().reset_index()
         dis_df['percentage'] = (dis_df['count'] / self.sample_size) * 100
         return dis_df.drop(columns='count')
 
     def sort_distribution(self, dis_df) -> list[pd.DataFrame]:
         return {col: dis_df.iloc[:, i].sort_values(ascending=False).to_frame().reset_index() for i, col in enumerate(dis_df.columns)}
 
+    def topk_groupby(self, target_cols: list, target: str, group_by_col: str, k: int) -> dict:
+        '''
+        The k most frequent answers across target_cols, overall ("all") and for every value of group_by_col
+        '''
+        combined_df = self.combine_target(target_cols, target)
+        dis_df = self.get_distribution(combined_df, target, group_by_col)
+
+        groupby_results = self.sort_distribution(dis_df)
+        all_result = self.get_distribution(combined_df, target)
+
+        ret = {"all": all_result[target].head(k).tolist()}
+        for group, df in groupby_results.items():
+            ret[group] = df[target].head(k).tolist()
+        return ret
+
+    @property
+    def columns(self) -> list:
+        return self.df.columns.tolist()
+
+    def count(self, col: str, value) -> int:
+        '''
+        Number of rows whose col equals value
+        '''
+        return int((self.df[col] == value).sum())
+
+    def class_membership(self, major=True) -> pd.DataFrame:
+        '''
+        Boolean matrix of respondents x major (or occupation) classes.
+        A cell is True when any of the respondent's three target majors/occupations belongs to that class.
+        Built once per reader.
+        '''
+        if major not in self._class_matrices:
+            target_cols = MAJOR_COLUMNS[:3] if major else JOB_COLUMNS[:3]
+            kind = "major_class" if major else "occupation_class"
+
+            class_labels = np.column_stack([self.mappings.decode(self.raw_codes(col), kind) for col in target_cols])
+            classes = sorted({label for label in self.mappings.lookup(kind) if isinstance(label, str)})
+
+            matrix = np.zeros((len(class_labels), len(classes)), dtype=bool)
+            for i, target_class in enumerate(classes):
+                matrix[:, i] = (class_labels == target_class).any(axis=1)
+            self._class_matrices[major] = pd.DataFrame(matrix, index=self.df.index, columns=classes)
+
+        return self._class_matrices[major]
+
+    def class_match_rates(self, groupby: str, major=True) -> pd.DataFrame:
+        '''
+        Percentage of respondents having each class, for every value of the groupby column.
+        Rows are groupby values, columns are classes.
+        '''
+        if (groupby, major) not in self._class_rates:
+            membership = self.class_membership(major)
+            rates = membership.groupby(self.df[groupby]).mean().mul(100).round(1)
+            self._class_rates[(groupby, major)] = rates
+
+        return self._class_rates[(groupby, major)]
+
     def check_class_match(self, target_class: str, groupby: str, major=True) -> tuple:
         '''
-        Create a column indicating whether the row's major/job preference belongs to the target class,
-        and return the distribution of this column grouped by the specified groupby column.
+        Return the percentage of rows whose major/job preferences include the target class,
+        for rows where the "groupby" column is True and where it is False.
         The "groupby" column is a boolean collumn
         '''
-        matches = []
-        if major:
-            for majors in ['target_major1', 'target_major2', 'target_major3']:
-                # matches in all target
-                matches.append(self.raw_df[majors].apply(lambda x: get_major_class(x) == target_class))
-            # OR operation to check if any of the target majors match the target class
-            self.df[f"have_{target_class}"] = sum(matches) > 0
-
-        else:
-            for jobs in ['target_occupation1', 'target_occupation2', 'target_occupation3']:
-                matches.append(self.raw_df[jobs].apply(lambda x: get_job_class(x) == target_class))
-            self.df[f"have_{target_class}"] = sum(matches) > 0
-
-        # Group by the specified column and count occurrences of True/False
-        distribution = self.df[f"have_{target_class}"].groupby(self.df[groupby]).value_counts(normalize=True)
-        distribution = distribution.mul(100).round(1).to_frame().reset_index()
-
-        # Get the proportion of that have the target class
-        distribution = distribution[distribution[f"have_{target_class}"] == True]
-        
-        have_groupby = distribution[(distribution[groupby] == True)]['proportion'].values
-        have_groupby = have_groupby[0].item() if len(have_groupby) > 0 else 0.0
+        rates = self.class_match_rates(groupby, major)
+        if target_class not in rates.columns:
+            return 0.0, 0.0
 
-        no_groupby = distribution[(distribution[groupby] == False)]['proportion'].values
-        no_groupby = no_groupby[0].item() if len(no_groupby) > 0 else 0.0
+        have_groupby = float(rates[target_class].get(True, 0.0))
+        no_groupby = float(rates[target_class].get(False, 0.0))
 
         return have_groupby, no_groupby
 
@@ -106,6 +333,20 @@ class csv_reader:
         return a dict {target_value0: protion0},
         protion0 is the protion of rows in self.df that its target_col equal to target_value0 in target_values
         '''
+        table = self.percent_table(target_col, drop_zero)
+
+        # if not target_value in target_col, set 0
+        return {target_value: table.get(target_value, 0.0) for target_value in target_values}
+
+    def percent_table(self, target_col: str, drop_zero=True) -> dict:
+        '''
+        Map every answer of target_col to its share (in %) among the valid answers, computed once per column
+        '''
+        if (target_col, drop_zero) not in self._percent_tables:
+            self._percent_tables[(target_col, drop_zero)] = self._compute_percent_table(target_col, drop_zero)
+        return self._percent_tables[(target_col, drop_zero)]
+
+    def _compute_percent_table(self, target_col: str, drop_zero: bool) -> dict:
         dis = self.get_distribution(None, target_col)
         if drop_zero:
             dis = dis[dis[target_col] != 0]
@@ -114,13 +355,4 @@ class csv_reader:
         dis["percentage"] = dis["percentage"] / dis["percentage"].sum()
         dis["percentage"] = dis["percentage"].mul(100).round(1)
 
-        ret = {}
-        for target_value in target_values:
-            # if not target_value in target_col, set 0
-            if not (dis[target_col] == target_value).any():
-                ret[target_value] = 0.0
-            else:
-                ret[target_value] = dis[dis[target_col] == target_value]["percentage"].item()
-
-        return ret
-
+        return dict(zip(dis[target_col].tolist(), dis["percentage"].tolist()))
@@ -0,0 +1,122 @@
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from document_generator import Config, DocumentGenerator
+from mapping import current_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Reports generated at the same time; further jobs wait in the queue
+MAX_RUNNING_JOBS = 2
+# Finished jobs kept (with their DOCX bytes) so they can still be downloaded after a rerun or reconnect
+MAX_FINISHED_JOBS = 32
+
+
+@dataclass
+class ReportJob:
+    """A report generated in the background, with its progress and, once done, the DOCX bytes."""
+    id: str
+    config: Config
+    owner: str = None   # id of the Streamlit session that submitted the job; only it may see the job
+    status: str = "queued"   # "queued", "running", "done" or "failed"
+    stage: str = "Queued"
+    progress: float = 0.0
+    events: List[Tuple[float, str, float]] = field(default_factory=list)   # (time, stage, progress)
+    errors: List[str] = field(default_factory=list)
+    result: bytes = None
+    images: Dict[str, bytes] = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, progress: float) -> None:
+        """Progress callback of the DocumentGenerator; called from the generator's threads."""
+        with self._lock:
+            self.stage = stage
+            self.progress = max(self.progress, min(progress, 1.0))
+            self.events.append((time.time(), stage, self.progress))
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+# Module level, so jobs outlive the Streamlit script run (and session) that submitted them
+_executor = ThreadPoolExecutor(max_workers=MAX_RUNNING_JOBS, thread_name_prefix="report-job")
+_jobs: "OrderedDict[str, ReportJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def submit(config: Config, data=None, owner: str = None) -> ReportJob:
+    """
+    Queue the generation of a report; `data` is passed to DocumentGenerator as the converted dataset.
+    The session's questionnaire mappings are taken now, so later edits do not change a queued report.
+    `owner` identifies the submitting session; get() only returns the job to it.
+    """
+    job = ReportJob(id=uuid.uuid4().hex[:12], config=config, owner=owner)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        _forget_finished_jobs()
+    # No Streamlit script context is attached to the worker: the submitting script run may be long over,
+    # so progress and errors only go through the job record
+    _executor.submit(_run, job, data, current_snapshot())
+    return job
+
+
+def get(job_id: str, owner: str = None) -> ReportJob:
+    """Returns the job, or None if it is unknown, was forgotten or belongs to another owner."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return job if job is not None and job.owner == owner else None
+
+
+def _forget_finished_jobs() -> None:
+    finished = [job_id for job_id, job in _jobs.items() if job.finished]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _run(job: ReportJob, data, mappings) -> None:
+    job.status = "running"
+    config = job.config
+    try:
+        output_dir = os.path.dirname(config.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if config.image_dir is not None:
+            os.makedirs(config.image_dir, exist_ok=True)
+
+        generator = DocumentGenerator(config, data=data, progress=job.update, mappings=mappings)
+        # Rendered in memory: jobs of the same school share the default output path
+        output = io.BytesIO()
+        generator.generate_report(output)
+        job.result = output.getvalue()
+        _write_output(config.output_path, job.result, job.id)
+        job.images = generator.images
+        job.errors = generator.errors
+        job.status = "done"
+    except Exception as e:
+        logger.error(f"Report job {job.id} failed: {e}")
+        job.errors.append(str(e))
+        job.update(f"Failed: {e}", job.progress)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+
+
+def _write_output(path: str, content: bytes, job_id: str) -> None:
+    """Write the report to its output path whole, even if another job writes the same path."""
+    tmp_path = f"{path}.{job_id}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment, Template
+
+# Number of distinct templates (by content) kept parsed in memory
+MAX_TEMPLATES = 8
+
+
+class _CompilingEnvironment(Environment):
+    """Jinja environment that compiles every distinct template source only once."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compiled: Dict[str, Template] = {}
+        self._compiled_lock = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+
+        with self._compiled_lock:
+            template = self._compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            with self._compiled_lock:
+                self._compiled[source] = template
+        return template
+
+
+class ReportTemplate:
+    """
+    A .docx template read, patched and compiled once, then rendered any number of times.
+    Every new_document() is a fresh DocxTemplate over the in-memory file; the patched XML of
+    the body, headers and footers and their compiled Jinja templates are shared between them.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.jinja_env = _CompilingEnvironment()
+        self._patched: Dict[str, str] = {}
+        self._patched_lock = threading.Lock()
+
+    def patched_xml(self, src_xml: str, doc: DocxTemplate) -> str:
+        with self._patched_lock:
+            patched = self._patched.get(src_xml)
+        if patched is None:
+            patched = DocxTemplate.patch_xml(doc, src_xml)
+            with self._patched_lock:
+                self._patched[src_xml] = patched
+        return patched
+
+    def new_document(self) -> DocxTemplate:
+        return _SharedDocxTemplate(self)
+
+
+class _SharedDocxTemplate(DocxTemplate):
+    """DocxTemplate reusing the patched XML and compiled Jinja templates of its ReportTemplate."""
+
+    def __init__(self, template: ReportTemplate):
+        super().__init__(io.BytesIO(template.data))
+        self._template = template
+
+    def patch_xml(self, src_xml):
+        return self._template.patched_xml(src_xml, self)
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # The shared environment is compiled without autoescape, so it is only used by default renders
+        if jinja_env is None and not autoescape:
+            jinja_env = self._template.jinja_env
+        super().render(context, jinja_env, autoescape)
+
+
+_templates: "OrderedDict[str, ReportTemplate]" = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def load_template(path: str) -> ReportTemplate:
+    """
+    Returns the parsed template of `path`, shared by every report rendered from the same file content.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    with _templates_lock:
+        template = _templates.get(digest)
+        if template is None:
+            template = ReportTemplate(data)
+            _templates[digest] = template
+            while len(_templates) > MAX_TEMPLATES:
+                _templates.popitem(last=False)
+        else:
+            _templates.move_to_end(digest)
+    return template
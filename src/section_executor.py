@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Task:
+    """A node of the report DAG. `fn` receives {dependency name: result} and may be a coroutine function."""
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: List[str] = field(default_factory=list)
+    error_message: str = None
+
+
+class SectionExecutor:
+    """
+    Runs a small DAG of report tasks.
+    Coroutine tasks (LLM calls) run on one event loop, blocking tasks (aggregation, chart
+    rendering) on a thread pool, so independent work of different sections overlaps.
+    A failed task is logged and every task depending on it is skipped.
+    """
+
+    def __init__(self, max_workers: int = 4, on_task_done: Callable[[str, bool], None] = None):
+        """`on_task_done(name, succeeded)` is called as every task finishes, failed or skipped."""
+        self.max_workers = max_workers
+        self.on_task_done = on_task_done
+        self.tasks: Dict[str, Task] = {}
+        self.errors: List[str] = []
+
+    def add(self, name: str, fn: Callable, deps: List[str] = (), error_message: str = None) -> None:
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task: {name}")
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+        self.tasks[name] = Task(name, fn, list(deps), error_message)
+
+    def run(self) -> Dict[str, Any]:
+        """Run every task; returns {name: result} of the successful tasks, in the order they were added."""
+        results = asyncio.run(self._run())
+        return {name: results[name] for name in self.tasks if name in results}
+
+    async def _run(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        # Worker threads share the Streamlit script context so st.error keeps working
+        script_ctx = get_script_run_ctx(suppress_warning=True)
+
+        def attach_context():
+            if script_ctx is not None:
+                add_script_run_ctx(threading.current_thread(), script_ctx)
+
+        results: Dict[str, Any] = {}
+        failed = set()
+        pending = dict(self.tasks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, initializer=attach_context) as pool:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    if any(dep in failed for dep in task.deps):
+                        logger.warning(f"Skipping {name}: a dependency failed")
+                        failed.add(name)
+                        del pending[name]
+                        self._notify(name, False)
+                    elif all(dep in results for dep in task.deps):
+                        dep_results = {dep: results[dep] for dep in task.deps}
+                        if inspect.iscoroutinefunction(task.fn):
+                            future = asyncio.ensure_future(self._run_async(task, dep_results))
+                        else:
+                            # Context variables (the active tracer) are not inherited by pool threads otherwise
+                            future = loop.run_in_executor(pool, contextvars.copy_context().run, self._run_sync, task, dep_results)
+                        running[future] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        failed.add(name)
+                        message = f"{self.tasks[name].error_message or f'Error in {name}'}: {e}"
+                        logger.error(message)
+                        self.errors.append(message)
+                    self._notify(name, name in results)
+
+        return results
+
+    @staticmethod
+    def _run_sync(task: Task, dep_results: Dict[str, Any]) -> Any:
+        with tracing.span(task.name, "section"):
+            return task.fn(dep_results)
+
+    @staticmethod
+    async def _run_async(task: Task, dep_results: Dict[str, Any]) -> Any:
+        with tracing.span(task.name, "section"):
+            return await task.fn(dep_results)
+
+    def _notify(self, name: str, succeeded: bool) -> None:
+        if self.on_task_done is None:
+            return
+        try:
+            self.on_task_done(name, succeeded)
+        except Exception as e:
+            logger.warning(f"Progress callback failed for {name}: {e}")
@@ -3,14 +3,16 @@ import os
 import sys
 import pandas as pd
 from pathlib import Path
-import tempfile
+import hashlib
 import shutil
 import logging
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from document_generator import DocumentGenerator, Config
 from questionnaire_editor import mapping_editor_page
-from data_converter import DataConverter
+from data_converter import convert_upload
+import report_jobs
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import datetime
 
 # Configure logging
@@ -64,45 +66,102 @@ def display_validation_errors(validation_results: list[dict]) -> None:
         st.error("An error occurred while displaying validation errors.")
         st.write(traceback.format_exc())
 
-def validate_excel_and_get_path(uploaded_file_bytes) -> tuple[str | None, bool]:
+def validate_excel(uploaded_file_bytes) -> tuple[pd.DataFrame | None, bool]:
+    """Validate and convert the uploaded workbook in memory; returns (converted data, ok)."""
     if not uploaded_file_bytes:
         return None, False
 
-    temp_fd, temp_path = tempfile.mkstemp(suffix=".xlsx")
-    with os.fdopen(temp_fd, "wb") as tmp:
-        tmp.write(uploaded_file_bytes)
-
     try:
-        converter = DataConverter(temp_path)
-        missing_col = converter.check_all_columns_exist()
+        # Cached per upload content, so widget reruns do not re-process the workbook
+        converted_data, missing_col, validate_result = convert_upload(uploaded_file_bytes)
         
         if missing_col:
             st.warning("The following required columns are missing:")
             st.write(missing_col)
-            os.remove(temp_path) # Clean up the temp file if validation fails
             return None, False
         else:
-            # Convert column names and values
-            validate_result = converter.convert_all()
             display_validation_errors(validate_result)
-            converter.convert_columns_name()
-            
-            # Save the converted data to a new temporary file
-            converted_fd, converted_path = tempfile.mkstemp(suffix=".xlsx")
-            os.close(converted_fd)  # Close the file descriptor as pandas will handle the file
-            converter.df.to_excel(converted_path, index=False)
-            
-            # Clean up the original temp file
-            os.remove(temp_path)
-            
-            return converted_path, True
+            # The converted frame goes straight to the report generator, no intermediate workbook
+            return converted_data, True
 
     except Exception as e:
         st.error(f"Error processing Excel file: {e}")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         return None, False
 
+def save_uploaded_template(data: bytes) -> str:
+    """Keep an uploaded template on disk (by content) for as long as background jobs may read it."""
+    path = os.path.join(".cache", "templates", f"{hashlib.sha256(data).hexdigest()}.docx")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+def show_report_job(job: report_jobs.ReportJob) -> None:
+    """Download button, generated charts and errors of a finished report job."""
+    config = job.config
+    if job.status == "failed":
+        st.error(f"❌ Error generating report: {job.errors[-1] if job.errors else 'unknown error'}")
+        # Show detailed error in expander
+        with st.expander("Show Error Details"):
+            st.code("\n".join(job.errors))
+        return
+
+    st.success("✅ Report generated successfully!")
+    for message in job.errors:
+        st.warning(message)
+
+    # Provide download link
+    st.download_button(
+        label="📥 Download Report",
+        data=job.result,
+        file_name=f"{config.school_name}_Survey_Report_{config.year}.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        use_container_width=True
+    )
+
+    # Show generated images
+    st.subheader("📊 Generated Visualizations")
+    image_files = [
+        "major_factors.png",
+        "occpuation_factors.png",
+        "stem_major.png",
+        "stem_job.png",
+        "stress_sources.png",
+        "stress_level_distribution.png",
+        "endure_level_distribution.png",
+        "stress_method.png"
+    ]
+
+    cols = st.columns(2)
+    for i, img_file in enumerate(image_files):
+        if img_file in job.images:
+            with cols[i % 2]:
+                st.image(job.images[img_file], caption=img_file.replace("_", " ").title(), use_container_width=True)
+
+def session_id() -> str:
+    """Id of the current browser session; report jobs are only shown to the session that submitted them."""
+    return get_script_run_ctx().session_id
+
+@st.fragment(run_every=1)
+def report_job_progress(job_id: str) -> None:
+    """Polls a running report job; reruns the page once it finishes."""
+    job = report_jobs.get(job_id, owner=session_id())
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=job.stage)
+
+def report_job_panel(job_id: str) -> None:
+    job = report_jobs.get(job_id, owner=session_id())
+    if job is None:
+        st.info("The requested report is no longer available. Please generate it again.")
+        return
+    st.header("📄 Report")
+    if job.finished:
+        show_report_job(job)
+    else:
+        report_job_progress(job_id)
+
 def report_generator_page():
     st.title("📊 School Survey Report Generator")
     st.markdown("Generate comprehensive school survey reports with automatic analysis and visualizations.")
@@ -152,12 +211,21 @@ def report_generator_page():
             if OPENROUTER_KEY:
                 os.environ["OPENROUTER_KEY"] = OPENROUTER_KEY
 
+        bypass_llm_cache = False
+        if llm_choice != "Disabled":
+            bypass_llm_cache = st.sidebar.checkbox("Regenerate insights", value=False, help="Ignore previously cached LLM responses for identical prompts.")
+
+    chart_backend = st.sidebar.selectbox(
+        "Chart Renderer",
+        ["plotly", "matplotlib"],
+        help="matplotlib renders charts without a headless Chromium: faster startup and lower memory use.",
+    )
 
     # File paths
     with st.sidebar.expander("File and Output Paths", expanded=False):
         template_path = st.text_input("Template Path", value="doc/template.docx")
         output_path = st.text_input("Output Path", value=f"output/report_{school_id}_{school_name}.docx")
-        image_dir = st.text_input("Image Directory", value="img")
+        image_dir = st.text_input("Image Directory", value="", help="Optional folder to also save the chart images to. Leave empty to keep them in memory.")
 
 
     # File upload section
@@ -194,16 +262,16 @@ def report_generator_page():
         st.subheader("Data File")
         data_file = st.file_uploader("Upload Data File (.xlsx)", type=['xlsx', 'xls'], key="data_file_uploader")
 
-    temp_data_path_for_report = None
+    converted_data = None
     excel_format_ok = False
     if data_file:
-        temp_data_path_for_report, excel_format_ok = validate_excel_and_get_path(data_file.getvalue())
+        converted_data, excel_format_ok = validate_excel(data_file.getvalue())
 
-    if excel_format_ok and temp_data_path_for_report and os.path.exists(temp_data_path_for_report):
+    if excel_format_ok and converted_data is not None:
         # Display first 5 rows of the converted data
         with st.expander("📊 Data Preview (First 5 Rows)", expanded=False):
             try:
-                df_preview = pd.read_excel(temp_data_path_for_report)
+                st.dataframe(converted_data.head())
             except Exception as e:
                 st.warning(f"Could not display data preview: {e}")
         
@@ -211,83 +279,42 @@ def report_generator_page():
         st.header("🚀 Generate Report")
         
         if st.button("Generate Report", use_container_width=True):
-            with st.spinner("Generating report... This may take a few minutes."):
-                try:                    
-                    # Ensure output directory exists
-                    os.makedirs(os.path.dirname(output_path), exist_ok=True)                 
-                    # Ensure image directory exists
-                    os.makedirs(image_dir, exist_ok=True)
-                    
-                    # Handle template file if uploaded
-                    current_template_path = template_path
-                    if template_file:
-                        with tempfile.TemporaryDirectory() as temp_dir_template:
-                            temp_uploaded_template_path = os.path.join(temp_dir_template, "template.docx")
-                            with open(temp_uploaded_template_path, "wb") as f:
-                                f.write(template_file.getvalue())
-                            current_template_path = temp_uploaded_template_path
-
-                    # Create configuration
-                    config = Config(
-                        use_gemini= (llm_choice == "Gemini (Require VPN)"),
-                        use_llm = (llm_choice != "Disabled"),
-                        model_name = model_name,
-                        template_path=current_template_path,
-                        output_path=output_path,
-                        general_data_path=temp_data_path_for_report,
-                        image_dir=image_dir,
-                        year=year,
-                        school_name=school_name,
-                        school_id=school_id
-                    )
-                    
-                    # Generate report
-                    generator = DocumentGenerator(config)
-                    generator.generate_report()
-                    
-                    st.success("✅ Report generated successfully!")
-                    
-                    # Provide download link
-                    if os.path.exists(output_path):
-                        with open(output_path, "rb") as file:
-                            st.download_button(
-                                label="📥 Download Report",
-                                data=file.read(),
-                                file_name=f"{school_name}_Survey_Report_{year}.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                use_container_width=True
-                            )
-                    
-                    # Show generated images
-                    st.subheader("📊 Generated Visualizations")
-                    image_files = [
-                        "major_factors.png",
-                        "occpuation_factors.png",
-                        "stem_major.png",
-                        "stem_job.png",
-                        "stress_sources.png",
-                        "stress_level_distribution.png",
-                        "endure_level_distribution.png",
-                        "stress_method.png"
-                    ]
-                    
-                    cols = st.columns(2)
-                    for i, img_file in enumerate(image_files):
-                        img_path = os.path.join(image_dir, img_file)
-                        if os.path.exists(img_path):
-                            with cols[i % 2]:
-                                st.image(img_path, caption=img_file.replace("_", " ").title(), use_container_width=True)
-                
-                except Exception as e:
-                    st.error(f"❌ Error generating report: {str(e)}")
-                    logger.error(f"Report generation failed: {e}")
-                    
-                    # Show detailed error in expander
-                    with st.expander("Show Error Details"):
-                        st.code(str(e))
+            try:
+                # Handle template file if uploaded
+                current_template_path = template_path
+                if template_file:
+                    current_template_path = save_uploaded_template(template_file.getvalue())
+
+                # Create configuration
+                config = Config(
+                    use_gemini= (llm_choice == "Gemini (Require VPN)"),
+                    use_llm = (llm_choice != "Disabled"),
+                    model_name = model_name,
+                    bypass_llm_cache = bypass_llm_cache,
+                    chart_backend = chart_backend,
+                    template_path=current_template_path,
+                    output_path=output_path,
+                    general_data_path=None,
+                    image_dir=image_dir or None,
+                    year=year,
+                    school_name=school_name,
+                    school_id=school_id
+                )
+
+                # Generate the report in the background; the session keeps the job id across reruns
+                job = report_jobs.submit(config, data=converted_data, owner=session_id())
+                st.session_state["report_job"] = job.id
+
+            except Exception as e:
+                st.error(f"❌ Error generating report: {str(e)}")
+                logger.error(f"Report generation failed: {e}")
 
     elif data_file: # Only show this warning if a file was uploaded but not valid
         st.warning("Please correct the Excel file format before generating the report.")
+
+    job_id = st.session_state.get("report_job")
+    if job_id:
+        report_job_panel(job_id)
     
     # Help section
     st.header("❓ Help & Information")
@@ -0,0 +1,130 @@
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_converter import SCHEMA, SPECIAL_VALUES, ZH_NAMES, DataConverter
+from mapping import snapshot
+
+logger = logging.getLogger(__name__)
+
+# The STEM participation question (before the skill questions in SCHEMA) and the skill questions
+STEM_COLUMN = "參加STEM"
+STEM_SKILL_COLUMNS = ["領導能力", "團隊合作", "創新思維", "科學知識", "解難能力"]
+# Snapshot maps holding the valid major and occupation codes
+KNOWN_CODES = {"major": "major", "job": "occupation"}
+
+
+def _codebooks() -> list:
+    """
+    (columns, answers, codes) of every SCHEMA codebook: the raw (Chinese-labelled) answers and
+    the codes DataConverter turns them into. Majors and occupations are limited to the codes
+    that both major_job_zh.yaml and questionnaire.yaml know, so every answer can be decoded.
+    """
+    mappings = snapshot()
+    codebooks = []
+    for columns, mapping in SCHEMA:
+        if isinstance(mapping, str):
+            known = mappings[KNOWN_CODES[mapping]]
+            # Same reversal as the converter's codebook (a name listed twice keeps its last code)
+            reversed_names = {name: code for code, name in mappings[ZH_NAMES[mapping]].items()}
+            mapping = {name: code for name, code in reversed_names.items() if code in known}
+        codebooks.append((columns, list(mapping.keys()), list(mapping.values())))
+    return codebooks
+
+
+def generate(n_respondents: int, n_schools: int = None, seed: int = 0,
+             missing_rate: float = 0.01, invalid_rate: float = 0.0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Synthetic survey responses, returned as (raw, converted): the workbook schools upload and the
+    frame DataConverter produces from it.
+
+    Every codebook gets its own random answer distribution, so top-k rankings and charts look like
+    real data. `missing_rate` of the coded answers are the "999" (not applicable) answer and
+    `invalid_rate` are answers outside the codebook, reported by validation and converted to NaN.
+    By default there is one school per 500 respondents.
+    """
+    rng = np.random.default_rng(seed)
+    n_schools = n_schools or max(1, n_respondents // 500)
+
+    school_ids = np.sort(rng.integers(1, n_schools + 1, size=n_respondents))
+    # Questionnaire numbers run per school, like the real ones (school 10: 10001, 10002, ...)
+    sequence = np.arange(n_respondents) - np.searchsorted(school_ids, school_ids) + 1
+    raw: Dict[str, np.ndarray] = {"學校編號": school_ids, "問卷編號": school_ids * 100000 + sequence}
+    converted: Dict[str, np.ndarray] = {"學校編號": school_ids, "問卷編號": school_ids * 100000 + sequence}
+
+    for columns, answers, codes in _codebooks():
+        # Typed columns up front: inferring the types of a million-row object frame takes far longer
+        numeric_answers = all(isinstance(answer, int) for answer in answers) and invalid_rate == 0
+        answers = np.array(answers, dtype=np.int64 if numeric_answers else object)
+        codes = np.array(codes, dtype=np.float64 if invalid_rate else np.int64)
+        weights = rng.dirichlet(np.ones(len(answers)))
+        for column in columns:
+            picks = rng.choice(len(answers), size=n_respondents, p=weights)
+            raw_values, codes_values = answers[picks], codes[picks]
+            if column in STEM_SKILL_COLUMNS:
+                # Students without STEM activities answer "0" (not applicable) to the skill questions
+                no_stem = converted[STEM_COLUMN] == 2
+                raw_values[no_stem] = codes_values[no_stem] = 0
+
+            draws = rng.random(n_respondents)
+            missing = draws < missing_rate
+            raw_values[missing] = codes_values[missing] = SPECIAL_VALUES[0]
+            if invalid_rate:
+                invalid = (draws >= missing_rate) & (draws < missing_rate + invalid_rate)
+                raw_values[invalid], codes_values[invalid] = "???", np.nan
+            raw[column], converted[column] = raw_values, codes_values
+
+    return pd.DataFrame(raw), pd.DataFrame(converted).rename(columns=DataConverter.mapping)
+
+
+def dataset_paths(n_respondents: int, directory: str = ".cache/synthetic", seed: int = 0) -> Tuple[str, str]:
+    """Paths of the raw and converted workbooks of a synthetic dataset."""
+    name = f"survey_{n_respondents}_seed{seed}"
+    return os.path.join(directory, f"{name}_raw.xlsx"), os.path.join(directory, f"{name}_converted.xlsx")
+
+
+def write_dataset(n_respondents: int, directory: str = ".cache/synthetic", seed: int = 0,
+                  overwrite: bool = False, **kwargs) -> Tuple[str, str]:
+    """
+    Write the raw and converted workbooks of a synthetic dataset, unless they already exist.
+    Returns their paths. Writing a million-row workbook takes several minutes.
+    """
+    raw_path, converted_path = dataset_paths(n_respondents, directory, seed)
+    if not overwrite and os.path.exists(raw_path) and os.path.exists(converted_path):
+        return raw_path, converted_path
+
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    raw_df, converted_df = generate(n_respondents, seed=seed, **kwargs)
+    raw_df.to_excel(raw_path, index=False)
+    converted_df.to_excel(converted_path, index=False)
+    logger.info(f"Wrote {n_respondents} synthetic responses to {directory} in {time.perf_counter() - start:.1f}s")
+    return raw_path, converted_path
+
+
+def main():
+    """Generate synthetic raw and converted survey workbooks."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("sizes", nargs="*", type=int, default=[1000, 10000, 100000, 1000000], help="numbers of respondents")
+    parser.add_argument("--schools", type=int, default=None, help="number of schools (default: one per 500 respondents)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--missing-rate", type=float, default=0.01, help="share of '999' answers")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of answers outside the codebooks")
+    parser.add_argument("--out", default=".cache/synthetic", help="output directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for size in args.sizes:
+        raw_path, converted_path = write_dataset(size, args.out, args.seed, overwrite=True, n_schools=args.schools,
+                                                 missing_rate=args.missing_rate, invalid_rate=args.invalid_rate)
+        print(raw_path, converted_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@dataclass
+class Span:
+    """One timed stage: ingestion, a report section, a chart, an LLM attempt, the render..."""
+    name: str
+    category: str
+    start: float      # seconds since the tracer was created
+    duration: float   # seconds
+    lane: Tuple[int, int]   # (thread id, asyncio task id or 0): spans of one lane nest properly
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class Tracer:
+    """
+    Collects the spans of one report.
+    Instrumented code calls `span(...)`, which records into the tracer activated for the current
+    context (threads of the SectionExecutor and asyncio tasks inherit it); `hooks` are called
+    with every finished span.
+    """
+
+    def __init__(self, name: str = "report", hooks: List[Callable[[Span], None]] = None):
+        self.name = name
+        self.hooks = list(hooks or [])
+        self.spans: List[Span] = []
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[Span], None]) -> None:
+        self.hooks.append(hook)
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+        for hook in self.hooks:
+            hook(span)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{category: {"count": spans, "seconds": summed duration}}"""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            total = totals.setdefault(span.category, {"count": 0, "seconds": 0.0})
+            total["count"] += 1
+            total["seconds"] += span.duration
+        return totals
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "summary": self.summary(),
+            "spans": [asdict(span) for span in self.spans],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace event format, for chrome://tracing or ui.perfetto.dev."""
+        pid = os.getpid()
+        lanes: Dict[Tuple[int, int], int] = {}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span.start):
+            if span.lane not in lanes:
+                tid = lanes[span.lane] = len(lanes) + 1
+                thread_id, task_id = span.lane
+                lane_name = f"thread {thread_id}" + (f" task {task_id}" if task_id else "")
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": lane_name}})
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": lanes[span.lane],
+                "args": span.args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"name": self.name}}
+
+    def save(self, path: str, format: str = "chrome") -> None:
+        """Write the trace as a Chrome trace ("chrome") or as plain spans with a summary ("json")."""
+        if format not in ("chrome", "json"):
+            raise ValueError(f"Unknown trace format {format!r}, expected 'chrome' or 'json'")
+        trace = self.to_chrome_trace() if format == "chrome" else self.to_json()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, default=str)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("tracer", default=None)
+
+
+def current_tracer() -> Tracer:
+    return _current.get()
+
+
+@contextmanager
+def activate(tracer: Tracer):
+    """Record the spans of the enclosed code (and of the threads and tasks it starts with this context) into `tracer`."""
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+
+
+def _lane() -> Tuple[int, int]:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), id(task) if task is not None else 0
+
+
+@contextmanager
+def span(name: str, category: str, **args):
+    """
+    Time the enclosed stage. Yields the span's args dict, so byte sizes and counts known only at the
+    end can be added to it. Costs next to nothing when no tracer is active.
+    """
+    tracer = _current.get()
+    if tracer is None:
+        yield args
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = repr(e)
+        raise
+    finally:
+        end = time.perf_counter()
+        tracer.record(Span(name, category, start - tracer._origin, end - start, _lane(), args))
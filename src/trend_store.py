@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from aggregates import (CLASS_GROUPBYS, ENDURE_LEVELS, PREFERENCE_GROUPBY, PREFERENCES, STRESS_LEVELS, STRESS_METHODS,
+                        STRESS_SOURCES, AggregateStore, SchoolAggregates)
+import plotter
+
+# school_id of the all-school metrics of a year; school ids are positive
+ALL_SCHOOLS = -1
+# Entries of the stored top-k preference rankings
+TOP_K = 10
+# Distribution metrics hold answers that are not all strings, so they are stored as [answer, percent] pairs
+DISTRIBUTION_PREFIX = "distribution."
+
+
+def school_metrics(aggregates: SchoolAggregates) -> Dict[str, Any]:
+    """
+    The metrics kept per school and year: respondents, the answer distribution of every column, the top
+    preferred and disliked majors/occupations, class match rates and the stress figures of the report.
+    """
+    metrics: Dict[str, Any] = {"respondents": aggregates.sample_size}
+    for col in aggregates.columns:
+        metrics[f"{DISTRIBUTION_PREFIX}{col}"] = aggregates.percent_table(col, drop_zero=False)
+    for target, target_cols in PREFERENCES.items():
+        metrics[f"top.{target}"] = aggregates.topk_groupby(target_cols, target, PREFERENCE_GROUPBY, TOP_K)
+    for groupby in CLASS_GROUPBYS:
+        for kind, groups in aggregates.class_counts.get(groupby, {}).items():
+            classes = sorted({target_class for counts in groups.values() for target_class in counts["classes"]})
+            metrics[f"class_match.{groupby}.{kind}"] = {
+                target_class: list(aggregates.check_class_match(target_class, groupby, major=kind == "major"))
+                for target_class in classes
+            }
+
+    # Same figures as the report's stress sections
+    if "stress_scource" in aggregates.columns:
+        metrics["stress.source"] = aggregates.get_percent("stress_scource", ["personal", "external"])
+    if "stress_lv" in aggregates.columns:
+        metrics["stress.level"] = aggregates.get_percent("stress_lv", STRESS_LEVELS, drop_zero=False)
+    if "endure_lv" in aggregates.columns:
+        metrics["stress.endurance"] = aggregates.get_percent("endure_lv", ENDURE_LEVELS, drop_zero=False)
+    for name, columns in (("stress.sources", STRESS_SOURCES), ("stress.methods", STRESS_METHODS)):
+        metrics[name] = {col: aggregates.get_percent(col, [1.0], drop_zero=False)[1.0]
+                         for col in columns if col in aggregates.columns}
+    return metrics
+
+
+def _encode(metric: str, value) -> str:
+    if metric.startswith(DISTRIBUTION_PREFIX):
+        value = list(value.items())
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _decode(metric: str, text: str):
+    value = json.loads(text)
+    return dict(value) if metric.startswith(DISTRIBUTION_PREFIX) else value
+
+
+class TrendStore:
+    """
+    SQLite store of per-school metrics of every survey year, keyed by (year, school_id, metric), so
+    schools can be compared with their previous years without re-reading old workbooks.
+    Values are JSON; the all-school metrics of a year are stored under school_id ALL_SCHOOLS.
+    A new connection is opened per call so the store can be shared by threads and processes.
+    """
+
+    def __init__(self, path: str = "data/trends.sqlite"):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metrics ("
+                " year INTEGER NOT NULL,"
+                " school_id INTEGER NOT NULL,"
+                " metric TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " PRIMARY KEY (year, school_id, metric)) WITHOUT ROWID"
+            )
+            # Trend queries read one school's metric across years
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_school_metric ON metrics(school_id, metric, year)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS years ("
+                " year INTEGER PRIMARY KEY,"
+                " respondents INTEGER NOT NULL,"
+                " schools INTEGER NOT NULL,"
+                " mapping_version TEXT NOT NULL,"
+                " recorded REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record_year(self, year: int, store: AggregateStore) -> int:
+        """Replace the metrics of `year` with those of every school in the aggregate store; returns the rows written."""
+        rows = []
+        for school_id, aggregates in [(ALL_SCHOOLS, store.total), *store.schools.items()]:
+            for metric, value in school_metrics(aggregates).items():
+                rows.append((year, school_id, metric, _encode(metric, value)))
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM metrics WHERE year = ?", (year,))
+            conn.executemany("INSERT INTO metrics (year, school_id, metric, value) VALUES (?, ?, ?, ?)", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO years (year, respondents, schools, mapping_version, recorded) VALUES (?, ?, ?, ?, ?)",
+                (year, store.total.sample_size, len(store.schools), store.mapping_version, time.time()),
+            )
+        return len(rows)
+
+    def years(self) -> List[int]:
+        with closing(self._connect()) as conn:
+            return [year for (year,) in conn.execute("SELECT year FROM years ORDER BY year")]
+
+    def metrics(self, school_id: int = ALL_SCHOOLS) -> List[str]:
+        """Names of the metrics stored for a school in any year."""
+        with closing(self._connect()) as conn:
+            return [metric for (metric,) in conn.execute(
+                "SELECT DISTINCT metric FROM metrics WHERE school_id = ? ORDER BY metric", (school_id,))]
+
+    def get(self, year: int, school_id: int, metric: str):
+        """Value of a metric, None if it was not recorded."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM metrics WHERE year = ? AND school_id = ? AND metric = ?",
+                               (year, school_id, metric)).fetchone()
+        return None if row is None else _decode(metric, row[0])
+
+    def trend(self, school_id: int, metric: str) -> Dict[int, Any]:
+        """{year: value} of a school's metric over every recorded year."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT year, value FROM metrics WHERE school_id = ? AND metric = ? ORDER BY year",
+                                (school_id, metric)).fetchall()
+        return {year: _decode(metric, value) for year, value in rows}
+
+    def trend_table(self, school_id: int, metric: str, keys: list = None) -> pd.DataFrame:
+        """
+        A school's metric as a table with one row per year: one column per answer (or class, source...)
+        for metrics holding several values, restricted to `keys` when given, or a single "value" column.
+        Top-k rankings get one column per rank and group.
+        """
+        trend = self.trend(school_id, metric)
+        rows = {}
+        for year, value in trend.items():
+            if isinstance(value, dict) and metric.startswith("top."):
+                value = {f"{group} {rank + 1}": label for group, labels in value.items() for rank, label in enumerate(labels)}
+            elif isinstance(value, dict) and metric.startswith("class_match."):
+                value = {f"{target_class} ({label})": rates[i]
+                         for target_class, rates in value.items() for i, label in enumerate(("yes", "no"))}
+            rows[year] = value if isinstance(value, dict) else {"value": value}
+        table = pd.DataFrame.from_dict(rows, orient="index")
+        table.index.name = "year"
+        if keys is not None:
+            table = table.reindex(columns=keys)
+        return table
+
+
+def trend_chart(table: pd.DataFrame, title: str, ytitle: str = "Percentage", output_path: str = None,
+                backend: str = "plotly") -> bytes:
+    """Line chart of a numeric trend table, one line per column."""
+    table = table.apply(pd.to_numeric, errors="coerce")
+    series = {str(col): table[col].fillna(0).tolist() for col in table.columns}
+    return plotter.line_chart(table.index.tolist(), series, title, "Year", ytitle, output_path, backend)
+
+
+def main():
+    """Record a year's per-school metrics, or show a school's trend over the recorded years."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--db", default="data/trends.sqlite", help="trend store path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the metrics of one survey year")
+    record.add_argument("year", type=int)
+    record.add_argument("source", help="aggregate store (.json, see aggregates.py) or converted workbook of the year")
+    show = commands.add_parser("show", help="print a school's metric over the years")
+    show.add_argument("school_id", type=int, help=f"{ALL_SCHOOLS} for all schools")
+    show.add_argument("metric", nargs="?", help="e.g. stress.level, distribution.leadership, top.major; lists the metrics when omitted")
+    show.add_argument("--chart", help="also write a line chart of the trend to this PNG path")
+    show.add_argument("--chart-backend", default="matplotlib", choices=sorted(plotter.BACKENDS))
+    args = parser.parse_args()
+
+    trends = TrendStore(args.db)
+    if args.command == "record":
+        if args.source.endswith(".json"):
+            store = AggregateStore.load(args.source)
+        else:
+            from mapping import snapshot
+            store = AggregateStore(snapshot().version)
+            store.add_workbook(args.source)
+        rows = trends.record_year(args.year, store)
+        print(f"Recorded {rows} metrics of {len(store.schools)} schools for {args.year} in {args.db}")
+        return
+
+    if args.metric is None:
+        print("\n".join(trends.metrics(args.school_id)))
+        return
+    table = trends.trend_table(args.school_id, args.metric)
+    print(table.to_string())
+    if args.chart:
+        trend_chart(table, f"{args.metric} of school {args.school_id}", output_path=args.chart, backend=args.chart_backend)
+        print(f"Chart written to {args.chart}")
+
+
+if __name__ == "__main__":
+    main()
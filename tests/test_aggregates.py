@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import synthetic
+from aggregates import AggregateStore, SchoolAggregates
+from document_generator import Config, DocumentGenerator
+from mapping import snapshot
+from read_csv import csv_reader
+
+COLUMNS = ["gender", "stress_lv", "endure_lv", "stem_participation", "leadership"]
+
+
+@pytest.fixture(scope="module")
+def converted():
+    _, converted = synthetic.generate(1200, n_schools=3, seed=7)
+    return converted
+
+
+def _reader(df):
+    return csv_reader(df.reset_index(drop=True), mappings=snapshot())
+
+
+def _assert_same_counts(aggregates: SchoolAggregates, reader: csv_reader):
+    assert aggregates.sample_size == reader.sample_size
+    for col in COLUMNS:
+        assert aggregates.percent_table(col) == pytest.approx(reader.percent_table(col))
+        assert aggregates.percent_table(col, drop_zero=False) == pytest.approx(reader.percent_table(col, drop_zero=False))
+    assert aggregates.check_class_match("Science", "stem_participation") == pytest.approx(
+        reader.check_class_match("Science", "stem_participation"))
+
+
+def test_disjoint_batches_merge_into_the_full_counts(converted):
+    store = AggregateStore(snapshot().version)
+    for i, rows in enumerate(np.array_split(np.arange(len(converted)), 3)):
+        store.add(_reader(converted.iloc[rows]), f"batch {i}")
+
+    full = _reader(converted)
+    _assert_same_counts(store.total, full)
+    for school_id, school_reader in full.split_by_school().items():
+        _assert_same_counts(store.school(school_id), school_reader)
+
+
+def test_overlapping_batches_count_every_respondent_once(converted):
+    half = len(converted) // 2
+    store = AggregateStore(snapshot().version)
+    store.add(_reader(converted.iloc[:half]), "week 1")
+    store.add(_reader(converted), "weeks 1-2")            # cumulative export
+    store.add(_reader(converted.iloc[half // 2:]), "resend")
+
+    assert store.total.sample_size == len(converted)
+    _assert_same_counts(store.total, _reader(converted))
+
+
+def test_same_batch_is_added_once(converted):
+    store = AggregateStore(snapshot().version)
+
+    assert store.add(_reader(converted), "digest")
+    assert not store.add(_reader(converted), "digest")
+    assert store.total.sample_size == len(converted)
+
+
+def test_rejects_batches_of_other_mappings(converted):
+    store = AggregateStore(snapshot({"major": {1: "Physics"}}).version)
+
+    with pytest.raises(ValueError):
+        store.add(_reader(converted))
+
+
+def test_saved_store_keeps_counts_and_respondents(converted, tmp_path):
+    path = str(tmp_path / "store.json")
+    store = AggregateStore(snapshot().version)
+    store.add(_reader(converted.iloc[:600]), "week 1")
+    store.save(path)
+
+    loaded = AggregateStore.load(path)
+    loaded.add(_reader(converted), "weeks 1-2")
+
+    assert loaded.batches == ["week 1", "weeks 1-2"]
+    _assert_same_counts(loaded.total, _reader(converted))
+
+
+@pytest.mark.parametrize("school_id", [None, 0])
+def test_report_without_a_school_uses_the_total_counts(converted, tmp_path, school_id):
+    path = str(tmp_path / "store.json")
+    store = AggregateStore(snapshot().version)
+    store.add(_reader(converted), "all")
+    store.save(path)
+    config = Config(aggregates_path=path, school_id=school_id, use_llm=False, use_gemini=False, llm_cache_path=None)
+
+    generator = DocumentGenerator(config)
+
+    assert generator.school_reader.sample_size == generator.general_reader.sample_size == len(converted)
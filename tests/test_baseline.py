@@ -0,0 +1,47 @@
+import pytest
+
+import synthetic
+from baseline import BaselineSnapshot
+from mapping import snapshot
+from read_csv import csv_reader
+
+COLUMNS = ["stress_lv", "endure_lv", "exercise"]
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    _, converted = synthetic.generate(300, n_schools=2, seed=3)
+    path = str(tmp_path_factory.mktemp("data") / "all.xlsx")
+    converted.to_excel(path, index=False)
+    return path
+
+
+@pytest.fixture
+def saved(source, tmp_path):
+    reader = csv_reader(source, use_cache=False, mappings=snapshot())
+    path = str(tmp_path / "baseline.json")
+    BaselineSnapshot.from_reader(reader, COLUMNS, 2024, source).save(path)
+    return BaselineSnapshot.load(path), reader
+
+
+def test_saved_snapshot_answers_like_the_reader(saved):
+    baseline, reader = saved
+    levels = ["none", "very_low", "low", "moderate", "high", "very_high"]
+
+    assert baseline.sample_size == reader.sample_size
+    assert baseline.get_percent("stress_lv", levels, drop_zero=False) == reader.get_percent("stress_lv", levels, drop_zero=False)
+
+
+def test_current_only_for_the_same_source_mappings_year_and_columns(saved, source, tmp_path):
+    baseline, _ = saved
+    version = snapshot().version
+
+    assert baseline.is_current(source, version, 2024, COLUMNS)
+    assert not baseline.is_current(source, snapshot({"major": {1: "Physics"}}).version, 2024, COLUMNS)
+    assert not baseline.is_current(source, version, 2025, COLUMNS)
+    assert not baseline.is_current(source, version, 2024, COLUMNS + ["sleep"])
+    assert not baseline.is_current(str(tmp_path / "missing.xlsx"), version, 2024, COLUMNS)
+
+    changed = tmp_path / "changed.xlsx"
+    changed.write_bytes(b"other content")
+    assert not baseline.is_current(str(changed), version, 2024, COLUMNS)
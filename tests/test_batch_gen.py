@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import plotter
+import synthetic
+from batch_gen import generate_all, report_file_name
+from document_generator import Config
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("聖保羅書院", "report_12_聖保羅書院.docx"),
+    ("A/B: C?", "report_12_A_B_ C_.docx"),
+    ("../../etc", "report_12__.._etc.docx"),
+    (" .. ", "report_12.docx"),
+])
+def test_report_file_name_stays_inside_the_output_directory(name, expected):
+    assert report_file_name(12, name) == expected
+
+
+def test_generates_every_named_school_from_one_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(plotter, "chart_cache", None)
+    _, converted = synthetic.generate(400, n_schools=3, seed=5)
+    data_path = str(tmp_path / "all.xlsx")
+    converted.to_excel(data_path, index=False)
+    config = Config(general_data_path=data_path, use_llm=False, use_gemini=False, use_data_cache=False,
+                    llm_cache_path=None, chart_backend="matplotlib", section_workers=2)
+
+    results = generate_all(config, {1: "School/One", 2: "School Two"}, output_dir=str(tmp_path / "out"),
+                           max_workers=2, use_processes=False)
+
+    assert sorted(results) == [1, 2]
+    assert os.path.basename(results[1]) == "report_1_School_One.docx"
+    assert all(os.path.getsize(path) > 0 for path in results.values())
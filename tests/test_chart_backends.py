@@ -0,0 +1,83 @@
+import pytest
+from matplotlib.colors import to_hex
+
+import plotter
+from aggregates import STRESS_METHODS
+
+LABELS = plotter.format_label(STRESS_METHODS)
+SPECS = {
+    "pie": dict(chart="pie", labels=LABELS, values=[9, 8, 7, 6, 5, 4, 3, 2, 1], title="Stress relief"),
+    "double_bar": dict(chart="double_bar", x_values=["Leadership", "Teamwork"], school_values=[60.0, 40.0],
+                       avg_values=[55.0, 45.0], title="Skills", xtitle="Skill", x1name="School", x2name="Average"),
+    "bar": dict(chart="bar", x_values=["Art", "Law", "Physics"], y_values=[10.0, 20.5, 30.25], title="Majors",
+                xtitle="Major", ytitle="Percentage"),
+    "line": dict(chart="line", x_values=["2023", "2024"], names=["High", "Low"], values=[[10.0, 12.0], [5.0, 4.0]],
+                 title="Stress", xtitle="Year", ytitle="Percentage"),
+}
+
+
+def _figures(chart):
+    spec = SPECS[chart]
+    return plotter.BUILDERS[chart](spec), plotter.MATPLOTLIB_BUILDERS[chart](spec)
+
+
+def _legend(fig):
+    return [text.get_text() for legend in fig.legends for text in legend.get_texts()]
+
+
+@pytest.mark.parametrize("chart", sorted(SPECS))
+def test_same_title(chart):
+    plotly_fig, mpl_fig = _figures(chart)
+    assert mpl_fig.axes[0].get_title(loc="left") == plotly_fig.layout.title.text
+
+
+def test_pie_slices_match():
+    plotly_fig, mpl_fig = _figures("pie")
+    pie = plotly_fig.data[0]
+    plotly_colors = dict(zip(pie.labels, pie.marker.colors))
+    plotly_shares = {label: value / sum(pie.values) for label, value in zip(pie.labels, pie.values)}
+
+    ax = mpl_fig.axes[0]
+    labels = _legend(mpl_fig)
+    assert sorted(labels) == sorted(pie.labels)
+    for wedge, label in zip(ax.patches, labels):
+        assert to_hex(wedge.get_facecolor()) == plotly_colors[label].lower()
+        assert (wedge.theta2 - wedge.theta1) / 360 == pytest.approx(plotly_shares[label])
+
+
+def test_pie_slices_have_distinct_colours():
+    colors = _figures("pie")[0].data[0].marker.colors
+    assert len(set(colors)) == len(LABELS)
+    assert len(set(plotter.pie_colors(40))) == 40
+
+
+def test_double_bar_values_match():
+    plotly_fig, mpl_fig = _figures("double_bar")
+    ax = mpl_fig.axes[0]
+    n = len(SPECS["double_bar"]["x_values"])
+    heights = [bar.get_height() for bar in ax.patches]
+
+    assert heights[:n] == list(plotly_fig.data[0].y)
+    assert heights[n:] == list(plotly_fig.data[1].y)
+    assert [tick.get_text() for tick in ax.get_xticklabels()] == list(plotly_fig.data[0].x)
+    assert _legend(mpl_fig) == [trace.name for trace in plotly_fig.data]
+
+
+def test_bar_values_match():
+    plotly_fig, mpl_fig = _figures("bar")
+    ax = mpl_fig.axes[0]
+    bar = plotly_fig.data[0]
+
+    assert [patch.get_width() for patch in ax.patches] == list(bar.x)
+    assert [tick.get_text() for tick in ax.get_yticklabels()] == list(bar.y)
+    assert [text.get_text() for text in ax.texts] == list(bar.text)
+
+
+def test_line_values_match():
+    plotly_fig, mpl_fig = _figures("line")
+    ax = mpl_fig.axes[0]
+
+    assert [list(line.get_ydata()) for line in ax.lines] == [list(trace.y) for trace in plotly_fig.data]
+    assert [to_hex(line.get_color()) for line in ax.lines] == [trace.line.color for trace in plotly_fig.data]
+    assert _legend(mpl_fig) == [trace.name for trace in plotly_fig.data]
+    assert [tick.get_text() for tick in ax.get_xticklabels()] == list(plotly_fig.data[0].x)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import read_csv
+import synthetic
+import tracing
+from disk_cache import DiskCache
+from mapping import snapshot
+from read_csv import DECODED_COLUMNS, RAW_PREFIX, compact_codes, csv_reader
+
+
+def as_floats(column: pd.Series) -> np.ndarray:
+    return column.to_numpy(dtype=float, na_value=np.nan)
+
+
+@pytest.mark.parametrize("values, dtype", [
+    ([1, 2, 4], "uint8"),
+    ([1, np.nan, 4], "UInt8"),
+    ([-1, 0, 1], "int8"),
+    ([0, 300, np.nan], "UInt16"),
+    ([-40000, 1], "int32"),
+    ([np.nan, np.nan], "UInt8"),
+    ([0, 2 ** 40], "int64"),
+])
+def test_whole_numbers_round_trip_through_the_smallest_dtype(values, dtype):
+    column = pd.Series(values, dtype=float, name="code")
+
+    compact = compact_codes(column)
+
+    assert compact.dtype == dtype
+    np.testing.assert_array_equal(as_floats(compact), column.to_numpy())
+    assert compact.name == "code"
+
+
+@pytest.mark.parametrize("values", [[0.5, 1], [1, np.inf], [1, np.nan, 2.25]])
+def test_other_floats_are_kept(values):
+    column = pd.Series(values, dtype=float)
+
+    assert compact_codes(column) is column
+
+
+@pytest.fixture(scope="module")
+def converted():
+    _, converted = synthetic.generate(500, n_schools=3, seed=17)
+    return converted
+
+
+def numeric(converted: pd.DataFrame) -> pd.DataFrame:
+    return converted.apply(lambda x: pd.to_numeric(x, errors="coerce")).replace(999, np.nan)
+
+
+def test_raw_codes_are_the_survey_codes(converted):
+    reader = csv_reader(converted, use_cache=False, mappings=snapshot())
+    expected = numeric(converted)
+
+    for col in DECODED_COLUMNS:
+        np.testing.assert_array_equal(reader.raw_codes(col), expected[col].to_numpy(), err_msg=col)
+
+
+def test_undecoded_columns_keep_their_values(converted):
+    reader = csv_reader(converted, use_cache=False, mappings=snapshot())
+    expected = numeric(converted)
+    compacted = [col for col in reader.df.columns
+                 if not col.startswith(RAW_PREFIX) and pd.api.types.is_integer_dtype(reader.df[col])]
+
+    assert compacted
+    for col in compacted:
+        np.testing.assert_array_equal(as_floats(reader.df[col]), expected[col].to_numpy(dtype=float), err_msg=col)
+
+
+def test_cached_frames_keep_dtypes_and_values(converted, tmp_path, monkeypatch):
+    monkeypatch.setattr(read_csv, "ingest_cache", DiskCache(str(tmp_path / "ingest"), suffix=".parquet"))
+    path = str(tmp_path / "converted.xlsx")
+    converted.to_excel(path, index=False)
+
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer):
+        parsed = csv_reader(path, mappings=snapshot())
+        cached = csv_reader(path, mappings=snapshot())
+
+    assert [span.args["cache"] for span in tracer.spans if span.name == "csv_reader"] == ["miss", "hit"]
+    pd.testing.assert_frame_equal(cached.df, parsed.df)
@@ -0,0 +1,94 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from data_converter import SCHEMA, SPECIAL_VALUES, ZH_NAMES, DataConverter, convert_upload
+from mapping import snapshot
+
+
+def reference_convert(raw: pd.DataFrame, mappings):
+    """The column-by-column conversion DataConverter did before its codebooks were compiled."""
+    df = raw.map(lambda x: x.strip() if isinstance(x, str) else x)
+    df = df.map(lambda x: np.nan if isinstance(x, str) and x.strip() == "" else x)
+    results = []
+    for columns, mapping in SCHEMA:
+        if isinstance(mapping, str):
+            mapping = {v: k for k, v in mappings[ZH_NAMES[mapping]].items()}
+        acceptable_values = set(mapping) | set(SPECIAL_VALUES)
+        result = {}
+        for col in columns:
+            invalid_mask = ~df[col].isin(acceptable_values)
+            invalid_values = df[col][invalid_mask]
+            if not invalid_values.empty:
+                result[col] = list(zip(df.index[invalid_mask].tolist(), invalid_values))
+            df.loc[invalid_mask, col] = np.nan
+            df[col] = df[col].replace(mapping)
+        if result:
+            result["acceptable_values"] = acceptable_values
+        results.append(result)
+    return df.rename(columns=DataConverter.mapping), results
+
+
+def workbook_bytes(df: pd.DataFrame) -> bytes:
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def raw():
+    raw, _ = synthetic.generate(400, n_schools=2, seed=13)
+    # Answers the validation has to report or clean up
+    raw.loc[0, "性別"] = "其他"
+    raw.loc[1, "Banding"] = " Band 1 "
+    raw.loc[2, "壓力程度"] = "   "
+    raw.loc[3, "希望修讀"] = "不存在的學科"
+    raw.loc[4, "領導能力"] = 999
+    raw.loc[5, "大學"] = 2
+    return raw
+
+
+# The old converter relied on replace's silent downcasting
+@pytest.mark.filterwarnings("ignore:Downcasting behavior in `replace`:FutureWarning")
+def test_conversion_matches_the_column_by_column_converter(raw):
+    mappings = snapshot()
+    data = workbook_bytes(raw)
+    expected_df, expected_results = reference_convert(pd.read_excel(io.BytesIO(data)), mappings)
+
+    df, missing_columns, results = convert_upload(data, mappings=mappings)
+
+    assert missing_columns == []
+    assert results == expected_results
+    assert list(df.columns) == list(expected_df.columns)
+    for col in df.columns:
+        assert df[col].astype(object).tolist() == pytest.approx(expected_df[col].astype(object).tolist(), nan_ok=True), col
+
+
+def test_invalid_answers_are_reported_with_their_rows(raw):
+    _, _, results = convert_upload(workbook_bytes(raw), mappings=snapshot())
+    invalid = {col: rows for result in results for col, rows in result.items() if col != "acceptable_values"}
+
+    assert invalid["性別"] == [(0, "其他")]
+    assert invalid["希望修讀"] == [(3, "不存在的學科")]
+    assert invalid["大學"] == [(5, 2)]
+    assert "Banding" not in invalid and "領導能力" not in invalid
+
+
+def test_edited_mappings_change_the_accepted_names(raw):
+    edited = snapshot({"major_zh": {**snapshot()["major_zh"], 99: "不存在的學科"}})
+
+    df, _, results = convert_upload(workbook_bytes(raw), mappings=edited)
+
+    assert df.loc[3, "target_major1"] == 99
+    assert all("希望修讀" not in result for result in results)
+
+
+def test_missing_columns_are_reported_without_converting(raw):
+    df, missing_columns, results = convert_upload(workbook_bytes(raw.drop(columns=["性別", "睡覺"])), mappings=snapshot())
+
+    assert df is None
+    assert missing_columns == ["性別", "睡覺"]
+    assert results == []
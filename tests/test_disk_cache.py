@@ -0,0 +1,55 @@
+import os
+
+from disk_cache import DiskCache
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=300, suffix=".png")
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put_bytes(key, b"x" * 100)
+        os.utime(cache._path(key), (i, i))
+    cache.get_path("a")   # used again, so "b" is now the oldest
+
+    cache.put_bytes("d", b"x" * 100)
+
+    assert cache.get_bytes("b") is None
+    assert cache.get_bytes("a") == b"x" * 100
+    assert cache.get_bytes("d") == b"x" * 100
+
+
+def test_entry_removed_by_another_process_is_a_miss(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), suffix=".png")
+    cache.put_bytes("a", b"png")
+    path = cache.get_path("a")
+    # Evicted between the lookup and the read
+    monkeypatch.setattr(cache, "get_path", lambda key: path)
+    os.remove(path)
+
+    assert cache.get_bytes("a") is None
+
+
+def test_evict_skips_entries_already_gone(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=0, suffix=".png")
+    cache.put_bytes("a", b"png")
+    real_remove = os.remove
+
+    def remove_twice(path):
+        real_remove(path)
+        real_remove(path)   # the second call fails, as when another process evicted it first
+
+    monkeypatch.setattr(os, "remove", remove_twice)
+    cache.put_bytes("b", b"png")
+    monkeypatch.undo()
+    cache.evict()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_clear_keeps_entries_being_written(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put_bytes("a", b"data")
+    (tmp_path / "writing.tmp").write_bytes(b"partial")
+
+    cache.clear()
+
+    assert os.listdir(tmp_path) == ["writing.tmp"]
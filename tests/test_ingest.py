@@ -0,0 +1,63 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from ingest import BACKENDS, available_backends, read_workbook, resolve_backend
+
+# Empty cells must come back as NaN, not None, like pd.read_excel's
+pytestmark = pytest.mark.filterwarnings("error:Mismatched null-like values")
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request):
+    if request.param not in available_backends():
+        pytest.skip(f"{request.param} is not installed")
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def survey_path(tmp_path_factory):
+    raw, _ = synthetic.generate(300, n_schools=2, seed=11)
+    path = tmp_path_factory.mktemp("ingest") / "survey.xlsx"
+    raw.to_excel(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def mixed_path(tmp_path_factory):
+    # Missing values, mixed types and a column that is empty in its last rows
+    df = pd.DataFrame({
+        "school_id": [1, 2, 3, 4],
+        "ratio": [0.5, np.nan, 2.25, 1.0],
+        "name": ["聖保羅書院", None, "B", "C"],
+        "mixed": [1, "two", 3.5, None],
+        "flag": [True, False, None, True],
+        "tail": [1, 2, None, None],
+    })
+    path = tmp_path_factory.mktemp("ingest") / "mixed.xlsx"
+    df.to_excel(path, index=False)
+    return str(path)
+
+
+def test_survey_workbook_matches_read_excel(backend, survey_path):
+    pd.testing.assert_frame_equal(read_workbook(survey_path, backend), pd.read_excel(survey_path))
+
+
+def test_mixed_workbook_matches_read_excel(backend, mixed_path):
+    pd.testing.assert_frame_equal(read_workbook(mixed_path, backend), pd.read_excel(mixed_path))
+
+
+def test_file_objects_are_read_like_paths(backend, mixed_path):
+    with open(mixed_path, "rb") as f:
+        df = read_workbook(io.BytesIO(f.read()), backend)
+
+    pd.testing.assert_frame_equal(df, pd.read_excel(mixed_path))
+
+
+def test_auto_picks_the_fastest_available_backend():
+    assert resolve_backend("auto") == available_backends()[0]
+    with pytest.raises(ValueError):
+        resolve_backend("xlrd")
@@ -0,0 +1,26 @@
+import time
+
+from llm_cache import LLMCache
+
+
+def test_llm_cache_expires_after_ttl(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), ttl=60)
+    key = LLMCache.make_key("openrouter", "model", "prompt")
+    cache.put(key, "answer")
+    assert cache.get(key) == "answer"
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get(key) is None
+
+
+def test_llm_cache_keeps_most_recently_used(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), max_entries=2)
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert [cache.get(key) for key in ("a", "b", "c")] == ["1", None, "3"]
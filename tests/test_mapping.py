@@ -0,0 +1,46 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from mapping import MappingSnapshot, snapshot
+
+
+def test_same_overrides_share_one_snapshot():
+    first = snapshot({"major": {1: "Physics", 2: "Art"}})
+    second = snapshot({"major": {2: "Art", 1: "Physics"}})
+
+    assert first is second
+    assert first.version != snapshot().version
+
+
+def test_version_follows_content():
+    assert snapshot({"major": {1: "Physics"}}).version != snapshot({"major": {1: "Chemistry"}}).version
+    # An int code and a str code are different codes
+    assert snapshot({"major": {1: "Physics"}}).version != snapshot({"major": {"1": "Physics"}}).version
+    assert snapshot({"major_influence": ["tuition_A"]}).version != snapshot().version
+
+
+def test_mixed_key_types_are_accepted():
+    mappings = snapshot({"occupation": {1: "Nurse", "2": "Pilot", 3.0: "Chef"}})
+
+    assert mappings["occupation"]["2"] == "Pilot"
+    assert mappings.decode([1, 3, np.nan, -1], "occupation").tolist()[:2] == ["Nurse", "Chef"]
+
+
+def test_snapshot_is_read_only():
+    mappings = snapshot()
+
+    with pytest.raises(TypeError):
+        mappings["major"][1] = "Changed"
+    with pytest.raises(ValueError):
+        mappings.lookup("major")[0] = "Changed"
+
+
+def test_pickled_snapshot_keeps_its_version():
+    mappings = snapshot({"major": {1: "Physics"}, "major_influence": ["tuition_A"]})
+    copy = pickle.loads(pickle.dumps(mappings))
+
+    assert isinstance(copy, MappingSnapshot)
+    assert copy.version == mappings.version
+    assert copy.factors("major_influence") == ("tuition_A",)
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+import plotly.graph_objects as go
+import pytest
+
+import plotter
+
+
+class SlowKaleido:
+    """Stands in for kaleido.Kaleido: every render takes `delay` seconds."""
+    delay = 0.5
+    instances = []
+
+    def __init__(self, n=1):
+        self.closed = False
+        SlowKaleido.instances.append(self)
+
+    async def open(self):
+        pass
+
+    async def calc_fig(self, fig, opts=None):
+        await asyncio.sleep(self.delay)
+        return b"png"
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def slow_kaleido(monkeypatch):
+    SlowKaleido.instances = []
+    SlowKaleido.delay = 0.5
+    monkeypatch.setattr(plotter.kaleido, "Kaleido", SlowKaleido)
+    yield SlowKaleido
+    plotter.stop_render_session()
+
+
+def test_session_outlives_the_report_that_started_it(slow_kaleido):
+    rendered = []
+    b_inside = threading.Event()
+    a_done = threading.Event()
+
+    def report_a():
+        with plotter.render_session():
+            b_inside.wait(5)
+        a_done.set()
+
+    def report_b():
+        with plotter.render_session():
+            b_inside.set()
+            a_done.wait(5)   # report A exits while B is about to render
+            rendered.append(plotter.figure_to_png(go.Figure()))
+
+    threads = [threading.Thread(target=report_a), threading.Thread(target=report_b)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert rendered == [b"png"]
+    assert len(slow_kaleido.instances) == 1
+    assert slow_kaleido.instances[0].closed
+    assert plotter._session is None
+
+
+def test_session_started_for_the_process_is_kept(slow_kaleido):
+    plotter.start_render_session()
+    with plotter.render_session():
+        pass
+
+    assert plotter._session is not None
+
+
+def test_close_fails_pending_renders(slow_kaleido):
+    slow_kaleido.delay = 30
+    session = plotter.RenderSession()
+    errors = []
+
+    def render():
+        try:
+            session.render_many([go.Figure()])
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=render)
+    thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    session.close()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert time.perf_counter() - start < 5
@@ -0,0 +1,80 @@
+import functools
+import time
+
+import pytest
+
+import conclusion_gen
+import plotter
+import report_jobs
+import synthetic
+from document_generator import Config
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    monkeypatch.setattr(plotter, "chart_cache", None)
+    _, converted = synthetic.generate(300, n_schools=2, seed=3)
+    return converted
+
+
+def make_config(tmp_path, **overrides):
+    settings = dict(output_path=str(tmp_path / "report.docx"), school_id=1, use_llm=False, use_gemini=False,
+                    use_data_cache=False, llm_cache_path=None, chart_backend="matplotlib", section_workers=2)
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def wait(job, timeout=120):
+    deadline = time.time() + timeout
+    while not job.finished:
+        assert time.time() < deadline, f"job still {job.status} at {job.stage}"
+        time.sleep(0.05)
+    return job
+
+
+def test_finished_job_keeps_the_report_and_its_progress(tmp_path, converted):
+    job = wait(report_jobs.submit(make_config(tmp_path), data=converted))
+
+    assert job.status == "done", job.errors
+    assert job.errors == []
+    assert job.result[:2] == b"PK"
+    assert (tmp_path / "report.docx").read_bytes() == job.result
+    assert job.progress == 1.0
+    progress = [event[2] for event in job.events]
+    assert progress == sorted(progress)
+    assert job.finished_at >= job.submitted_at
+
+
+def test_failed_job_records_the_error(tmp_path, converted):
+    config = make_config(tmp_path, template_path=str(tmp_path / "missing.docx"))
+    job = wait(report_jobs.submit(config, data=converted))
+
+    assert job.status == "failed"
+    assert job.result is None
+    assert job.errors and job.stage.startswith("Failed")
+
+
+def test_llm_failures_are_recorded_on_the_job(tmp_path, converted, monkeypatch):
+    async def failing_call(self, prompt):
+        raise ConnectionError("offline")
+
+    def failing_sync_call(self, prompt, output=False):
+        return self._report_failure(ConnectionError("offline"))
+
+    monkeypatch.setattr(conclusion_gen.llm, "__init__", functools.partialmethod(conclusion_gen.llm.__init__, backoff=0))
+    monkeypatch.setattr(conclusion_gen.llm, "_acall", failing_call)
+    monkeypatch.setattr(conclusion_gen.llm, "generate", failing_sync_call)
+    job = wait(report_jobs.submit(make_config(tmp_path, use_llm=True), data=converted))
+
+    assert job.status == "done"
+    assert job.errors
+    assert all(message == "Openrouter call failed: offline" for message in job.errors)
+
+
+def test_jobs_are_only_visible_to_their_owner(tmp_path, converted):
+    job = report_jobs.submit(make_config(tmp_path), data=converted, owner="session-a")
+
+    assert report_jobs.get(job.id, owner="session-a") is job
+    assert report_jobs.get(job.id, owner="session-b") is None
+    assert report_jobs.get(job.id) is None
+    wait(job)
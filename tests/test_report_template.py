@@ -0,0 +1,77 @@
+import io
+
+import docx
+import pytest
+
+import report_template
+from report_template import load_template
+
+
+def write_template(path, text):
+    document = docx.Document()
+    document.add_paragraph(text)
+    document.sections[0].header.paragraphs[0].text = "{{ school }}"
+    document.save(str(path))
+    return str(path)
+
+
+def rendered_text(template, context):
+    document = template.new_document()
+    document.render(context)
+    output = io.BytesIO()
+    document.save(output)
+    rendered = docx.Document(io.BytesIO(output.getvalue()))
+    return rendered.paragraphs[0].text, rendered.sections[0].header.paragraphs[0].text
+
+
+@pytest.fixture(autouse=True)
+def empty_template_cache(monkeypatch):
+    monkeypatch.setattr(report_template, "_templates", type(report_template._templates)())
+
+
+def test_same_content_shares_one_template(tmp_path):
+    first = load_template(write_template(tmp_path / "a.docx", "{{ school }} had {{ respondents }} respondents"))
+    again = load_template(str(tmp_path / "a.docx"))
+    other = load_template(write_template(tmp_path / "b.docx", "{{ year }}"))
+
+    assert again is first
+    assert other is not first
+
+
+def test_documents_of_one_template_render_independently(tmp_path):
+    template = load_template(write_template(tmp_path / "a.docx", "{{ school }} had {{ respondents }} respondents"))
+
+    first = rendered_text(template, {"school": "School A", "respondents": 10})
+    second = rendered_text(template, {"school": "School B", "respondents": 20})
+
+    assert first == ("School A had 10 respondents", "School A")
+    assert second == ("School B had 20 respondents", "School B")
+
+
+def test_xml_is_patched_and_compiled_once(tmp_path, monkeypatch):
+    template = load_template(write_template(tmp_path / "a.docx", "{{ school }}"))
+    rendered_text(template, {"school": "School A"})
+    patched = dict(template._patched)
+    compiled = dict(template.jinja_env._compiled)
+
+    calls = []
+    from_string = report_template.Environment.from_string
+    monkeypatch.setattr(report_template.Environment, "from_string",
+                        lambda self, *args, **kwargs: calls.append(args) or from_string(self, *args, **kwargs))
+    rendered_text(template, {"school": "School B"})
+
+    assert calls == []
+    assert template._patched == patched
+    assert template.jinja_env._compiled.keys() == compiled.keys()
+
+
+def test_least_recently_used_templates_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_template, "MAX_TEMPLATES", 2)
+    paths = [write_template(tmp_path / f"{i}.docx", f"{{{{ school }}}} {i}") for i in range(3)]
+    first = load_template(paths[0])
+    load_template(paths[1])
+    load_template(paths[0])
+    load_template(paths[2])
+
+    assert load_template(paths[0]) is first
+    assert len(report_template._templates) == 2
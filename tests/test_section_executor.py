@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+
+from section_executor import SectionExecutor
+
+
+def test_results_follow_declaration_order():
+    executor = SectionExecutor(max_workers=4)
+    executor.add("slow", lambda r: time.sleep(0.05) or "slow")
+    executor.add("fast", lambda r: "fast")
+
+    async def conclusion(results):
+        await asyncio.sleep(0)
+        return results["fast"] + " conclusion"
+
+    executor.add("llm", conclusion, deps=["fast"])
+
+    results = executor.run()
+
+    assert list(results) == ["slow", "fast", "llm"]
+    assert results["llm"] == "fast conclusion"
+
+
+def test_dependencies_receive_their_inputs_only():
+    executor = SectionExecutor()
+    executor.add("a", lambda r: 1)
+    executor.add("b", lambda r: 2)
+    executor.add("sum", lambda r: r["a"] + r["b"], deps=["a", "b"])
+    executor.add("only_a", lambda r: sorted(r), deps=["a"])
+
+    results = executor.run()
+
+    assert results["sum"] == 3
+    assert results["only_a"] == ["a"]
+
+
+def test_failure_skips_dependents_only():
+    done = []
+    executor = SectionExecutor(on_task_done=lambda name, succeeded: done.append((name, succeeded)))
+    executor.add("broken", lambda r: 1 / 0, error_message="Error processing majors")
+    executor.add("chart", lambda r: "chart", deps=["broken"])
+    executor.add("other", lambda r: "other")
+
+    results = executor.run()
+
+    assert results == {"other": "other"}
+    assert executor.errors == ["Error processing majors: division by zero"]
+    assert sorted(done) == [("broken", False), ("chart", False), ("other", True)]
+
+
+def test_rejects_unknown_and_duplicate_tasks():
+    executor = SectionExecutor()
+    executor.add("a", lambda r: 1)
+
+    with pytest.raises(ValueError):
+        executor.add("a", lambda r: 2)
+    with pytest.raises(ValueError):
+        executor.add("b", lambda r: 2, deps=["missing"])
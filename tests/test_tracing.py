@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+import synthetic
+import tracing
+from read_csv import csv_reader
+from section_executor import SectionExecutor
+
+
+def test_spans_of_executor_threads_and_tasks_reach_the_active_tracer():
+    def section(name):
+        def run(results):
+            with tracing.span(f"{name} chart", "chart", thread=threading.get_ident()):
+                return name
+        return run
+
+    async def conclusion(results):
+        with tracing.span("conclusion", "llm"):
+            await asyncio.sleep(0)
+
+    executor = SectionExecutor(max_workers=3)
+    for name in ("a", "b", "c"):
+        executor.add(name, section(name))
+    executor.add("llm", conclusion, deps=["a"])
+
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer):
+        executor.run()
+
+    charts = [span for span in tracer.spans if span.category == "chart"]
+    assert sorted(span.name for span in charts) == ["a chart", "b chart", "c chart"]
+    assert all(span.args["thread"] != threading.get_ident() for span in charts)
+    assert [span.name for span in tracer.spans if span.category == "llm"] == ["conclusion"]
+    assert tracer.summary()["section"]["count"] == 4
+
+
+def test_spans_outside_an_active_tracer_are_not_recorded():
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer):
+        pass
+    with tracing.span("late", "section"):
+        pass
+
+    assert tracer.spans == []
+    assert tracing.current_tracer() is None
+
+
+def test_failed_stage_keeps_its_error():
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer), pytest.raises(ValueError):
+        with tracing.span("broken", "section"):
+            raise ValueError("bad")
+
+    assert tracer.spans[0].args["error"] == "ValueError('bad')"
+
+
+def test_chrome_trace_export(tmp_path):
+    tracer = tracing.Tracer(name="report 12")
+    with tracing.activate(tracer):
+        with tracing.span("outer", "section", rows=3):
+            with tracing.span("inner", "chart"):
+                pass
+    path = tmp_path / "traces" / "report.trace.json"
+
+    tracer.save(str(path), "chrome")
+
+    trace = json.loads(path.read_text(encoding="utf-8"))
+    assert trace["otherData"] == {"name": "report 12"}
+    metadata = [event for event in trace["traceEvents"] if event["ph"] == "M"]
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert len(metadata) == 1 and metadata[0]["name"] == "thread_name"
+    assert [event["name"] for event in spans] == ["outer", "inner"]
+    outer, inner = spans
+    assert outer["cat"] == "section" and outer["args"] == {"rows": 3}
+    assert outer["tid"] == inner["tid"] == metadata[0]["tid"]
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_unknown_trace_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        tracing.Tracer().save(str(tmp_path / "trace"), "xml")
+
+
+def test_reader_measures_frame_bytes_only_when_traced(monkeypatch):
+    _, converted = synthetic.generate(50, n_schools=1, seed=1)
+
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer):
+        reader = csv_reader(converted, use_cache=False)
+    [ingest] = [span for span in tracer.spans if span.name == "csv_reader"]
+    assert ingest.args["bytes"] == int(reader.df.memory_usage(index=False, deep=True).sum())
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("memory_usage computed without an active tracer")
+
+    monkeypatch.setattr(pd.DataFrame, "memory_usage", unexpected)
+    assert csv_reader(converted, use_cache=False).sample_size == 50
@@ -0,0 +1,51 @@
+import pytest
+
+import synthetic
+from aggregates import AggregateStore
+from mapping import snapshot
+from read_csv import csv_reader
+from trend_store import ALL_SCHOOLS, TrendStore
+
+
+@pytest.fixture(scope="module")
+def stores():
+    stores = {}
+    for year, seed in ((2023, 1), (2024, 2)):
+        _, converted = synthetic.generate(600, n_schools=2, seed=seed)
+        store = AggregateStore(snapshot().version)
+        store.add(csv_reader(converted, mappings=snapshot()))
+        stores[year] = store
+    return stores
+
+
+def test_trend_of_a_school_across_years(stores, tmp_path):
+    trends = TrendStore(str(tmp_path / "trends.sqlite"))
+    for year, store in stores.items():
+        trends.record_year(year, store)
+
+    assert trends.years() == [2023, 2024]
+    assert trends.trend(ALL_SCHOOLS, "respondents") == {2023: 600, 2024: 600}
+    assert trends.trend(1, "respondents") == {year: store.school(1).sample_size for year, store in stores.items()}
+    assert trends.get(2024, 1, "distribution.stress_lv") == stores[2024].school(1).percent_table("stress_lv", drop_zero=False)
+
+    table = trends.trend_table(1, "stress.level", keys=["high", "very_high"])
+    assert table.index.tolist() == [2023, 2024]
+    assert table.columns.tolist() == ["high", "very_high"]
+
+
+def test_all_school_metrics_do_not_collide_with_schools(stores, tmp_path):
+    trends = TrendStore(str(tmp_path / "trends.sqlite"))
+    trends.record_year(2024, stores[2024])
+
+    assert ALL_SCHOOLS not in stores[2024].schools
+    assert trends.get(2024, ALL_SCHOOLS, "respondents") == stores[2024].total.sample_size
+
+
+def test_recording_a_year_again_replaces_it(stores, tmp_path):
+    trends = TrendStore(str(tmp_path / "trends.sqlite"))
+    trends.record_year(2024, stores[2023])
+    trends.record_year(2024, stores[2024])
+
+    assert trends.years() == [2024]
+    assert trends.get(2024, 1, "respondents") == stores[2024].school(1).sample_size
+    assert trends.get(2030, 1, "respondents") is None